@@ -3,7 +3,9 @@
 import datetime
 import logging
 import re
+import threading
 import urllib.parse
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Tuple
 
 from caldav import DAVClient
@@ -13,25 +15,123 @@ from config import AppConfig, CalDAVCredentials, ColleagueConfig
 logger = logging.getLogger(__name__)
 
 
+class PooledConnection:
+    """Ein DAVClient samt Principal und zwischengespeicherter Kalenderliste."""
+
+    def __init__(self, service: str, client: DAVClient):
+        self.service = service
+        self.client = client
+        self.principal = client.principal()
+        self._calendars: Optional[List] = None
+
+    def calendars(self) -> List:
+        """Kalenderliste des Principals (einmal pro Verbindung abgefragt)."""
+        if self._calendars is None:
+            self._calendars = list(self.principal.calendars())
+        return self._calendars
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class DAVConnectionPool:
+    """Pool wiederverwendbarer CalDAV-Verbindungen pro Service (ard/mm/nas).
+
+    Statt für jeden Kollegen einen neuen DAVClient aufzubauen (TLS-Handshake,
+    Principal-Discovery, Kalenderliste), werden Verbindungen nach Gebrauch
+    zurückgegeben und vom nächsten Kollegen weiterverwendet. Eine Verbindung
+    wird immer nur von einem Thread gleichzeitig benutzt.
+
+    Verwendung:
+        pool = DAVConnectionPool(config)
+        with pool.lease("ard") as conn:
+            calendars = conn.calendars()
+    """
+
+    def __init__(self, app_config: AppConfig, timeout: Optional[float] = None, max_idle: int = 8):
+        self._app_config = app_config
+        # Ohne Timeout hält ein hängender Server den Thread unbegrenzt fest
+        self._timeout = timeout if timeout is not None else app_config.caldav_timeout
+        self._max_idle = max_idle
+        self._idle: Dict[str, List[PooledConnection]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, service: str) -> PooledConnection:
+        """Gibt eine freie Verbindung zurück oder baut eine neue auf.
+
+        Raises:
+            ValueError bei fehlenden Credentials, sonst Verbindungsfehler von caldav.
+        """
+        with self._lock:
+            idle = self._idle.get(service)
+            if idle:
+                return idle.pop()
+        creds = self._app_config.get_caldav_credentials(service)
+        client = DAVClient(
+            creds.base_url, username=creds.username, password=creds.password,
+            timeout=self._timeout,
+        )
+        return PooledConnection(service, client)
+
+    def release(self, conn: PooledConnection, broken: bool = False):
+        """Gibt eine Verbindung zurück; defekte oder überzählige werden geschlossen."""
+        if not broken:
+            with self._lock:
+                idle = self._idle.setdefault(conn.service, [])
+                if len(idle) < self._max_idle:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    @contextmanager
+    def lease(self, service: str):
+        """Kontextmanager um acquire/release; bei Fehlern wird die Verbindung verworfen."""
+        conn = self.acquire(service)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, broken=True)
+            raise
+        self.release(conn)
+
+    def close(self):
+        """Schließt alle freien Verbindungen."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
 class CalendarClient:
     """CalDAV-Kalender-Client mit lokalem Cache für schnelle Duplikatserkennung.
 
     Pro Kollege wird eine eigene Instanz erzeugt. Der Cache wird einmal beim
     Start aus dem Server geladen und danach lokal synchron gehalten.
 
+    Mit ``pool`` wird die Verbindung aus einem DAVConnectionPool geliehen und
+    bei ``close()`` zurückgegeben.
+
     Verwendung:
-        client = CalendarClient(config, colleague_config)
+        client = CalendarClient(config, colleague_config, pool)
         client.connect()
         client.load_cache(start_date, end_date)
         events = client.get_events_on_date(some_date)
         client.add_event(ical_string)
+        client.close()
     """
 
-    def __init__(self, app_config: AppConfig, colleague: ColleagueConfig):
+    def __init__(self, app_config: AppConfig, colleague: ColleagueConfig,
+                 pool: Optional[DAVConnectionPool] = None):
         self._app_config = app_config
         self._colleague = colleague
-        self._dav_client: Optional[DAVClient] = None
+        self._pool = pool
+        self._conn: Optional[PooledConnection] = None
         self._calendar = None
+        self.deleted_count = 0    # erfolgreiche Löschungen (für den Laufbericht)
 
         # Lokaler Cache
         self._events_by_date: Dict[datetime.date, List] = {}
@@ -44,21 +144,14 @@ class CalendarClient:
             True bei Erfolg, False bei Fehler.
         """
         service = self._colleague.service_name
-        try:
-            creds = self._app_config.get_caldav_credentials(service)
-        except ValueError as e:
-            logger.error("Keine Credentials für Service '%s': %s", service, e)
-            return False
+        pool = self._pool or DAVConnectionPool(self._app_config, max_idle=0)
 
         target_name = "Dienstplan " + self._colleague.name.replace(",", "").replace(".", "")
         target_clean = " ".join(target_name.split()).lower()
 
         try:
-            self._dav_client = DAVClient(
-                creds.base_url, username=creds.username, password=creds.password
-            )
-            principal = self._dav_client.principal()
-            calendars = principal.calendars()
+            self._conn = pool.acquire(service)
+            calendars = self._conn.calendars()
 
             for cal in calendars:
                 if not cal.name:
@@ -75,12 +168,30 @@ class CalendarClient:
                     return True
 
             logger.error("Kalender '%s' nicht gefunden auf Server '%s'.", target_name, service)
+            self.close()  # Verbindung ist intakt: zurück an den Pool
             return False
 
+        except ValueError as e:
+            logger.error("Keine Credentials für Service '%s': %s", service, e)
+            return False
         except Exception as e:
             logger.error("CalDAV-Verbindungsfehler für %s: %s", self._colleague.name, e)
+            if self._conn:
+                pool.release(self._conn, broken=True)
+                self._conn = None
             return False
 
+    def close(self):
+        """Gibt die Verbindung an den Pool zurück (bzw. schließt sie ohne Pool)."""
+        if self._conn is None:
+            return
+        if self._pool:
+            self._pool.release(self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+        self._calendar = None
+
     def load_cache(self, start: datetime.datetime, end: datetime.datetime):
         """Lädt alle Events im Zeitraum in den lokalen Cache."""
         if not self._calendar:
@@ -103,6 +214,12 @@ class CalendarClient:
         except Exception as e:
             logger.error("Fehler beim Laden des Caches für %s: %s", self._colleague.name, e)
 
+    def search_events(self, start: datetime.datetime, end: datetime.datetime) -> List:
+        """Sucht Events im Zeitraum direkt auf dem Server (ohne den Cache zu ändern)."""
+        if not self._calendar:
+            return []
+        return list(self._calendar.search(start=start, end=end, event=True, expand=False))
+
     def get_events_on_date(self, check_date: datetime.date) -> List:
         """Gibt Events für ein Datum zurück (aus dem lokalen Cache)."""
         if isinstance(check_date, datetime.datetime):
@@ -140,6 +257,7 @@ class CalendarClient:
             # Zuerst aus Cache entfernen (bevor Server-Löschung Daten verliert)
             self._unindex_event(event)
             event.delete()
+            self.deleted_count += 1
             return True
         except Exception as e:
             logger.error("Fehler beim Löschen eines Events: %s", e)
@@ -148,15 +266,14 @@ class CalendarClient:
     # --- Interne Methoden ---
 
     def _index_event(self, event):
-        """Fügt ein Event in den lokalen Index ein."""
+        """Fügt ein Event in den lokalen Index ein (mehrtägige ganztägige
+        Events unter jedem Tag, den sie abdecken)."""
         try:
             if not hasattr(event, "vobject_instance") or event.vobject_instance is None:
                 if not event.data:
                     return
-            start = event.vobject_instance.vevent.dtstart.value
-            date_key = start.date() if isinstance(start, datetime.datetime) else start
-
-            self._events_by_date.setdefault(date_key, []).append(event)
+            for date_key in _event_days(event):
+                self._events_by_date.setdefault(date_key, []).append(event)
             self._all_events.append(event)
         except Exception as e:
             logger.debug("Konnte Event nicht indexieren: %s", e)
@@ -164,12 +281,9 @@ class CalendarClient:
     def _unindex_event(self, event):
         """Entfernt ein Event aus dem lokalen Index."""
         try:
-            start = event.vobject_instance.vevent.dtstart.value
-            date_key = start.date() if isinstance(start, datetime.datetime) else start
-
-            if date_key in self._events_by_date:
-                day_events = self._events_by_date[date_key]
-                if event in day_events:
+            for date_key in _event_days(event):
+                day_events = self._events_by_date.get(date_key)
+                if day_events and event in day_events:
                     day_events.remove(event)
         except Exception:
             pass  # Falls vobject-Zugriff fehlschlägt
@@ -178,6 +292,29 @@ class CalendarClient:
             self._all_events.remove(event)
 
 
+def _event_days(event) -> List[datetime.date]:
+    """Tage, unter denen ein Event im Cache geführt wird."""
+    day_range = get_all_day_range(event)
+    if day_range is None:
+        start = event.vobject_instance.vevent.dtstart.value
+        return [start.date()]
+    first, last = day_range
+    return [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def get_all_day_range(event) -> Optional[Tuple[datetime.date, datetime.date]]:
+    """Erster und letzter Tag (inklusive) eines ganztägigen Events, sonst None."""
+    vevent = event.vobject_instance.vevent
+    start = vevent.dtstart.value
+    if isinstance(start, datetime.datetime):
+        return None
+    end = vevent.dtend.value if hasattr(vevent, "dtend") else None
+    # DTEND ist bei ganztägigen Events exklusiv
+    if isinstance(end, datetime.date) and not isinstance(end, datetime.datetime) and end > start:
+        return start, end - datetime.timedelta(days=1)
+    return start, start
+
+
 def get_event_details(event) -> Tuple[str, datetime.date, Optional[datetime.datetime], Optional[datetime.datetime]]:
     """Extrahiert Summary, Datum, Start- und Endzeit aus einem CalDAV-Event.
 
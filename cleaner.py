@@ -1,61 +1,337 @@
-"""Alte Kalendereinträge löschen (ersetzt Diensteloeschen.py)."""
+"""Alte Kalendereinträge löschen (ersetzt Diensteloeschen.py).
+
+Zwei Wege:
+
+- ``delete_old_entries`` (``main.py --delete``): ein ganzes Jahr in
+  Monatsfenstern, pro Fenster eine CalDAV-Suche und parallele Löschungen
+  (begrenzt durch ``max_concurrent``, jeder Löscher mit eigener Verbindung
+  aus dem Pool). Abgeschlossene Monate werden pro
+  Kollege in einer Fortschrittsdatei vermerkt, sodass ein abgebrochener Lauf
+  beim nächsten Start dort weitermacht.
+- ``RetentionPruner``: laufende Aufbewahrungsregel im normalen Lauf. Löscht
+  Termine älter als ``retention_months`` in kleinen Portionen über die
+  bereits bestehende Verbindung, begrenzt durch ein Budget pro Lauf.
+"""
 
 import datetime
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from caldav import DAVClient
-
+from calendar_client import CalendarClient, DAVConnectionPool
 from config import AppConfig
+from utils import load_json_state, save_json_state
 
 logger = logging.getLogger(__name__)
 
+PROGRESS_FILENAME = "delete_progress.json"
+RETENTION_STATE_FILENAME = "retention_state.json"
+DEFAULT_CONCURRENCY = 4
+RETENTION_LOOKBACK_MONTHS = 36    # so weit vor der Grenze beginnt die erste Suche
+RETENTION_MAX_WINDOWS = 6         # Monatsfenster pro Kollege und Lauf
+
+
+@dataclass
+class DeleteStats:
+    """Ergebnis des Löschens für einen Kollegen."""
+    user_name: str
+    deleted: int = 0
+    failed: int = 0
+    skipped_months: int = 0
+    seconds: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.deleted / self.seconds if self.seconds > 0 else 0.0
+
+
+class DeleteCheckpoint:
+    """Fortschrittsdatei: welche Monate pro Kollege bereits vollständig gelöscht sind.
+
+    Gilt nur für ein Zieljahr; gehört die Datei zu einem anderen Jahr, wird
+    neu begonnen. Thread-safe, jede Änderung wird sofort gespeichert.
+
+    Verwendung:
+        checkpoint = DeleteCheckpoint("/pfad/delete_progress.json", 2024)
+        if not checkpoint.is_done("Meier, M.", 3):
+            ...
+            checkpoint.mark_done("Meier, M.", 3)
+    """
+
+    def __init__(self, path: str, year: int):
+        self.path = path
+        self.year = year
+        self._lock = threading.Lock()
+        state = load_json_state(path)
+        if state.get("year") == year:
+            self._done: Dict[str, List[int]] = state.get("done", {})
+        else:
+            self._done = {}
+
+    def is_done(self, user_name: str, month: int) -> bool:
+        with self._lock:
+            return month in self._done.get(user_name, [])
 
-def delete_old_entries(app_config: AppConfig, user_name: str, years_back: int = 2):
+    def mark_done(self, user_name: str, month: int):
+        with self._lock:
+            months = self._done.setdefault(user_name, [])
+            if month not in months:
+                months.append(month)
+                months.sort()
+            save_json_state(self.path, {"year": self.year, "done": self._done})
+
+
+def delete_old_entries(
+    app_config: AppConfig,
+    user_name: str,
+    years_back: int = 2,
+    pool: Optional[DAVConnectionPool] = None,
+    checkpoint: Optional[DeleteCheckpoint] = None,
+    max_concurrent: int = DEFAULT_CONCURRENCY,
+) -> DeleteStats:
     """Löscht alle Kalendereinträge eines Kollegen für ein vergangenes Jahr.
 
     Args:
         app_config: Zentrale Konfiguration
         user_name: Name des Kollegen
         years_back: Wie viele Jahre zurück löschen (Standard: 2)
+        pool: Optional geteilter CalDAV-Verbindungspool
+        checkpoint: Optional Fortschrittsdatei; erledigte Monate werden übersprungen
+        max_concurrent: Maximale Anzahl gleichzeitiger Löschungen in diesem Kalender
+            (jede über eine eigene Verbindung aus ``pool``)
+
+    Returns:
+        DeleteStats mit gelöschten/fehlgeschlagenen Terminen und Durchsatz.
     """
     target_year = datetime.datetime.now().year - years_back
     service = "ard"
+    stats = DeleteStats(user_name)
+    started = time.monotonic()
+    own_pool = pool is None
+    pool = pool or DAVConnectionPool(app_config, max_idle=max_concurrent)
+
+    calendar_name = "Dienstplan " + user_name.replace(",", "").replace(".", "")
 
     try:
-        creds = app_config.get_caldav_credentials(service)
+        with pool.lease(service) as conn:
+            try:
+                calendar = conn.principal.calendar(name=calendar_name)
+            except Exception:
+                logger.warning("Kalender '%s' nicht gefunden – überspringe.", calendar_name)
+                return stats
+
+            with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+                for month in range(1, 13):
+                    if checkpoint and checkpoint.is_done(user_name, month):
+                        stats.skipped_months += 1
+                        continue
+                    deleted, failed = _delete_month(
+                        calendar, target_year, month, executor, pool, service, max_concurrent,
+                    )
+                    stats.deleted += deleted
+                    stats.failed += failed
+                    # Monate mit Fehlschlägen beim nächsten Lauf erneut versuchen
+                    if checkpoint and not failed:
+                        checkpoint.mark_done(user_name, month)
+
     except ValueError as e:
         logger.error("Keine Credentials für %s: %s", user_name, e)
-        return
+        return stats
+    except Exception as e:
+        logger.error("Fehler beim Löschen für %s: %s", user_name, e)
+    finally:
+        if own_pool:
+            pool.close()
 
-    calendar_name = "Dienstplan " + user_name.replace(",", "").replace(".", "")
+    stats.seconds = time.monotonic() - started
+    if stats.deleted or stats.failed:
+        logger.info(
+            "%s: %d Termine aus %d gelöscht, %d fehlgeschlagen (%.1f s, %.1f/s).",
+            user_name, stats.deleted, target_year, stats.failed,
+            stats.seconds, stats.per_second,
+        )
+    else:
+        logger.debug("Keine Termine für %s im Jahr %d.", user_name, target_year)
+    return stats
+
+
+def _delete_month(
+    calendar, year: int, month: int, executor: ThreadPoolExecutor,
+    pool: DAVConnectionPool, service: str, workers: int,
+):
+    """Sucht die Termine eines Monats und löscht sie parallel.
 
+    Die Termine werden auf ``workers`` Portionen verteilt; jede Portion
+    leiht sich eine eigene Verbindung, denn eine Verbindung darf nur von
+    einem Thread gleichzeitig benutzt werden.
+
+    Returns:
+        (gelöscht, fehlgeschlagen)
+    """
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    events = calendar.search(start=start, end=end, event=True, expand=False)
+    if not events:
+        return 0, 0
+
+    chunks = [events[i::workers] for i in range(min(workers, len(events)))]
+    results = list(executor.map(lambda chunk: _delete_events(pool, service, chunk), chunks))
+    deleted = sum(d for d, _ in results)
+    return deleted, len(events) - deleted
+
+
+def _delete_events(pool: DAVConnectionPool, service: str, events: List) -> Tuple[int, int]:
+    """Löscht Termine über eine eigene, geliehene Verbindung.
+
+    Returns:
+        (gelöscht, fehlgeschlagen)
+    """
+    deleted = 0
     try:
-        client = DAVClient(creds.base_url, username=creds.username, password=creds.password)
-        principal = client.principal()
+        with pool.lease(service) as conn:
+            for event in events:
+                try:
+                    # An die geliehene Verbindung binden statt an die der Suche
+                    type(event)(client=conn.client, url=event.url).delete()
+                    deleted += 1
+                except Exception as e:
+                    logger.warning("Konnte Event nicht löschen: %s", e)
+    except Exception as e:
+        logger.warning("Keine Verbindung zum Löschen: %s", e)
+    return deleted, len(events) - deleted
+
+
+class RetentionPruner:
+    """Löscht im normalen Lauf Termine, die älter als die Aufbewahrungsfrist sind.
+
+    Pro Kollege wird ein Monatszeiger ("ab hier noch nicht leer") in
+    retention_state.json geführt. Jeder Lauf durchsucht höchstens
+    ``RETENTION_MAX_WINDOWS`` Monatsfenster ab diesem Zeiger bis zur Grenze
+    und löscht, solange das gemeinsame Budget aller Kollegen reicht. Ist der
+    Rückstand abgearbeitet, steht der Zeiger auf der Grenze und erst im
+    nächsten Monat ist wieder eine (kleine) Suche nötig. Kollegen aus
+    deletewhitelist.json werden wie bei ``--delete`` übersprungen. Thread-safe.
+
+    Verwendung:
+        pruner = RetentionPruner.from_config(config)
+        if pruner:
+            pruner.start_run()
+            pruner.prune(client, "Meier, M.")
+    """
 
-        try:
-            calendar = principal.calendar(name=calendar_name)
-        except Exception:
-            logger.warning("Kalender '%s' nicht gefunden – überspringe.", calendar_name)
-            return
+    def __init__(self, state_path: str, months: int, budget: int,
+                 whitelist: Iterable[str] = ()):
+        self.state_path = state_path
+        self.months = months
+        self.budget = budget
+        self.whitelist = frozenset(whitelist)
+        self._budget = budget
+        self._lock = threading.Lock()
+        self._state: Dict[str, str] = load_json_state(state_path)
+        self.deleted = 0
 
-        start_date = datetime.datetime(target_year, 1, 1)
-        end_date = datetime.datetime(target_year, 12, 31, 23, 59, 59)
+    @classmethod
+    def from_config(
+        cls, app_config: AppConfig, state_path: Optional[str] = None,
+    ) -> Optional["RetentionPruner"]:
+        """Erzeugt den Pruner, wenn ``retention_months`` gesetzt ist (sonst None).
 
-        events = calendar.date_search(start=start_date, end=end_date)
-        if not events:
-            logger.debug("Keine Termine für %s im Jahr %d.", user_name, target_year)
-            return
+        Args:
+            state_path: Abweichende Zustandsdatei (z.B. pro Shard)
+        """
+        months = app_config.retention_months
+        if not months:
+            return None
+        return cls(
+            state_path or os.path.join(app_config.base_dir, RETENTION_STATE_FILENAME),
+            months, app_config.retention_budget, app_config.get_delete_whitelist(),
+        )
+
+    def start_run(self):
+        """Setzt Budget und Zähler für einen neuen Lauf zurück (Daemon: pro Zyklus)."""
+        with self._lock:
+            self._budget = self.budget
+            self.deleted = 0
+
+    @property
+    def cutoff(self) -> datetime.date:
+        """Erster Tag des Monats, vor dem Termine gelöscht werden."""
+        return _add_months(datetime.date.today().replace(day=1), -self.months)
+
+    def prune(self, client: CalendarClient, user_name: str) -> int:
+        """Löscht alte Termine eines Kollegen im Rahmen des Restbudgets.
+
+        Returns:
+            Anzahl gelöschter Termine.
+        """
+        if user_name in self.whitelist:
+            return 0
+        cutoff = self.cutoff
+        with self._lock:
+            stored = self._state.get(user_name)
+        window = (
+            datetime.date.fromisoformat(stored) if stored
+            else _add_months(cutoff, -RETENTION_LOOKBACK_MONTHS)
+        )
 
         deleted = 0
-        for event in events:
+        for _ in range(RETENTION_MAX_WINDOWS):
+            if window >= cutoff or not self._has_budget():
+                break
+            window_end = min(_add_months(window, 1), cutoff)
             try:
-                event.delete()
-                deleted += 1
+                events = client.search_events(
+                    datetime.datetime.combine(window, datetime.time.min),
+                    datetime.datetime.combine(window_end, datetime.time.min),
+                )
             except Exception as e:
-                logger.warning("Konnte Event nicht löschen: %s", e)
+                logger.warning("%s: Aufbewahrungs-Suche fehlgeschlagen: %s", user_name, e)
+                break
 
-        logger.info("%d Termine für %s aus %d gelöscht.", deleted, user_name, target_year)
+            complete = True
+            for event in events:
+                if not self._take_budget():
+                    complete = False
+                    break
+                if client.delete_event(event):
+                    deleted += 1
+                else:
+                    complete = False
 
-    except Exception as e:
-        logger.error("Fehler beim Löschen für %s: %s", user_name, e)
+            # Zeiger erst weitersetzen, wenn das Fenster vollständig leer ist
+            if not complete:
+                break
+            window = window_end
+
+        with self._lock:
+            self._state[user_name] = window.isoformat()
+            self.deleted += deleted
+            save_json_state(self.state_path, self._state)
+
+        if deleted:
+            logger.info(
+                "%s: %d Termine vor dem %s gelöscht (Aufbewahrung %d Monate).",
+                user_name, deleted, cutoff.strftime("%d.%m.%Y"), self.months,
+            )
+        return deleted
+
+    def _has_budget(self) -> bool:
+        with self._lock:
+            return self._budget > 0
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self._budget <= 0:
+                return False
+            self._budget -= 1
+            return True
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    """Verschiebt einen Monatsersten um ``months`` Monate."""
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
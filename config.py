@@ -19,6 +19,7 @@ class ColleagueConfig:
     rewrite: bool = False              # -r
     use_nas: bool = False              # -s
     only_shifts: bool = False          # -d
+    merge_absences: bool = False       # -a: aufeinanderfolgende Abwesenheiten zusammenfassen
 
     @classmethod
     def from_json_entry(cls, entry: list) -> "ColleagueConfig":
@@ -33,6 +34,7 @@ class ColleagueConfig:
             rewrite="-r" in flags,
             use_nas="-s" in flags,
             only_shifts="-d" in flags,
+            merge_absences="-a" in flags,
         )
 
     @property
@@ -140,6 +142,44 @@ class AppConfig:
     def server_check_url(self) -> str:
         return self.get_raw("ardbox")
 
+    @property
+    def download_reuse_minutes(self) -> float:
+        """Zeitfenster, in dem ein frischer Download anderer Prozesse wiederverwendet wird."""
+        return float(self._raw.get("download_reuse_minutes", 5))
+
+    @property
+    def retention_months(self) -> Optional[int]:
+        """Termine älter als so viele Monate werden beim normalen Lauf gelöscht (None = aus)."""
+        value = self._raw.get("retention_months")
+        return int(value) if value else None
+
+    @property
+    def retention_budget(self) -> int:
+        """Maximale Anzahl Löschungen durch die Aufbewahrungsregel pro Lauf (alle Kollegen)."""
+        return int(self._raw.get("retention_budget", 200))
+
+    @property
+    def horizon_weeks(self) -> int:
+        """So viele Wochen voraus werden im normalen Lauf verarbeitet."""
+        return int(self._raw.get("horizon_weeks", 13))
+
+    @property
+    def caldav_timeout(self) -> float:
+        """Timeout pro CalDAV-Anfrage in Sekunden."""
+        return float(self._raw.get("caldav_timeout", 30))
+
+    @property
+    def colleague_budget(self) -> Optional[float]:
+        """Zeitbudget pro Kollege und Lauf in Sekunden; der Rest folgt im nächsten Lauf (None = aus, Standard)."""
+        value = self._raw.get("colleague_budget")
+        return float(value) if value else None
+
+    @property
+    def run_deadline(self) -> Optional[float]:
+        """Zeitlimit für die Kalender aller Kollegen eines Laufs in Sekunden (None = aus, Standard)."""
+        value = self._raw.get("run_deadline")
+        return float(value) if value else None
+
     @property
     def smtp_email(self) -> str:
         return self.get_raw("notifymail")
@@ -148,6 +188,28 @@ class AppConfig:
     def smtp_password(self) -> str:
         return self.get_raw("mailpassword")
 
+    @property
+    def smtp_host(self) -> str:
+        return self._raw.get("smtp_host", "smtp.ionos.de")
+
+    @property
+    def smtp_port(self) -> int:
+        return int(self._raw.get("smtp_port", 587))
+
+    @property
+    def smtp_starttls(self) -> bool:
+        """STARTTLS nutzen; Zeichenketten wie "false"/"0"/"nein" schalten es ab."""
+        value = self._raw.get("smtp_starttls", True)
+        if isinstance(value, str):
+            value = value.strip().lower()
+            if value in ("true", "1", "yes", "ja", "on"):
+                return True
+            if value in ("false", "0", "no", "nein", "off", ""):
+                return False
+            logger.warning("Ungültiger Wert für smtp_starttls: %r – nutze STARTTLS.", value)
+            return True
+        return bool(value)
+
     @property
     def kalender_base_url(self) -> str:
         return self.get_raw("kalenderbase")
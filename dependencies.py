@@ -0,0 +1,175 @@
+"""Abhängigkeitsverfolgung: welche Eingaben jeder eingetragene Tag verwendet hat.
+
+Ein Termin hängt nicht nur von seiner Zelle im Dienstplan ab, sondern auch
+vom gültigen Laufzettel (Arbeitsplatz, Pause, Aufgabe), von der
+Feiertagstabelle (Werktags- oder Wochenend-Laufzettel) und von den Optionen
+des Kollegen (z.B. Ort). Pro Kollege und Tag wird festgehalten, mit welchem
+Stand der Tag zuletzt geschrieben wurde (deps_state.json):
+
+- Weichen Laufzettel, Feiertagsstatus oder Optionen ab (``stale_dates``),
+  werden nur die betroffenen Tage neu geschrieben, statt mit ``--force``
+  alle Wochen aller Kollegen.
+- Weicht die Zelle ab (``changed_dates``), hat sich der Dienstplan des
+  Kollegen an diesem Tag geändert; danach richtet sich die Reihenfolge
+  der Verarbeitung.
+"""
+
+import datetime
+import hashlib
+import logging
+import threading
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from config import ColleagueConfig
+from excel_parser import week_overlaps
+from holidays_de import GermanHolidays
+from laufzettel import LaufzettelManager
+from utils import load_json_state, save_json_state
+
+logger = logging.getLogger(__name__)
+
+DEPS_STATE_FILENAME = "deps_state.json"
+_STATE_VERSION = 2
+
+# Optionen, die nichts am Inhalt der Termine ändern
+_FLAGS_IGNORED = ("name", "send_notification", "rewrite")
+
+
+class DependencyTracker:
+    """Merkt sich pro Kollege und Tag die Eingaben des zuletzt geschriebenen Stands.
+
+    Pro Tag ``[Zelle]`` bzw. bei zeitgebundenen Diensten ``[Zelle,
+    Laufzettel-Version, Feiertag ja/nein]`` (Zelle als Hash; leere Zellen
+    werden nicht gespeichert); pro Kollege der Hash der Optionen.
+    Thread-safe; gespeichert wird einmal pro Lauf mit ``save``.
+
+    Verwendung:
+        deps = DependencyTracker("/pfad/deps_state.json")
+        stale = deps.stale_dates(colleague, laufzettel_mgr, holidays)
+        ...
+        deps.record(colleague, entry.date.date(), entry.raw_text, laufzettel_mgr, holidays)
+        deps.save()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        state = load_json_state(path)
+        self._state: Dict[str, dict] = (
+            state.get("colleagues", {}) if state.get("version") == _STATE_VERSION else {}
+        )
+
+    def stale_dates(
+        self,
+        colleague: ColleagueConfig,
+        laufzettel_mgr: LaufzettelManager,
+        holidays: GermanHolidays,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+    ) -> Set[datetime.date]:
+        """Tage, deren Laufzettel, Feiertagsstatus oder Optionen sich geändert haben.
+
+        Args:
+            since: Nur Tage ab diesem Datum (Standard: 1. Januar des laufenden Jahres)
+            until: Nur Tage bis einschließlich diesem Datum (Standard: alle)
+        """
+        since = since or datetime.date(datetime.date.today().year, 1, 1)
+        with self._lock:
+            entry = self._state.get(colleague.name)
+            if not entry:
+                return set()  # Noch nichts geschrieben, nichts veraltet
+            flags_changed = entry.get("flags") != flags_hash(colleague)
+            recorded = list(entry.get("dates", {}).items())
+
+        stale = set()
+        for iso, deps in recorded:
+            day = datetime.date.fromisoformat(iso)
+            if day < since or (until and day > until):
+                continue
+            if flags_changed:
+                stale.add(day)
+            elif len(deps) == 3 and (
+                deps[1] != laufzettel_mgr.version_for_date(day)
+                or deps[2] != holidays.is_holiday_or_weekend(day)[0]
+            ):
+                stale.add(day)
+        return stale
+
+    def changed_dates(self, name: str, cells: Dict[datetime.date, str]) -> Set[datetime.date]:
+        """Tage, deren Zelle sich seit dem letzten Schreiben geändert hat.
+
+        Args:
+            cells: Aktueller Zelleninhalt pro Tag der eingelesenen Wochen
+        """
+        with self._lock:
+            dates = dict(self._state.get(name, {}).get("dates", {}))
+        changed = set()
+        for day, cell in cells.items():
+            deps = dates.get(day.isoformat())
+            if deps is None:
+                if cell.strip():
+                    changed.add(day)
+            elif deps[0] != _short_hash(cell):
+                changed.add(day)
+        return changed
+
+    def record(
+        self,
+        colleague: ColleagueConfig,
+        day: datetime.date,
+        cell: str,
+        laufzettel_mgr: Optional[LaufzettelManager] = None,
+        holidays: Optional[GermanHolidays] = None,
+    ):
+        """Vermerkt die Eingaben, mit denen ``day`` gerade geschrieben wurde.
+
+        Laufzettel und Feiertage nur bei zeitgebundenen Diensten angeben.
+        """
+        if not cell.strip():
+            self.forget(colleague.name, [day])
+            return
+        deps = [_short_hash(cell)]
+        if laufzettel_mgr is not None and holidays is not None:
+            deps += [
+                laufzettel_mgr.version_for_date(day),
+                holidays.is_holiday_or_weekend(day)[0],
+            ]
+        with self._lock:
+            entry = self._state.setdefault(colleague.name, {"dates": {}})
+            entry["flags"] = flags_hash(colleague)
+            entry["dates"][day.isoformat()] = deps
+
+    def forget(self, name: str, days: Iterable[datetime.date]):
+        """Entfernt Tage, an denen nichts mehr eingetragen ist."""
+        with self._lock:
+            dates = self._state.get(name, {}).get("dates", {})
+            for day in days:
+                dates.pop(day.isoformat(), None)
+
+    def save(self):
+        """Speichert den Stand; Tage vor dem laufenden Jahr fallen weg."""
+        cutoff = datetime.date(datetime.date.today().year, 1, 1).isoformat()
+        with self._lock:
+            for entry in self._state.values():
+                entry["dates"] = {
+                    iso: deps for iso, deps in entry.get("dates", {}).items() if iso >= cutoff
+                }
+            save_json_state(self.path, {"version": _STATE_VERSION, "colleagues": self._state})
+
+
+def files_for_dates(files: List[str], dates: Set[datetime.date]) -> List[str]:
+    """Die Excel-Dateien, deren Woche einen der Tage enthält."""
+    if not dates:
+        return []
+    return [f for f in files if any(week_overlaps(f, day, day) for day in dates)]
+
+
+def flags_hash(colleague: ColleagueConfig) -> str:
+    """Hash der Optionen eines Kollegen, die den Inhalt der Termine beeinflussen."""
+    flags = {k: v for k, v in asdict(colleague).items() if k not in _FLAGS_IGNORED}
+    return _short_hash(repr(sorted(flags.items())))
+
+
+def _short_hash(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:10]
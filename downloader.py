@@ -1,17 +1,24 @@
-"""Download-Modul: Lädt Dienstplan-ZIP herunter und entpackt Excel-Dateien."""
+"""Download-Modul: Lädt Dienstplan-ZIP herunter und entpackt Excel-Dateien (oder liest sie direkt aus dem ZIP)."""
 
 import datetime
+import glob
+import io
 import logging
 import os
+import random
 import shutil
 import time
 import zipfile
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Iterable, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from config import AppConfig
+from excel_parser import week_overlaps
+from utils import FileLock, extract_date_from_filename, load_json_state, save_json_state
 
 logger = logging.getLogger(__name__)
 
@@ -24,142 +31,578 @@ class DownloadResult(Enum):
     ERROR = "error"                  # Sonstiger Fehler
 
 
-def download_plans(app_config: AppConfig, folder_path: str, fast: bool = True) -> DownloadResult:
-    """Lädt Dienstpläne herunter und entpackt sie.
+@dataclass
+class DownloadReport:
+    """Ergebnis eines Downloads inkl. der geänderten Archiv-Mitglieder."""
+    result: DownloadResult
+    changed_members: List[str] = field(default_factory=list)  # Neu/geändert seit letztem Aufruf
+    removed_members: List[str] = field(default_factory=list)  # Im Archiv entfallen
+    plans_dir: str = ""                   # Plaene-Ordner (Entpack-Modus)
+    archive_path: Optional[str] = None    # Behaltenes ZIP (für den Archiv-Modus)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.changed_members or self.removed_members)
+
+    @property
+    def changed_files(self) -> List[str]:
+        """Geänderte Dateien als Pfade im Plaene-Ordner."""
+        return [os.path.join(self.plans_dir, m) for m in self.changed_members]
+
+    @property
+    def removed_files(self) -> List[str]:
+        return [os.path.join(self.plans_dir, m) for m in self.removed_members]
+
+    def open_archive(self) -> "PlanArchive":
+        """Öffnet das heruntergeladene ZIP zum direkten Lesen (ohne Entpacken)."""
+        if not self.archive_path:
+            raise FileNotFoundError("Kein Dienstplan-Archiv vorhanden.")
+        return PlanArchive(self.archive_path)
+
+
+class PlanArchive:
+    """Lesezugriff auf die Dienstplan-Excel-Dateien direkt im ZIP.
+
+    Einzelne Mitglieder werden erst beim ``open()`` dekomprimiert und als
+    BytesIO im Speicher geliefert (openpyxl braucht einen seekbaren
+    Datenstrom); auf die Platte wird nichts entpackt.
+
+    Verwendung:
+        with report.open_archive() as archive:
+            for member in archive.members_for_dates({heute, morgen}):
+                wb = load_workbook(archive.open(member), read_only=True)
+    """
+
+    def __init__(self, zip_path: str):
+        self.path = zip_path
+        self._zip: Optional[zipfile.ZipFile] = None
+
+    def __enter__(self):
+        self._zip = zipfile.ZipFile(self.path, "r")
+        return self
+
+    def __exit__(self, *_):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def members(self) -> List[str]:
+        """Alle Dienstplan-Mitglieder, chronologisch nach Datum im Dateinamen."""
+        names = [info.filename for info in self._zip.infolist() if _is_plan_member(info)]
+        return _sort_by_filename_date(names)
+
+    def members_for_dates(self, dates: Iterable[datetime.date]) -> List[str]:
+        """Mitglieder, deren Woche (laut Dateiname) eines der Daten enthält.
+
+        Es werden keine Bytes gelesen; Dateien ohne erkennbares Datum werden
+        vorsichtshalber mitgeliefert.
+        """
+        dates = set(dates)
+        return [
+            name for name in self.members()
+            if any(week_overlaps(name, day, day) for day in dates)
+        ]
+
+    def open(self, member: str) -> io.BytesIO:
+        """Liefert ein Mitglied als In-Memory-Datei (mit ``name``-Attribut)."""
+        buffer = io.BytesIO(self._zip.read(member))
+        buffer.name = member
+        return buffer
+
+
+# Gespeicherte HTTP-Validatoren, letzter Abruf und Stand pro Verbraucher
+_STATE_FILENAME = "download_state.json"
+# Manifest der zuletzt entpackten Archiv-Mitglieder (liegt im Plaene-Ordner)
+_MANIFEST_FILENAME = ".manifest.json"
+_ARCHIVE_FILENAME = "Plaene.zip"
+_LOCK_FILENAME = "Plaene.lock"
+# Versionsordner neben ``Plaene`` (``Plaene.v-<ns>``), auf den der Link zeigt
+_VERSION_INFIX = ".v-"
+_CHUNK_SIZE = 64 * 1024
+
+# Wiederholungen bei Verbindungsfehlern und 5xx-Antworten
+_MAX_ATTEMPTS = 4
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_MAX_SECONDS = 30.0
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+_TIMEOUT = (10, 60)  # (Verbindungsaufbau, Lesen) in Sekunden
+
+
+def create_session() -> requests.Session:
+    """Erzeugt eine Session mit Keep-Alive-Verbindungspool für den Download.
+
+    Wiederholungen übernimmt ``_fetch_archive`` selbst (mit Jitter), daher
+    sind die urllib3-Retries hier abgeschaltet.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def download_plans(
+    app_config: AppConfig,
+    folder_path: str,
+    fast: bool = True,
+    consumer: str = "main",
+    extract: bool = True,
+    session: Optional[requests.Session] = None,
+) -> DownloadReport:
+    """Lädt Dienstpläne herunter und entpackt geänderte Excel-Dateien.
+
+    Der Download ist bedingt (If-None-Match / If-Modified-Since): Antwortet
+    der Server mit 304, wird das vorhandene ``Plaene.zip`` weiterverwendet.
+    Sonst wird das ZIP in Blöcken auf die Platte gestreamt. Beim Entpacken
+    wird ein neuer Versionsordner ``Plaene.v-*`` aufgebaut (unveränderte
+    Dateien per Hardlink übernommen); ``Plaene`` ist ein symbolischer Link
+    darauf und wird mit einem einzigen ``os.replace`` umgehängt, sodass Leser
+    ohne Sperre immer einen vollständigen Stand sehen. Der vorige Stand
+    bleibt bis zum nächsten Tausch erhalten. Stimmt der Ordner
+    bereits mit dem Archiv überein, wird nichts geschrieben.
+
+    Eine separate Erreichbarkeitsprüfung gibt es nicht: Verbindungsfehler
+    des Downloads selbst werden mit exponentiellem Backoff und Jitter
+    wiederholt; erst wenn alle Versuche scheitern, gilt der Server als
+    nicht erreichbar.
+
+    Parallel laufende Prozesse (main.py, GruppeVPA.py) werden über eine
+    Dateisperre serialisiert. Liegt der letzte erfolgreiche Abruf weniger
+    als ``download_reuse_minutes`` zurück, wird gar nicht erst geladen.
+
+    Welche Dateien als geändert gemeldet werden, hängt vom ``consumer`` ab:
+    Jeder Verbraucher bekommt die Änderungen seit seinem eigenen letzten
+    Aufruf, auch wenn ein anderer Prozess den Download erledigt hat.
 
     Args:
         app_config: Zentrale Konfiguration
         folder_path: Basisverzeichnis des Projekts
-        fast: Wenn True, werden nur neue Dateien behalten (ältere gelöscht)
+        fast: Wenn True, werden nur geänderte Dateien geschrieben und gemeldet.
+              Bei False wird immer vollständig heruntergeladen und entpackt.
+        consumer: Name des aufrufenden Verbrauchers (z.B. "main", "vpa")
+        extract: Bei False wird nichts entpackt; die Excel-Dateien werden
+              über ``report.open_archive()`` direkt aus dem ZIP gelesen.
+        session: Optionale wiederverwendbare Session (siehe ``create_session``);
+              ohne wird pro Aufruf eine eigene erzeugt.
 
     Returns:
-        DownloadResult mit dem Ergebnis-Status
+        DownloadReport mit Ergebnis-Status und geänderten Mitgliedern
     """
+    try:
+        with FileLock(os.path.join(folder_path, _LOCK_FILENAME)):
+            _recover_plans_dir(os.path.join(folder_path, "Plaene"))
+            return _download_locked(app_config, folder_path, fast, consumer, extract, session)
+    except TimeoutError as e:
+        logger.error("Download übersprungen: %s", e)
+        return DownloadReport(DownloadResult.ERROR)
+
+
+def _download_locked(
+    app_config: AppConfig, folder_path: str, fast: bool, consumer: str, extract: bool,
+    session: Optional[requests.Session],
+) -> DownloadReport:
+    """Download und Entpacken; darf nur unter der Plaene-Sperre laufen."""
     plaene_dir = os.path.join(folder_path, "Plaene")
-
-    # Letztes Änderungsdatum vor dem Download merken
-    original_latest = _get_latest_xlsx_date(plaene_dir)
-
-    # Server-Erreichbarkeit prüfen
-    if not _check_server(app_config.server_check_url):
-        logger.warning("Server nicht erreichbar. Download nicht möglich.")
-        return DownloadResult.CONNECTION_ERROR
+    state_path = os.path.join(folder_path, _STATE_FILENAME)
+    zip_path = os.path.join(folder_path, _ARCHIVE_FILENAME)
+
+    state = load_json_state(state_path)
+    have_zip = os.path.exists(zip_path)
+    # Validatoren nur nutzen, wenn das zugehörige Archiv noch vorhanden ist
+    validators = state.get("validators", {}) if fast and have_zip else {}
+
+    age_minutes = (time.time() - state.get("checked_at", 0)) / 60
+    if fast and have_zip and age_minutes < app_config.download_reuse_minutes:
+        logger.debug("Letzter Abruf vor %.1f Min. – Download übersprungen.", age_minutes)
+    else:
+        own_session = session is None
+        session = session or create_session()
+        try:
+            # ZIP bedingt anfordern; Verbindungsfehler werden mit Backoff wiederholt
+            new_validators = _fetch_archive(session, app_config.download_url, validators, zip_path)
+            if new_validators is not None:
+                state["validators"] = new_validators
+            state["checked_at"] = time.time()
+
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning("Server nicht erreichbar. Download nicht möglich: %s", e)
+            return DownloadReport(DownloadResult.CONNECTION_ERROR)
+        except requests.RequestException as e:
+            logger.error("Download-Fehler: %s", e)
+            # Vorhandenes Archiv/Plaene-Ordner bleiben nutzbar
+            return DownloadReport(
+                DownloadResult.ERROR,
+                plans_dir=plaene_dir,
+                archive_path=zip_path if have_zip else None,
+            )
+        finally:
+            if own_session:
+                session.close()
 
     try:
-        # Verzeichnis vorbereiten
-        shutil.rmtree(plaene_dir, ignore_errors=True)
-        os.makedirs(plaene_dir, exist_ok=True)
-
-        # ZIP herunterladen
-        zip_path = os.path.join(folder_path, "Plaene.zip")
-        response = requests.get(app_config.download_url, timeout=60)
-        response.raise_for_status()
-
-        with open(zip_path, "wb") as f:
-            f.write(response.content)
-
-        # Entpacken: nur .xlsx, Metadaten beibehalten
-        _extract_xlsx_from_zip(zip_path, plaene_dir)
-
-        # ZIP aufräumen
-        os.remove(zip_path)
-
-        # Test-Dateien löschen
-        _delete_test_files(plaene_dir)
-
-        # Neues Änderungsdatum nach Download
-        new_latest = _get_latest_xlsx_date(plaene_dir)
-
-        # Vergleich
-        has_changes = (original_latest is None or new_latest is None or original_latest != new_latest)
-
-        # Im Fast-Modus: alte Dateien löschen
-        if fast and original_latest and not has_changes:
-            deleted = _delete_old_files(original_latest, plaene_dir)
-            logger.debug("Fast-Modus: %d alte Dateien entfernt (keine Änderungen).", deleted)
-        elif fast and original_latest and has_changes:
-            deleted = _delete_old_files(original_latest, plaene_dir)
-            logger.debug("Fast-Modus: %d alte Dateien entfernt (mit Änderungen).", deleted)
-
-        if has_changes:
-            logger.info("Neue Dienstpläne heruntergeladen.")
-            return DownloadResult.NEW_DATA
-        else:
-            logger.debug("Keine Änderungen festgestellt.")
-            return DownloadResult.NO_CHANGES
-
-    except requests.RequestException as e:
-        logger.error("Download-Fehler: %s", e)
-        return DownloadResult.ERROR
+        manifest = _read_archive_manifest(zip_path)
+        if extract:
+            current = load_json_state(os.path.join(plaene_dir, _MANIFEST_FILENAME))
+            if not fast or current != manifest:
+                _extract_and_swap(zip_path, plaene_dir, current if fast else {})
     except Exception as e:
-        logger.error("Unerwarteter Fehler beim Download: %s", e)
-        return DownloadResult.ERROR
+        logger.error("Unerwarteter Fehler beim Entpacken: %s", e)
+        return DownloadReport(DownloadResult.ERROR)
+
+    # Änderungen gegenüber dem letzten Stand dieses Verbrauchers
+    consumers = state.setdefault("consumers", {})
+    seen = consumers.get(consumer, {}) if fast else {}
+    changed = [name for name, signature in manifest.items() if seen.get(name) != signature]
+    removed = [name for name in seen if name not in manifest]
+    consumers[consumer] = manifest
+    save_json_state(state_path, state)
+
+    report = DownloadReport(
+        result=DownloadResult.NO_CHANGES,
+        changed_members=_sort_by_filename_date(changed),
+        removed_members=sorted(removed),
+        plans_dir=plaene_dir,
+        archive_path=zip_path,
+    )
+    if report.has_changes:
+        report.result = DownloadResult.NEW_DATA
+        logger.info(
+            "Neue Dienstpläne für '%s' (%d geändert, %d entfernt).",
+            consumer, len(changed), len(removed),
+        )
+    else:
+        logger.debug("Keine Änderungen für '%s' festgestellt.", consumer)
+    return report
 
 
 # ---------------------------------------------------------------------------
 # Interne Hilfsfunktionen
 # ---------------------------------------------------------------------------
 
-def _check_server(url: str, timeout: int = 5) -> bool:
-    """Prüft ob der Server erreichbar ist."""
-    try:
-        response = requests.head(url, timeout=timeout)
-        return response.status_code == 200
-    except requests.RequestException:
+def _fetch_archive(
+    session: requests.Session, url: str, validators: dict, zip_path: str,
+) -> Optional[dict]:
+    """Lädt das ZIP bedingt nach zip_path, mit Wiederholungen bei Verbindungsfehlern.
+
+    Returns:
+        Die neuen Validatoren, wenn ein neues Archiv geschrieben wurde,
+        sonst None (304 oder identische Validatoren).
+
+    Raises:
+        requests.RequestException wenn alle Versuche scheitern.
+    """
+    headers = _conditional_headers(validators)
+    for attempt in range(1, _MAX_ATTEMPTS + 1):
+        start = time.perf_counter()
+        try:
+            with session.get(url, headers=headers, timeout=_TIMEOUT, stream=True) as response:
+                if response.status_code in _RETRY_STATUS and attempt < _MAX_ATTEMPTS:
+                    raise _RetryableStatus(response.status_code)
+                if response.status_code == 304:
+                    logger.debug("Server meldet 304 Not Modified (Versuch %d).", attempt)
+                    return None
+                response.raise_for_status()
+
+                new_validators = _validators_from_response(response)
+                # Server ignoriert ggf. bedingte Anfragen, liefert aber identische Validatoren
+                if validators and _same_validators(validators, new_validators):
+                    logger.debug("Validatoren unverändert (Versuch %d).", attempt)
+                    return None
+
+                size = _stream_to_file(response, zip_path)
+        except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as e:
+            if attempt >= _MAX_ATTEMPTS:
+                raise
+            delay = min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            delay += random.uniform(0, _BACKOFF_BASE_SECONDS)
+            logger.info(
+                "Download-Versuch %d/%d fehlgeschlagen (%s) – neuer Versuch in %.1f s.",
+                attempt, _MAX_ATTEMPTS, e, delay,
+            )
+            time.sleep(delay)
+            continue
+
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        logger.info(
+            "Archiv geladen: %.1f KB in %.2f s (%.1f KB/s, %d Versuch(e)).",
+            size / 1024, elapsed, size / 1024 / elapsed, attempt,
+        )
+        return new_validators
+    return None
+
+
+class _RetryableStatus(requests.RequestException):
+    """Vorübergehender HTTP-Status (429/5xx), der wiederholt werden soll."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _conditional_headers(state: dict) -> dict:
+    """Baut die Header für einen bedingten GET aus den gespeicherten Validatoren."""
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    return headers
+
+
+def _validators_from_response(response: requests.Response) -> dict:
+    """Liest ETag, Last-Modified und Content-Length aus einer Antwort."""
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_length": response.headers.get("Content-Length"),
+    }
+
+
+def _same_validators(old: dict, new: dict) -> bool:
+    """Prüft, ob zwei Validator-Sätze dieselbe Datei beschreiben.
+
+    Schwache ETags (W/...) zählen nicht; ohne ETag müssen Last-Modified
+    und Content-Length übereinstimmen.
+    """
+    etag = new.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag == old.get("etag")
+    return bool(
+        new.get("last_modified")
+        and new.get("content_length")
+        and new.get("last_modified") == old.get("last_modified")
+        and new.get("content_length") == old.get("content_length")
+    )
+
+
+def _stream_to_file(response: requests.Response, target_path: str) -> int:
+    """Schreibt den Antwort-Body blockweise in eine Datei (atomar über .part).
+
+    Returns:
+        Anzahl geschriebener Bytes.
+    """
+    part_path = target_path + ".part"
+    size = 0
+    with open(part_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+            if chunk:
+                f.write(chunk)
+                size += len(chunk)
+    os.replace(part_path, target_path)
+    return size
+
+
+def _member_signature(info: zipfile.ZipInfo) -> dict:
+    """Vergleichsmerkmale eines Archiv-Mitglieds für das Manifest."""
+    return {"crc": info.CRC, "size": info.file_size, "date_time": list(info.date_time)}
+
+
+def _is_plan_member(info: zipfile.ZipInfo) -> bool:
+    """Nur echte Dienstplan-Excel-Dateien (keine Test-Dateien, keine Ordner).
+
+    Mitglieder mit absolutem Pfad oder ``..`` werden ignoriert (Zip-Slip).
+    """
+    name = info.filename.replace("\\", "/")
+    if name.startswith("/") or os.path.isabs(name) or ".." in name.split("/"):
+        logger.warning("Archiv-Mitglied mit unzulässigem Pfad ignoriert: %s", info.filename)
         return False
+    base = os.path.basename(name)
+    return base.endswith(".xlsx") and "test" not in base.lower()
 
 
-def _get_latest_xlsx_date(folder_path: str) -> Optional[datetime.datetime]:
-    """Findet das neueste Änderungsdatum aller .xlsx-Dateien."""
-    latest = 0.0
-    if not os.path.exists(folder_path):
-        return None
-    for root, _, files in os.walk(folder_path):
-        for fname in files:
-            if fname.endswith(".xlsx"):
-                mod_time = os.path.getmtime(os.path.join(root, fname))
-                if mod_time > latest:
-                    latest = mod_time
-    return datetime.datetime.fromtimestamp(latest) if latest > 0 else None
+def _member_target(base_dir: str, member: str) -> str:
+    """Zielpfad eines Mitglieds; ValueError, wenn er außerhalb von base_dir läge."""
+    target = os.path.realpath(os.path.join(base_dir, member))
+    if not target.startswith(os.path.realpath(base_dir) + os.sep):
+        raise ValueError(f"Archiv-Mitglied außerhalb des Zielordners: {member}")
+    return target
 
 
-def _extract_xlsx_from_zip(zip_path: str, target_dir: str):
-    """Entpackt .xlsx-Dateien aus einem ZIP-Archiv mit beibehaltenen Zeitstempeln."""
+def _read_archive_manifest(zip_path: str) -> dict:
+    """Liest die Vergleichsmerkmale aller Dienstplan-Mitglieder (nur Verzeichnis, keine Daten)."""
     with zipfile.ZipFile(zip_path, "r") as zf:
-        for info in zf.infolist():
-            if info.filename.endswith(".xlsx"):
-                zf.extract(info, target_dir)
-                extracted = os.path.join(target_dir, info.filename)
-                # Original-Änderungsdatum setzen
-                mod_time = time.mktime(info.date_time + (0, 0, -1))
-                os.utime(extracted, (mod_time, mod_time))
-
-
-def _delete_test_files(folder_path: str):
-    """Löscht Dateien mit 'test' im Namen."""
-    for root, _, files in os.walk(folder_path):
-        for fname in files:
-            if "test" in fname.lower():
-                path = os.path.join(root, fname)
-                try:
-                    os.remove(path)
-                    logger.debug("Test-Datei gelöscht: %s", fname)
-                except OSError as e:
-                    logger.warning("Konnte %s nicht löschen: %s", fname, e)
-
-
-def _delete_old_files(cutoff: datetime.datetime, folder_path: str) -> int:
-    """Löscht .xlsx-Dateien, die älter als cutoff sind. Gibt Anzahl zurück."""
-    deleted = 0
-    cutoff_ts = cutoff.timestamp()
-    for root, _, files in os.walk(folder_path):
-        for fname in files:
-            if fname.endswith(".xlsx"):
-                fpath = os.path.join(root, fname)
-                if os.path.getmtime(fpath) < cutoff_ts:
-                    try:
-                        os.remove(fpath)
-                        deleted += 1
-                    except OSError as e:
-                        logger.warning("Konnte %s nicht löschen: %s", fname, e)
-    return deleted
+        return {
+            info.filename: _member_signature(info)
+            for info in zf.infolist()
+            if _is_plan_member(info)
+        }
+
+
+def _sort_by_filename_date(names: List[str]) -> List[str]:
+    """Sortiert chronologisch nach Datum im Dateinamen; Namen ohne Datum zuletzt."""
+    def key(name):
+        file_date = extract_date_from_filename(os.path.basename(name))
+        return (file_date is None, file_date or datetime.datetime.min, name)
+    return sorted(names, key=key)
+
+
+def _extract_and_swap(zip_path: str, plaene_dir: str, manifest: dict) -> dict:
+    """Entpackt das Archiv in einen Versionsordner und hängt plaene_dir darauf um.
+
+    Mitglieder, deren CRC32/Größe/Datum mit dem Manifest übereinstimmen, werden
+    per Hardlink (Fallback: Kopie) aus dem bisherigen Ordner übernommen, nur
+    geänderte werden neu geschrieben. Dateien, die nicht mehr im Archiv
+    stehen, fallen dadurch automatisch weg.
+
+    Returns:
+        Das neue Manifest.
+    """
+    staging_dir = f"{plaene_dir}{_VERSION_INFIX}{time.time_ns()}"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    new_manifest = {}
+    written = 0
+
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            for info in zf.infolist():
+                if not _is_plan_member(info):
+                    continue
+                signature = _member_signature(info)
+                new_manifest[info.filename] = signature
+                target = _member_target(staging_dir, info.filename)
+                current = os.path.join(plaene_dir, info.filename)
+                if manifest.get(info.filename) == signature and os.path.exists(current):
+                    _link_or_copy(current, target)
+                    continue
+                _extract_member(zf, info, target)
+                written += 1
+
+        save_json_state(os.path.join(staging_dir, _MANIFEST_FILENAME), new_manifest)
+        _swap_directory(staging_dir, plaene_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    logger.debug(
+        "Entpacken: %d geschrieben, %d übernommen.",
+        written, len(new_manifest) - written,
+    )
+    return new_manifest
+
+
+def _link_or_copy(source: str, target: str):
+    """Übernimmt eine unveränderte Datei per Hardlink, sonst per Kopie."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _swap_directory(staging_dir: str, target_dir: str):
+    """Hängt den Link target_dir atomar auf staging_dir um.
+
+    Ein noch echter Ordner (Stand vor der Umstellung) wird einmalig zur
+    Version umbenannt. Ohne symbolische Links (Windows ohne Rechte) wird wie
+    früher per zwei Umbenennungen getauscht.
+    """
+    if os.path.isdir(target_dir) and not os.path.islink(target_dir):
+        os.rename(target_dir, f"{target_dir}{_VERSION_INFIX}0")
+    link_tmp = f"{target_dir}.link-{os.getpid()}"
+    try:
+        if os.path.lexists(link_tmp):
+            os.remove(link_tmp)
+        os.symlink(os.path.basename(staging_dir), link_tmp, target_is_directory=True)
+    except (OSError, NotImplementedError) as e:
+        logger.debug("Symbolischer Link nicht möglich (%s) – tausche per Umbenennung.", e)
+        _rename_swap(staging_dir, target_dir)
+        return
+    os.replace(link_tmp, target_dir)
+    _remove_stale_versions(target_dir)
+
+
+def _rename_swap(staging_dir: str, target_dir: str):
+    """Ersetzt target_dir durch staging_dir (zwei Umbenennungen, kein Kopieren)."""
+    old_dir = f"{target_dir}.old-{os.getpid()}"
+    if os.path.islink(target_dir):
+        os.remove(target_dir)
+    elif os.path.exists(target_dir):
+        os.rename(target_dir, old_dir)
+    os.rename(staging_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    _remove_stale_versions(target_dir)
+
+
+def _remove_stale_versions(target_dir: str):
+    """Löscht alte Versionsordner; nur unter der Plaene-Sperre.
+
+    Behalten werden der aktuelle und der unmittelbar vorige Stand: Leser ohne
+    Sperre (GruppeVPA.py, Watcher) können noch über den alten, bereits
+    aufgelösten Pfad lesen. Der vorige Stand wird erst beim nächsten Tausch
+    gelöscht. Neuere Ordner als der aktuelle sind Reste eines abgebrochenen
+    Entpackens.
+    """
+    current = os.path.realpath(target_dir)
+    versions = sorted(
+        glob.glob(f"{glob.escape(target_dir)}{_VERSION_INFIX}*"), key=_version_number,
+    )
+    current_number = next(
+        (_version_number(p) for p in versions if os.path.realpath(p) == current), None,
+    )
+    older = [
+        p for p in versions
+        if current_number is not None and _version_number(p) < current_number
+    ]
+    keep = {current} | ({os.path.realpath(older[-1])} if older else set())
+    for path in versions:
+        if os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _version_number(path: str) -> int:
+    try:
+        return int(path.rsplit(_VERSION_INFIX, 1)[1])
+    except ValueError:
+        return -1
+
+
+def _recover_plans_dir(plaene_dir: str):
+    """Räumt Reste eines abgebrochenen Entpackens auf; nur unter der Plaene-Sperre.
+
+    Fehlt ``Plaene`` (Absturz zwischen den Umbenennungen des Fallbacks oder
+    älterer Versionen), wird der zurückgebliebene ``Plaene.old-*`` wieder
+    eingesetzt. Halbfertige Versions-, Staging- und Link-Reste werden gelöscht.
+    """
+    escaped = glob.escape(plaene_dir)
+    old_dirs = sorted(glob.glob(f"{escaped}.old-*"), key=os.path.getmtime)
+    if not os.path.exists(plaene_dir) and old_dirs:
+        if os.path.islink(plaene_dir):
+            os.remove(plaene_dir)  # Link auf gelöschte Version
+        logger.warning("Plaene-Ordner fehlt – stelle %s wieder her.", os.path.basename(old_dirs[-1]))
+        os.rename(old_dirs.pop(), plaene_dir)
+    for path in old_dirs + glob.glob(f"{escaped}.tmp-*"):
+        shutil.rmtree(path, ignore_errors=True)
+    for path in glob.glob(f"{escaped}.link-*"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if os.path.exists(plaene_dir):
+        _remove_stale_versions(plaene_dir)
+
+
+def recover_plans_dir(folder_path: str, timeout: float = 5.0):
+    """Aufräumen nach einem Absturz beim Start (ohne Download, z.B. ``--watch``).
+
+    Hält gerade ein anderer Prozess die Sperre, räumt dieser selbst auf.
+    """
+    try:
+        with FileLock(os.path.join(folder_path, _LOCK_FILENAME), timeout=timeout):
+            _recover_plans_dir(os.path.join(folder_path, "Plaene"))
+    except TimeoutError:
+        logger.debug("Plaene-Sperre belegt – Aufräumen übernimmt der Download.")
+    except OSError as e:
+        logger.warning("Aufräumen des Plaene-Ordners fehlgeschlagen: %s", e)
+
+
+def _extract_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, target: str):
+    """Schreibt ein Archiv-Mitglied atomar und übernimmt dessen Zeitstempel."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    part_path = target + ".part"
+    with zf.open(info) as src, open(part_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+    # Original-Änderungsdatum setzen
+    mod_time = time.mktime(info.date_time + (0, 0, -1))
+    os.utime(part_path, (mod_time, mod_time))
+    os.replace(part_path, target)
@@ -3,6 +3,8 @@
 import datetime
 import uuid
 import re
+from dataclasses import dataclass
+from enum import Enum
 from typing import Optional
 
 import pytz
@@ -26,7 +28,8 @@ def build_ical_event(
     Args:
         title: Event-Titel (wird sanitisiert)
         start: Startdatum/-zeit
-        end: Enddatum/-zeit (ignoriert bei all_day)
+        end: Enddatum/-zeit; bei all_day der letzte Tag (inklusive) für
+            mehrtägige Termine, sonst eintägig
         all_day: Ganztägiges Event
         description: Beschreibungstext
         location: Ort (optional)
@@ -43,7 +46,7 @@ def build_ical_event(
 
     if all_day:
         start_str = start.strftime("%Y%m%d")
-        end_date = start + datetime.timedelta(days=1)
+        end_date = (end or start) + datetime.timedelta(days=1)
         end_str = end_date.strftime("%Y%m%d")
         dtstart = f"DTSTART;VALUE=DATE:{start_str}"
         dtend = f"DTEND;VALUE=DATE:{end_str}"
@@ -109,6 +112,36 @@ def build_event_description(
     return ", ".join(parts)
 
 
+class ChangeKind(Enum):
+    """Art eines neu eingetragenen Termins."""
+    SHIFT = "Dienst"          # zeitgebundener Dienst
+    ALL_DAY = "Ganztägig"     # FT, UR, KR, ...
+
+
+@dataclass(frozen=True)
+class ChangeRecord:
+    """Ein neu eingetragener Termin – für Log, Benachrichtigung und Laufbericht."""
+    date: datetime.date
+    title: str
+    kind: ChangeKind
+    start: Optional[datetime.datetime] = None
+    end: Optional[datetime.datetime] = None
+    last_day: Optional[datetime.date] = None   # mehrtägige ganztägige Termine
+
+    @property
+    def log_text(self) -> str:
+        """Format wie ``format_event_log`` ("DD.MM.YYYY, HH:MM bis HH:MM: Titel")."""
+        if self.start is not None:
+            return format_event_log(self.start, self.title, self.end)
+        if self.last_day is not None and self.last_day != self.date:
+            return f"{self.date.strftime('%d.%m.%Y')} bis {self.last_day.strftime('%d.%m.%Y')}: {self.title}"
+        return format_event_log(self.date, self.title)
+
+    @property
+    def is_night_shift(self) -> bool:
+        return self.start is not None and self.start.time() >= datetime.time(20, 0)
+
+
 def format_event_log(start: datetime.datetime, title: str, end: Optional[datetime.datetime] = None) -> str:
     """Erzeugt einen formatierten Logeintrag für einen Termin."""
     if end:
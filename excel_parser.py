@@ -4,9 +4,9 @@ import datetime
 import logging
 import os
 import re
+import threading
 from dataclasses import dataclass
-from itertools import chain
-from typing import List, Optional, Tuple
+from typing import IO, Dict, List, Optional, Tuple, Union
 
 from openpyxl import load_workbook
 
@@ -18,6 +18,8 @@ logger = logging.getLogger(__name__)
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl.reader.drawings")
 
+DEFAULT_HORIZON_WEEKS = 13
+
 
 @dataclass
 class ShiftEntry:
@@ -34,39 +36,194 @@ class ShiftEntry:
         return not self.is_timed
 
 
-def parse_excel_file(file_path: str, user_name: str) -> Tuple[List[ShiftEntry], bool]:
+@dataclass
+class RosterSheet:
+    """Eine einmal eingelesene Dienstplan-Datei (alle Zeilen als Werte-Tupel)."""
+    source: str                       # Pfad bzw. Name für Logs
+    rows: List[tuple]
+    identifier_index: Optional[int]   # Index der Datumszeile in rows
+    dates: List[Optional[datetime.datetime]]
+
+    @property
+    def identifier_row(self) -> Optional[tuple]:
+        if self.identifier_index is None:
+            return None
+        return self.rows[self.identifier_index]
+
+
+@dataclass(frozen=True)
+class Horizon:
+    """Verarbeitungsfenster [since, until] (beide inklusive).
+
+    Begrenzt, welche Wochen eingelesen und welcher Zeitraum aus dem
+    Kalender geladen wird. Standard: gestern bis ``weeks`` Wochen voraus;
+    vergangene Wochen lassen sich mit einem früheren ``since`` gezielt
+    nachziehen.
+    """
+    since: datetime.date
+    until: datetime.date
+
+    @classmethod
+    def default(cls, weeks: int = DEFAULT_HORIZON_WEEKS,
+                today: Optional[datetime.date] = None) -> "Horizon":
+        today = today or datetime.date.today()
+        return cls(today - datetime.timedelta(days=1), today + datetime.timedelta(weeks=weeks))
+
+    def covers_file(self, file_path: str) -> bool:
+        """Prüft anhand des Dateinamens, ob die Woche das Fenster berührt."""
+        return week_overlaps(file_path, self.since, self.until)
+
+
+def week_overlaps(
+    file_path: str,
+    first: Optional[datetime.date] = None,
+    last: Optional[datetime.date] = None,
+) -> bool:
+    """Prüft anhand des Dateinamens, ob die Woche den Zeitraum [first, last] berührt.
+
+    Fehlende Grenzen (None) gelten als offen; Dateien ohne erkennbares Datum
+    werden vorsichtshalber mitgenommen. Für einzelne Tage: ``first=last=tag``.
+    """
+    week_start = extract_date_from_filename(os.path.basename(file_path))
+    if week_start is None:
+        return True
+    week_first = week_start.date()
+    week_last = week_first + datetime.timedelta(days=6)
+    return (last is None or week_first <= last) and (first is None or week_last >= first)
+
+
+class Roster:
+    """Geteilter Cache eingelesener Dienstplan-Dateien.
+
+    Jede Datei wird beim ersten Zugriff genau einmal mit openpyxl geladen,
+    auch wenn mehrere Kollegen-Threads sie gleichzeitig anfordern. Danach
+    arbeiten alle Verbraucher (Kollegen, Gruppenkalender) auf denselben,
+    unveränderlichen Zeilen. Ändert sich eine Datei auf der Platte (Größe
+    oder Änderungszeit), wird sie beim nächsten Zugriff neu gelesen; so kann
+    ein langlebiger Prozess den Cache über viele Läufe behalten; entfallene
+    oder aus dem Horizont gerutschte Wochen werfen ``invalidate`` und
+    ``prune`` hinaus.
+
+    Verwendung:
+        roster = Roster()
+        entries, found = parse_excel_file(path, "Meier, M.", roster=roster)
+        roster.prune(Horizon.default())
+    """
+
+    def __init__(self):
+        self._sheets: Dict[str, Tuple[Optional[tuple], Optional[RosterSheet]]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def sheet(self, file_path: str) -> Optional[RosterSheet]:
+        """Gibt die eingelesene Datei zurück (None wenn nicht lesbar)."""
+        key = os.path.normpath(file_path)
+        stamp = _file_stamp(file_path)
+        cached = self._sheets.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            cached = self._sheets.get(key)
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, load_roster_sheet(file_path))
+                self._sheets[key] = cached
+        return cached[1]
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """Verwirft eine (oder ohne Argument alle) eingelesenen Dateien."""
+        with self._guard:
+            if file_path is None:
+                self._sheets.clear()
+                self._locks.clear()
+            else:
+                key = os.path.normpath(file_path)
+                self._sheets.pop(key, None)
+                self._locks.pop(key, None)
+
+    def prune(self, horizon: Horizon) -> int:
+        """Verwirft Dateien, die nicht mehr existieren oder außerhalb von ``horizon`` liegen.
+
+        Returns:
+            Anzahl der verworfenen Dateien.
+        """
+        with self._guard:
+            stale = [
+                key for key in self._sheets
+                if not horizon.covers_file(key) or not os.path.exists(key)
+            ]
+            for key in stale:
+                self._sheets.pop(key, None)
+                self._locks.pop(key, None)
+        if stale:
+            logger.debug("Roster: %d Dateien verworfen.", len(stale))
+        return len(stale)
+
+
+def _file_stamp(file_path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_roster_sheet(file_path: Union[str, IO[bytes]]) -> Optional[RosterSheet]:
+    """Liest eine Excel-Datei vollständig ein (read-only, nur Werte)."""
+    name = source_name(file_path)
+    try:
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+    except Exception as e:
+        logger.error("Kann %s nicht öffnen: %s", name, e)
+        return None
+
+    try:
+        rows = list(wb.active.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+    # Identifikationszeile finden (enthält Wochen-Nummern wie "40  I  41")
+    identifier_index = _find_identifier_index(rows)
+    if identifier_index is None:
+        logger.error("Keine Datumszeile in %s gefunden.", name)
+        return RosterSheet(source=name, rows=rows, identifier_index=None, dates=[])
+
+    dates = _extract_week_dates(rows[identifier_index])
+    return RosterSheet(source=name, rows=rows, identifier_index=identifier_index, dates=dates)
+
+
+def parse_excel_file(
+    file_path: Union[str, IO[bytes]], user_name: str, roster: Optional[Roster] = None,
+) -> Tuple[List[ShiftEntry], bool]:
     """Parst eine einzelne Excel-Datei und extrahiert Dienste für einen Benutzer.
 
     Args:
-        file_path: Pfad zur .xlsx-Datei
+        file_path: Pfad zur .xlsx-Datei oder geöffnete Datei (z.B. aus
+            ``PlanArchive.open()``)
         user_name: Name des Benutzers (wie in colleagues.json, z.B. "Meier, M.")
+        roster: Optionaler geteilter Cache; dann wird jede Datei nur einmal
+            für alle Kollegen gelesen (nur mit Pfaden).
 
     Returns:
         (liste_von_shift_entries, user_found)
         user_found=False bedeutet: Benutzer nicht im Plan → ggf. FT/Löschen
     """
-    try:
-        wb = load_workbook(file_path, data_only=True)
-    except Exception as e:
-        logger.error("Kann %s nicht öffnen: %s", os.path.basename(file_path), e)
+    if roster is not None and isinstance(file_path, str):
+        sheet = roster.sheet(file_path)
+    else:
+        sheet = load_roster_sheet(file_path)
+    if sheet is None or sheet.identifier_index is None:
         return [], False
+    return parse_sheet(sheet, user_name)
 
-    ws = wb.active
-    rows = list(ws.iter_rows(values_only=True))
 
-    # 1. Identifikationszeile finden (enthält Wochen-Nummern wie "40  I  41")
-    identifier_row = _find_identifier_row(rows)
-    if identifier_row is None:
-        logger.error(
-            "Keine Datumszeile in %s gefunden.", os.path.basename(file_path)
-        )
-        return [], False
+def parse_sheet(sheet: RosterSheet, user_name: str) -> Tuple[List[ShiftEntry], bool]:
+    """Extrahiert die Dienste eines Benutzers aus einer eingelesenen Datei."""
+    dates = sheet.dates
 
-    # 2. Benutzer-Zeile suchen
-    user_row = _find_user_row(rows, user_name)
-
-    # 3. Datumsspalten extrahieren (Index 1-7 = Mo-So)
-    dates = _extract_week_dates(identifier_row)
+    # Benutzer-Zeile suchen
+    user_row = _find_user_row(sheet.rows, user_name)
 
     if user_row is None:
         # Benutzer nicht gefunden → Daten für die Woche zurückgeben mit FT
@@ -76,13 +233,13 @@ def parse_excel_file(file_path: str, user_name: str) -> Tuple[List[ShiftEntry],
                 entries.append(ShiftEntry(date=date_val, raw_text="FT"))
         return entries, False
 
-    # 4. Dienste der Benutzer-Zeile extrahieren
+    # Dienste der Benutzer-Zeile extrahieren (Index 1-7 = Mo-So)
     entries = []
     for i, date_val in enumerate(dates):
         if date_val is None:
             continue
 
-        cell_value = user_row[i + 1]  # +1 weil Index 0 = Name-Spalte
+        cell_value = user_row[i + 1] if i + 1 < len(user_row) else None  # +1 weil Index 0 = Name-Spalte
         raw_text = _clean_cell_value(cell_value)
 
         entry = _parse_shift_entry(raw_text, date_val)
@@ -91,11 +248,12 @@ def parse_excel_file(file_path: str, user_name: str) -> Tuple[List[ShiftEntry],
     return entries, True
 
 
-def get_sorted_excel_files(folder_path: str) -> List[str]:
+def get_sorted_excel_files(folder_path: str, horizon: Optional[Horizon] = None) -> List[str]:
     """Findet alle .xlsx-Dateien im Ordner und sortiert sie nach Datum im Dateinamen.
 
     Dateien mit erkennbarem Datum kommen zuerst (chronologisch),
-    dann Dateien ohne erkennbares Datum.
+    dann Dateien ohne erkennbares Datum. Mit ``horizon`` nur die Wochen
+    im Fenster (ohne die Dateien zu öffnen).
     """
     xlsx_files = []
     for root, _, files in os.walk(folder_path):
@@ -113,21 +271,30 @@ def get_sorted_excel_files(folder_path: str) -> List[str]:
             without_date.append(fpath)
 
     with_date.sort(key=lambda x: x[1])
-    return [f for f, _ in with_date] + without_date
+    files = [f for f, _ in with_date] + without_date
+    if horizon is not None:
+        files = [f for f in files if horizon.covers_file(f)]
+    return files
+
+
+def source_name(source: Union[str, IO[bytes]]) -> str:
+    """Anzeigename einer Excel-Quelle (Pfad oder Datei-Objekt) für Logs."""
+    name = source if isinstance(source, str) else getattr(source, "name", repr(source))
+    return os.path.basename(str(name))
 
 
 # ---------------------------------------------------------------------------
 # Interne Hilfsfunktionen
 # ---------------------------------------------------------------------------
 
-def _find_identifier_row(rows) -> Optional[tuple]:
-    """Findet die Zeile mit den Kalenderwochen (z.B. '40  I  41')."""
+def _find_identifier_index(rows) -> Optional[int]:
+    """Findet den Index der Zeile mit den Kalenderwochen (z.B. '40  I  41')."""
     pattern = re.compile(r"^\d+\s*I\s*\d+$")
-    for row in rows:
-        if row[0] and isinstance(row[0], str):
+    for index, row in enumerate(rows):
+        if row and row[0] and isinstance(row[0], str):
             cleaned = row[0].strip()
             if pattern.match(cleaned):
-                return row
+                return index
     return None
 
 
@@ -138,7 +305,7 @@ def _find_user_row(rows, user_name: str) -> Optional[tuple]:
     target_short = _clean_excel_name(re.sub(r",\s*[A-Z]\.?$", "", user_name).strip())
 
     for row in rows:
-        cell_val = row[0]
+        cell_val = row[0] if row else None
         if not cell_val:
             continue
 
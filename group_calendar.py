@@ -0,0 +1,607 @@
+"""Gruppenkalender VPA – gemeinsame Logik.
+
+Leitet aus dem Dienstplan die Soll-Termine aller Personen mit einer Schicht
+aus vpa.json ab und gleicht sie mit dem Gruppenkalender 'Dienstplan VPA' ab.
+Wird vom eigenständigen Skript GruppeVPA.py und als optionale Stufe von
+main.py (``--vpa``) genutzt; dort auf den bereits eingelesenen Dateien,
+dem Laufzettel und dem Verbindungspool der Hauptverarbeitung.
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import pytz
+from caldav import DAVClient
+from openpyxl import load_workbook
+
+from config import AppConfig
+from event_builder import build_ical_event
+from excel_parser import RosterSheet, source_name
+from holidays_de import GermanHolidays
+from laufzettel import LaufzettelManager
+from utils import Deadline, DeadlineExceeded, Timer
+
+logger = logging.getLogger(__name__)
+
+TZ_BERLIN = pytz.timezone("Europe/Berlin")
+GROUP_CALENDAR_NAME = "Dienstplan VPA"
+
+# Kompilierte Regex-Patterns (einmal erstellt, überall wiederverwendet)
+RE_DOT_TO_COLON = re.compile(r"(\b\d{2})\.(\d{2}\b)")
+RE_TIME_RANGE = re.compile(r"^\d{2}:\d{2}\s*-\s*\d{2}:\d{2}\s*")
+RE_CLEANUP = re.compile(r"\s*\(WT\)|\s*Info |\s+")
+RE_TIME_SPACING = re.compile(r"(\b\d{2}:\d{2})\s*-\s*(\d{2}:\d{2}\b)")
+RE_NAME_BRACKETS = re.compile(r"\s*[\r\n]*\(.*\)\s*[\r\n]*")
+RE_IDENTIFIER = re.compile(r"^\d+\s*I\s*\d+$")
+
+# Zeitlimits: pro CalDAV-Anfrage und für den gesamten Lauf (Sekunden)
+REQUEST_TIMEOUT = 30
+RUN_DEADLINE = 600
+DEFAULT_WORKERS = 4
+DEFAULT_DAYS = 2          # heute + morgen
+PRUNE_DAYS_BACK = 4       # so weit zurück werden alte Termine aufgeräumt
+
+
+def load_schichten(folder_path: str) -> Set[str]:
+    """Lädt die erlaubten Schichten aus vpa.json (als Menge für schnelle Prüfung)."""
+    vpa_path = os.path.join(folder_path, "vpa.json")
+    try:
+        with open(vpa_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        schichten = data.get("schichten", [])
+        # Flatten: Liste von Listen → flache Menge
+        return {item for sublist in schichten for item in sublist}
+    except Exception as e:
+        logger.error("Fehler beim Laden von vpa.json: %s", e)
+        return set()
+
+
+def connect_group_calendar(app_config: AppConfig, timeout: float = REQUEST_TIMEOUT) -> object:
+    """Verbindet zum Gruppenkalender 'Dienstplan VPA' (eigene Verbindung).
+
+    Args:
+        timeout: Timeout pro HTTP-Anfrage in Sekunden
+
+    Returns:
+        caldav.Calendar-Objekt oder None bei Fehler.
+    """
+    service = "ard"
+    try:
+        creds = app_config.get_caldav_credentials(service)
+    except ValueError as e:
+        logger.error("Keine Credentials für Service '%s': %s", service, e)
+        return None
+
+    try:
+        client = DAVClient(
+            creds.base_url, username=creds.username, password=creds.password, timeout=timeout,
+        )
+        return find_group_calendar(client.principal())
+    except Exception as e:
+        logger.error("CalDAV-Verbindungsfehler: %s", e)
+        return None
+
+
+def find_group_calendar(principal) -> object:
+    """Sucht den Gruppenkalender beim Principal (z.B. aus dem Verbindungspool)."""
+    calendar = principal.calendar(name=GROUP_CALENDAR_NAME)
+    if calendar:
+        return calendar
+    logger.error("Kalender '%s' nicht gefunden.", GROUP_CALENDAR_NAME)
+    return None
+
+
+def match_workplace(shift_name: str, start_time: str, end_time: str,
+                    shift_infos: list) -> Optional[str]:
+    """Findet den Arbeitsplatz aus dem Laufzettel für eine Schicht.
+
+    Nutzt die ShiftInfo-Objekte aus dem LaufzettelManager.
+    """
+    cleaned = RE_CLEANUP.sub("", shift_name)
+
+    for info in shift_infos:
+        dienstname = (
+            info.dienstname
+            .replace("Samstag: ", "")
+            .replace("Sonntag: ", "")
+            .replace(" ", "")
+            .strip()
+        )
+
+        if cleaned.lower() not in dienstname.lower():
+            continue
+
+        time_match = re.match(r"(\d{4})\s*-\s*(\d{4})", info.dienstzeit)
+        if not time_match:
+            continue
+
+        html_start = f"{time_match.group(1)[:2]}:{time_match.group(1)[2:]}"
+        html_end = f"{time_match.group(2)[:2]}:{time_match.group(2)[2:]}"
+
+        if html_start == start_time and html_end == end_time:
+            workplace = info.arbeitsplatz
+            # Sonderbehandlungen
+            if cleaned == "IngSchni" and workplace:
+                workplace = workplace.split()[-1]
+            if workplace == "Cut6 / Box2":
+                workplace = "Cut6"
+            return workplace
+
+    return None
+
+
+@dataclass
+class GroupShift:
+    """Ein Soll-Termin im Gruppenkalender (aus dem Dienstplan abgeleitet)."""
+    person: str
+    work_date: date
+    title: str
+    start: datetime.datetime
+    end: datetime.datetime
+    shift_name: str
+    workplace: Optional[str]
+
+    @property
+    def log_text(self) -> str:
+        return (
+            f"{self.start.strftime('%d.%m.%Y')}, "
+            f"{self.start.strftime('%H:%M')} bis {self.end.strftime('%H:%M')}: "
+            f"{self.title}, {self.workplace}"
+        )
+
+
+@dataclass
+class IndexedEvent:
+    """Ein vorhandener Termin im Gruppenkalender, einmal geparst."""
+    event: object
+    summary: str
+    start: datetime.datetime
+    end: Optional[datetime.datetime]
+
+
+class GroupCalendarIndex:
+    """In-Memory-Index des Gruppenkalenders für ein Zeitfenster.
+
+    Lädt alle Termine des Fensters mit einer einzigen CalDAV-Suche und
+    beantwortet danach Anfragen nach (Person, Tag) lokal. Änderungen über
+    ``add``/``remove`` halten den Index synchron.
+
+    Verwendung:
+        index = GroupCalendarIndex(calendar)
+        index.load(heute, heute + timedelta(days=2))
+        vorhandene = index.events_for("Meier, Markus", heute)
+    """
+
+    def __init__(self, calendar):
+        self._calendar = calendar
+        self._by_date: Dict[date, List[IndexedEvent]] = {}
+
+    def load(self, start: date, end: date) -> int:
+        """Lädt alle Termine im Zeitraum [start, end). Gibt die Anzahl zurück."""
+        self._by_date.clear()
+        events = self._calendar.search(start=start, end=end, event=True, expand=False)
+        for event in events:
+            try:
+                if not event.data:
+                    event.load()
+                self._insert(_to_indexed(event))
+            except Exception as e:
+                logger.debug("Konnte Termin nicht indexieren: %s", e)
+        count = sum(len(v) for v in self._by_date.values())
+        logger.debug("%d Termine im Gruppenkalender geladen.", count)
+        return count
+
+    def events_before(self, day: date) -> List[IndexedEvent]:
+        """Alle geladenen Termine, die vor ``day`` beginnen."""
+        return [e for d, events in self._by_date.items() if d < day for e in events]
+
+    def events_for(self, person: str, day: date) -> List[IndexedEvent]:
+        """Termine einer Person an einem Tag (Titel beginnt mit "Name, ")."""
+        prefix = f"{person},"
+        return [e for e in self._by_date.get(day, []) if e.summary.startswith(prefix)]
+
+    def add(self, event):
+        self._insert(_to_indexed(event))
+
+    def remove(self, indexed: IndexedEvent):
+        day_events = self._by_date.get(indexed.start.date(), [])
+        if indexed in day_events:
+            day_events.remove(indexed)
+
+    def _insert(self, indexed: IndexedEvent):
+        self._by_date.setdefault(indexed.start.date(), []).append(indexed)
+
+
+def _to_indexed(event) -> IndexedEvent:
+    """Liest Titel/Start/Ende eines CalDAV-Events und normalisiert die Zeitzone."""
+    vevent = event.vobject_instance.vevent
+    summary = vevent.summary.value.strip() if hasattr(vevent, "summary") else ""
+    event_start = vevent.dtstart.value
+    event_end = vevent.dtend.value if hasattr(vevent, "dtend") else None
+    return IndexedEvent(event, summary, _normalize_dt(event_start), _normalize_dt(event_end))
+
+
+def _normalize_dt(value):
+    """Datum → Datetime um Mitternacht, naive Zeiten → Europe/Berlin."""
+    if value is None:
+        return None
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time.min)
+    if value.tzinfo is None:
+        value = TZ_BERLIN.localize(value)
+    return value
+
+
+def plan_timed_event(
+    service_entry: str, work_date: date,
+    name_without_brackets: str, laufzettel_mgr: LaufzettelManager,
+    holidays: GermanHolidays,
+) -> Optional[GroupShift]:
+    """Leitet aus einem zeitgebundenen Dienst den Soll-Termin ab (ohne Netzwerk)."""
+    time_match = re.match(r"(\d{2}:\d{2})\s*-\s*(\d{2}:\d{2})", service_entry)
+    if not time_match:
+        return None
+
+    start_time_str = time_match.group(1)
+    end_time_str = time_match.group(2)
+
+    start_dt = datetime.datetime.strptime(
+        f"{work_date.strftime('%Y-%m-%d')} {start_time_str}", "%Y-%m-%d %H:%M"
+    )
+    end_dt = datetime.datetime.strptime(
+        f"{work_date.strftime('%Y-%m-%d')} {end_time_str}", "%Y-%m-%d %H:%M"
+    )
+
+    start_dt = TZ_BERLIN.localize(start_dt)
+    end_dt = TZ_BERLIN.localize(end_dt)
+    if end_dt < start_dt:
+        end_dt += timedelta(days=1)
+
+    # Titel zusammenbauen
+    title = service_entry[time_match.end():].strip()
+    title_cleaned = RE_CLEANUP.sub("", title)
+
+    if title_cleaned == "Supervisor" and start_dt.hour == 9 and start_dt.minute == 30:
+        full_title = f"{name_without_brackets}, {title} Büro"
+    else:
+        full_title = f"{name_without_brackets}, {title}"
+
+    # Arbeitsplatz aus Laufzettel
+    is_holiday, _ = holidays.is_holiday_or_weekend(work_date)
+    werktags, wochenende = laufzettel_mgr.get_for_date(work_date)
+    shift_infos = wochenende if is_holiday else werktags
+
+    return GroupShift(
+        person=name_without_brackets,
+        work_date=work_date,
+        title=full_title.replace("\n", " ").replace("\r", "").strip(),
+        start=start_dt,
+        end=end_dt,
+        shift_name=title_cleaned,
+        workplace=match_workplace(title, start_time_str, end_time_str, shift_infos),
+    )
+
+
+def sync_group_calendar(
+    calendar, index: GroupCalendarIndex, shifts: List[GroupShift], rewrite: bool,
+    deadline: Deadline, workers: int = DEFAULT_WORKERS, prune_before: Optional[date] = None,
+) -> List[str]:
+    """Gleicht die Soll-Termine mit dem Index ab und schreibt nur Unterschiede.
+
+    Pro (Person, Tag) bleiben exakt passende Termine stehen, fehlende werden
+    angelegt und abweichende gelöscht. Im Rewrite-Modus wird alles für
+    (Person, Tag) gelöscht und neu angelegt. Ist ``prune_before`` gesetzt,
+    werden im selben Durchgang alle geladenen Termine vor diesem Tag gelöscht.
+
+    Alle Löschungen und Neuanlagen werden zuerst geplant und dann gemeinsam
+    in einem Worker-Pool ausgeführt (CalDAV kennt keine Sammel-Anfragen);
+    jeder Zugriff prüft vor dem Start die Deadline.
+
+    Returns:
+        Log-Texte der neu eingetragenen Termine.
+
+    Raises:
+        DeadlineExceeded wenn die Deadline vor Abschluss aller Schreibzugriffe abläuft.
+    """
+    grouped: Dict[Tuple[str, date], List[GroupShift]] = {}
+    for shift in shifts:
+        grouped.setdefault((shift.person, shift.work_date), []).append(shift)
+
+    to_delete: List[IndexedEvent] = []
+    to_create: List[GroupShift] = []
+    for (person, day), wanted in grouped.items():
+        existing = index.events_for(person, day)
+        for shift in wanted:
+            match = None if rewrite else next(
+                (e for e in existing
+                 if e.summary == shift.title and e.start == shift.start and e.end == shift.end),
+                None,
+            )
+            if match:
+                existing.remove(match)
+            else:
+                to_create.append(shift)
+
+        # Übrige Termine derselben Person am selben Tag → löschen
+        for stale in existing:
+            if not rewrite:
+                logger.debug(
+                    "Lösche '%s' am %s, weil ungleich dem Dienstplan.",
+                    stale.summary, day.strftime("%d.%m.%Y"),
+                )
+            to_delete.append(stale)
+
+    if prune_before is not None:
+        past = index.events_before(prune_before)
+        if past:
+            logger.debug("%d alte Termine vor dem %s werden gelöscht.",
+                         len(past), prune_before.strftime("%d.%m.%Y"))
+        to_delete.extend(past)
+
+    if not to_delete and not to_create:
+        return []
+
+    def delete(stale: IndexedEvent):
+        deadline.check("Löschen")
+        stale.event.delete()
+        return stale
+
+    def create(shift: GroupShift):
+        deadline.check("Eintragen")
+        return calendar.add_event(_build_group_ical(shift))
+
+    new_entries = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(delete, e): ("Löschen", e) for e in to_delete}
+        futures.update({executor.submit(create, sh): ("Eintragen", sh) for sh in to_create})
+        try:
+            # Index nur im Haupt-Thread anpassen
+            for future in as_completed(futures, timeout=deadline.remaining()):
+                step, item = futures[future]
+                try:
+                    result = future.result()
+                except DeadlineExceeded:
+                    continue
+                except Exception as e:
+                    label = item.summary if step == "Löschen" else item.title
+                    logger.error("Fehler beim %s von '%s': %s", step, label, e)
+                    continue
+                if step == "Löschen":
+                    index.remove(result)
+                else:
+                    index.add(result)
+                    logger.debug("[Dienst] %s", item.log_text)
+                    new_entries.append(item.log_text)
+        except FuturesTimeout:
+            pass
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    pending = [futures[f][0] for f in futures if not f.done() or f.cancelled()
+               or isinstance(f.exception(), DeadlineExceeded)]
+    if pending:
+        logger.error(
+            "%d Schreibzugriffe nicht ausgeführt (Deadline): %d× Löschen, %d× Eintragen.",
+            len(pending), pending.count("Löschen"), pending.count("Eintragen"),
+        )
+        raise DeadlineExceeded(pending[0], deadline.label)
+
+    return new_entries
+
+
+def _build_group_ical(shift: GroupShift) -> str:
+    """Erzeugt den iCal-String eines Gruppenkalender-Termins."""
+    description = f"Dienst: {shift.shift_name} von {shift.person}, "
+    if shift.workplace:
+        description += f"Platz: {shift.workplace}, "
+    else:
+        description += "Platz: none, "
+    description += "Alle Angaben und Inhalte sind ohne Gewähr. "
+    description += f"Änderungsdatum: {datetime.datetime.now().strftime('%d.%m.%Y, %H:%M')}"
+
+    return build_ical_event(
+        title=shift.title,
+        start=shift.start,
+        end=shift.end,
+        description=description,
+    )
+
+
+def process_excel_file(
+    file_path, target_dates: Set[date], schichten: Set[str],
+    laufzettel_mgr: LaufzettelManager, holidays: GermanHolidays,
+) -> List[GroupShift]:
+    """Verarbeitet eine Excel-Datei für den Gruppenkalender.
+
+    Liest das Blatt in einem einzigen zeilenweisen Durchlauf (read-only):
+    Zuerst die Identifikationszeile mit den Daten der Woche; enthält sie
+    keines der Zieldaten, wird die Datei sofort geschlossen. Sonst werden
+    die relevanten Tagesspalten aller folgenden Zeilen in einem Durchgang
+    ausgewertet.
+
+    ``file_path`` darf ein Pfad oder ein Datei-Objekt (Archiv-Modus) sein.
+
+    Returns:
+        Liste der Soll-Termine (geschrieben wird in ``sync_group_calendar``).
+    """
+    try:
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        ws = wb.active
+    except Exception as e:
+        logger.error("Fehler beim Laden von %s: %s", source_name(file_path), e)
+        return []
+
+    try:
+        rows = ws.iter_rows(values_only=True)
+
+        # Identifikationszeile finden (enthält "I" für Kalenderwochen)
+        for r, row in enumerate(rows, start=1):
+            val = row[0] if row else None
+            if val and RE_IDENTIFIER.match(str(val).strip()):
+                return _shifts_from_rows(
+                    row, r, rows, target_dates, schichten, laufzettel_mgr, holidays,
+                )
+        return []
+    finally:
+        wb.close()
+
+
+def shifts_from_sheet(
+    sheet: RosterSheet, target_dates: Set[date], schichten: Set[str],
+    laufzettel_mgr: LaufzettelManager, holidays: GermanHolidays,
+) -> List[GroupShift]:
+    """Wie ``process_excel_file``, aber auf einer bereits eingelesenen Datei
+    aus dem geteilten ``Roster`` der Hauptverarbeitung."""
+    if sheet is None or sheet.identifier_index is None:
+        return []
+    first = sheet.identifier_index + 1
+    return _shifts_from_rows(
+        sheet.identifier_row, first, iter(sheet.rows[first:]),
+        target_dates, schichten, laufzettel_mgr, holidays,
+    )
+
+
+def _shifts_from_rows(
+    identifier_row: tuple, identifier_row_number: int, rows: Iterator[tuple],
+    target_dates: Set[date], schichten: Set[str],
+    laufzettel_mgr: LaufzettelManager, holidays: GermanHolidays,
+) -> List[GroupShift]:
+    """Wertet die Zeilen unterhalb der Identifikationszeile aus (Zeilennummern 1-basiert)."""
+    day_columns = _relevant_day_columns(identifier_row, target_dates)
+    # Keines der Zieldaten in dieser Woche
+    if not day_columns:
+        return []
+
+    shifts: List[GroupShift] = []
+    for r, row in enumerate(rows, start=identifier_row_number + 1):
+        name_val = row[0] if row else None
+        for col, work_date in day_columns.items():
+            cell_val = row[col] if col < len(row) else None
+            if cell_val is None:
+                continue
+            shift = _parse_group_cell(
+                cell_val, r, name_val, work_date, schichten, laufzettel_mgr, holidays,
+            )
+            if shift:
+                shifts.append(shift)
+    return shifts
+
+
+def _relevant_day_columns(identifier_row: tuple, target_dates: Set[date]) -> Dict[int, date]:
+    """Ordnet die Tagesspalten B–H der Identifikationszeile ihren Daten zu (nur Zieldaten)."""
+    columns = {}
+    for col in range(1, 8):  # Spalten B (Index 1) bis H (Index 7)
+        cell_date = identifier_row[col] if col < len(identifier_row) else None
+        if isinstance(cell_date, datetime.datetime):
+            work_date = cell_date.date()
+        elif isinstance(cell_date, datetime.date):
+            work_date = cell_date
+        else:
+            continue
+        if work_date in target_dates:
+            columns[col] = work_date
+    return columns
+
+
+def _parse_group_cell(
+    cell_val, row_number: int, name_val, work_date: date, schichten: Set[str],
+    laufzettel_mgr: LaufzettelManager, holidays: GermanHolidays,
+) -> Optional[GroupShift]:
+    """Wertet eine Dienst-Zelle aus und liefert ggf. den Soll-Termin."""
+    raw_entry = str(cell_val)
+    service_entry = RE_DOT_TO_COLON.sub(r"\1:\2", raw_entry)
+    schicht_key = RE_CLEANUP.sub("", RE_TIME_RANGE.sub("", service_entry))
+    is_special = "Projekt" in service_entry or "Bereitschaft" in service_entry
+
+    if schicht_key not in schichten and not is_special:
+        return None
+
+    if is_special:
+        if row_number >= 86:
+            return None
+        service_entry = f"09:00 - 09:01 {service_entry}"
+
+    service_entry = service_entry.replace("\n", " ").replace("\r", " ")
+    service_entry = re.sub(r" {2,}", " ", service_entry)
+    service_entry = RE_TIME_SPACING.sub(r"\1 - \2", service_entry)
+
+    # Name aus Spalte A
+    name = str(name_val) if name_val else ""
+    name_without_brackets = RE_NAME_BRACKETS.sub("", name).strip()
+
+    if not name_without_brackets:
+        return None
+
+    if not RE_TIME_SPACING.search(service_entry):
+        return None
+
+    return plan_timed_event(
+        service_entry, work_date, name_without_brackets, laufzettel_mgr, holidays,
+    )
+
+
+def relevant_dates(days: int, today: Optional[date] = None) -> Set[date]:
+    """Die Zieldaten des Horizonts: heute und die folgenden ``days - 1`` Tage."""
+    today = today or date.today()
+    return {today + timedelta(days=i) for i in range(days)}
+
+
+def holiday_skip_reason(holidays: GermanHolidays, days: int,
+                        today: Optional[date] = None) -> Optional[str]:
+    """Name des freien Tages, wenn der Lauf heute entfallen kann, sonst None.
+
+    Entfällt nur, wenn heute frei ist und im Horizont nach morgen kein
+    Arbeitstag mehr folgt.
+    """
+    today = today or date.today()
+    is_free, holiday_name = holidays.is_holiday_or_weekend(today)
+    later_workday = any(
+        not holidays.is_holiday_or_weekend(today + timedelta(days=i))[0]
+        for i in range(2, days)
+    )
+    if is_free and not later_workday:
+        return holiday_name
+    return None
+
+
+def update_group_calendar(
+    calendar, shifts: List[GroupShift], days: int, rewrite: bool,
+    deadline: Deadline, workers: int = DEFAULT_WORKERS, start: Optional[date] = None,
+) -> List[str]:
+    """Lädt den Gruppenkalender einmal für das ganze Fenster (inkl. der letzten
+    Tage zum Aufräumen) und schreibt nur die Unterschiede.
+
+    Das Fenster umfasst ``days`` Tage ab ``start`` (Standard: heute);
+    aufgeräumt wird immer relativ zu heute.
+
+    Returns:
+        Log-Texte der neu eingetragenen Termine.
+
+    Raises:
+        DeadlineExceeded (siehe ``sync_group_calendar``); Fehler beim Laden
+        des Kalenders werden durchgereicht.
+    """
+    heute = date.today()
+    start = start or heute
+    deadline.check("Gruppenkalender laden")
+    index = GroupCalendarIndex(calendar)
+    with Timer("Gruppenkalender laden", log_threshold_seconds=5):
+        index.load(heute - timedelta(days=PRUNE_DAYS_BACK), start + timedelta(days=days))
+
+    with Timer("Gruppenkalender schreiben", log_threshold_seconds=5):
+        new_entries = sync_group_calendar(
+            calendar, index, shifts, rewrite, deadline, workers=workers,
+            prune_before=heute - timedelta(days=1),  # gestern bleibt stehen
+        )
+
+    if new_entries:
+        logger.info("%d neue Termine im Gruppenkalender eingetragen.", len(new_entries))
+    return new_entries
@@ -0,0 +1,177 @@
+"""Laufjournal: ein abgebrochener Lauf setzt beim nächsten Aufruf fort.
+
+Wird ein Lauf unterbrochen (NAS-Neustart, OOM, überlappender Cronjob),
+steht in ``run_journal.json``:
+
+- welche Wochen der Lauf verarbeiten sollte (der Download meldet sie kein
+  zweites Mal als geändert),
+- welche Kollegen fertig sind und
+- welche Tage bei den übrigen bereits geschrieben wurden.
+
+Der nächste Lauf nimmt die offenen Wochen mit, überspringt fertige Kollegen
+und bei den übrigen die geschriebenen Tage. Haben sich die Eingaben
+(Dienstpläne, Laufzettel, Konfiguration, Verarbeitungsfenster) inzwischen
+geändert, gilt nichts davon mehr als erledigt; nur die offenen Wochen
+werden übernommen. Nach einem vollständigen Lauf wird das Journal gelöscht.
+
+Außerdem stehen darin die Wochen von Kollegen, deren Zeitbudget
+aufgebraucht war (``defer``). Sie bleiben auch nach einem vollständigen
+Lauf stehen; der nächste Lauf liest sie für diese Kollegen zusätzlich ein
+und nimmt die Kollegen zuerst an die Reihe.
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Set
+
+from dependencies import DependencyTracker
+from utils import load_json_state, save_json_state
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "run_journal.json"
+CHECKPOINT_SECONDS = 10.0   # höchstens so oft während des Laufs speichern
+
+
+class RunJournal:
+    """Fortschritt des laufenden (bzw. zuletzt abgebrochenen) Laufs.
+
+    Gespeichert wird gedrosselt alle ``CHECKPOINT_SECONDS``, zusammen mit
+    der Abhängigkeitsverfolgung, damit deren Stand die als geschrieben
+    vermerkten Tage enthält. Thread-safe.
+
+    Verwendung:
+        journal = RunJournal("/pfad/run_journal.json", dependencies)
+        only_files = journal.begin(fingerprint, only_files)
+        if not journal.is_done("Meier, M."):
+            ...
+            journal.record_day("Meier, M.", day)
+            journal.complete("Meier, M.")
+        journal.finish()
+    """
+
+    def __init__(self, path: str, dependencies: Optional[DependencyTracker] = None):
+        self.path = path
+        self.dependencies = dependencies
+        self._lock = threading.Lock()
+        self._state: dict = load_json_state(path)
+        self._saved_at = 0.0
+
+    @property
+    def pending(self) -> bool:
+        """True, wenn ein Lauf nicht zu Ende gekommen ist oder Arbeit verschoben wurde."""
+        with self._lock:
+            return bool(self._state)
+
+    def begin(self, fingerprint: str, only_files: Optional[List[str]]) -> Optional[List[str]]:
+        """Beginnt einen Lauf oder setzt den unterbrochenen fort.
+
+        Args:
+            fingerprint: Stand der Eingaben (siehe ``input_fingerprint``)
+            only_files: Die für diesen Lauf gemeldeten Wochen (None = alle)
+
+        Returns:
+            Die zu verarbeitenden Wochen inkl. der offenen des unterbrochenen Laufs.
+        """
+        with self._lock:
+            previous = self._state
+            done: List[str] = []
+            applied: dict = {}
+            if previous.get("inputs"):
+                only_files = _merge_files(previous.get("files"), only_files)
+                if previous.get("inputs") == fingerprint:
+                    done = previous.get("done", [])
+                    applied = previous.get("applied", {})
+                    logger.info("Setze unterbrochenen Lauf fort (%d Kollegen bereits fertig).",
+                                len(done))
+                else:
+                    logger.info("Eingaben seit dem unterbrochenen Lauf geändert – "
+                                "verarbeite dessen offene Wochen erneut.")
+            self._state = {
+                "inputs": fingerprint,
+                "files": sorted(only_files) if only_files is not None else None,
+                "done": done,
+                "applied": applied,
+                "deferred": previous.get("deferred", {}),
+            }
+            self._save_locked()
+        return only_files
+
+    def is_done(self, name: str) -> bool:
+        with self._lock:
+            return name in self._state.get("done", [])
+
+    def deferred_files(self, name: str) -> List[str]:
+        """Wochen, die bei ``name`` aus Zeitgründen liegen geblieben sind."""
+        with self._lock:
+            return list(self._state.get("deferred", {}).get(name, []))
+
+    def applied_dates(self, name: str) -> Set[datetime.date]:
+        """Tage, die im unterbrochenen Lauf bereits geschrieben wurden."""
+        with self._lock:
+            days = self._state.get("applied", {}).get(name, [])
+        return {datetime.date.fromisoformat(iso) for iso in days}
+
+    def record_day(self, name: str, day: datetime.date):
+        with self._lock:
+            if not self._state:
+                return
+            self._state["applied"].setdefault(name, []).append(day.isoformat())
+            self._save_throttled()
+
+    def complete(self, name: str):
+        with self._lock:
+            if not self._state:
+                return
+            self._state["done"].append(name)
+            self._state["applied"].pop(name, None)
+            self._state["deferred"].pop(name, None)
+            self._save_throttled()
+
+    def defer(self, name: str, files: List[str]):
+        """Vermerkt die Wochen, die bei ``name`` im nächsten Lauf nachzuholen sind."""
+        with self._lock:
+            if not self._state:
+                return
+            self._state["deferred"][name] = sorted(files)
+            self._save_locked()
+
+    def finish(self):
+        """Der Lauf ist vollständig: Journal löschen (bis auf verschobene Arbeit)."""
+        with self._lock:
+            deferred = self._state.get("deferred")
+            if deferred:
+                self._state = {"deferred": deferred}
+                self._save_locked()
+                return
+            self._state = {}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _save_throttled(self):
+        if time.monotonic() - self._saved_at >= CHECKPOINT_SECONDS:
+            self._save_locked()
+
+    def _save_locked(self):
+        if self.dependencies:
+            self.dependencies.save()
+        save_json_state(self.path, self._state)
+        self._saved_at = time.monotonic()
+
+
+def input_fingerprint(stamp: tuple, since: datetime.date, until: datetime.date) -> str:
+    """Hash über Dateistände und Verarbeitungsfenster eines Laufs."""
+    return hashlib.sha1(repr((stamp, since, until)).encode("utf-8")).hexdigest()[:16]
+
+
+def _merge_files(previous: Optional[List[str]], current: Optional[List[str]]) -> Optional[List[str]]:
+    """Vereinigung zweier Dateilisten (None = alle Wochen)."""
+    if previous is None or current is None:
+        return None
+    return sorted(set(previous) | set(current))
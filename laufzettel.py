@@ -1,6 +1,7 @@
 """Laufzettel-Verwaltung: HTML parsen, datumsbezogen den richtigen Laufzettel liefern."""
 
 import datetime
+import hashlib
 import os
 import re
 import logging
@@ -39,6 +40,8 @@ class LaufzettelManager:
         self._dates: List[datetime.datetime] = []
         # Cache: Datum → (werktags, wochenende)
         self._parsed: Dict[datetime.datetime, Tuple[List[ShiftInfo], List[ShiftInfo]]] = {}
+        # Cache: Datum → Versionskennung (für die Abhängigkeitsverfolgung)
+        self._versions: Dict[datetime.datetime, str] = {}
         self._warned_empty = False
         self._load_all()
 
@@ -63,20 +66,10 @@ class LaufzettelManager:
 
         Wählt den Laufzettel mit dem höchsten Gültigkeitsdatum <= target_date.
         """
-        if isinstance(target_date, datetime.datetime):
-            target_date = target_date.date()
+        active_date = self._active_date(target_date)
 
-        # Finde den passenden Laufzettel (letzter, dessen Datum <= target_date)
-        active_date = None
-        for dt in self._dates:
-            if dt.date() <= target_date:
-                active_date = dt
-            else:
-                break
-
-        if active_date is None:
+        if active_date is None or active_date.date() > _as_date(target_date):
             if self._dates:
-                active_date = self._dates[0]  # Fallback: ältester verfügbarer
                 logger.warning(
                     "Kein Laufzettel für %s gefunden, verwende ältesten: %s",
                     target_date, active_date.strftime("%d.%m.%Y"),
@@ -96,6 +89,44 @@ class LaufzettelManager:
 
         return self._parsed[active_date]
 
+    def version_for_date(self, target_date: datetime.date) -> Optional[str]:
+        """Kennung des für ein Datum gültigen Laufzettels (Datum + Inhalts-Hash).
+
+        Ändert sich, wenn ein anderer Laufzettel zuständig wird oder der
+        zuständige inhaltlich geändert wurde. None, wenn keiner vorhanden ist.
+        """
+        active_date = self._active_date(target_date)
+        if active_date is None:
+            return None
+        if active_date not in self._versions:
+            html_path = os.path.join(
+                self._folder, f"Laufzettel_{active_date.strftime('%Y%m%d')}.html"
+            )
+            try:
+                with open(html_path, "rb") as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()[:10]
+            except OSError:
+                digest = "-"
+            self._versions[active_date] = f"{active_date.strftime('%Y%m%d')}:{digest}"
+        return self._versions[active_date]
+
+    def _active_date(self, target_date: datetime.date) -> Optional[datetime.datetime]:
+        """Letzter Laufzettel mit Datum <= target_date, sonst der älteste (Fallback)."""
+        target_date = _as_date(target_date)
+        active_date = None
+        for dt in self._dates:
+            if dt.date() <= target_date:
+                active_date = dt
+            else:
+                break
+        if active_date is None and self._dates:
+            active_date = self._dates[0]
+        return active_date
+
+
+def _as_date(value) -> datetime.date:
+    return value.date() if isinstance(value, datetime.datetime) else value
+
 
 def _parse_html(html_path: str) -> Tuple[List[ShiftInfo], List[ShiftInfo]]:
     """Parst eine Laufzettel-HTML-Datei und extrahiert Werktags- und Wochenend-Tabellen."""
@@ -6,23 +6,38 @@ Orchestriert Download, Verarbeitung und Benachrichtigung.
 """
 
 import argparse
+import datetime
 import math
 import os
+import signal
 import sys
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 
+from calendar_client import DAVConnectionPool
 from config import AppConfig, ColleagueConfig
-from cleaner import delete_old_entries
-from downloader import DownloadResult, download_plans
+from dependencies import DEPS_STATE_FILENAME, DependencyTracker
+from cleaner import PROGRESS_FILENAME, DeleteCheckpoint, delete_old_entries
+from downloader import DownloadResult, download_plans, recover_plans_dir
+from excel_parser import Horizon
+from group_calendar import DEFAULT_DAYS
 from holidays_de import GermanHolidays
+from journal import JOURNAL_FILENAME, RunJournal
 from laufzettel import LaufzettelManager
-from shift_processor import process_colleague
-from utils import Timer, setup_logging
+from service import SyncService, vpa_due_today
+from sharding import Shard, download_consumer, load_summaries, merge_summaries, state_path
+from shift_processor import RunReport, process_colleague
+from trigger_api import DEFAULT_PORT as API_PORT, TriggerAPI
+from utils import LOG_FILENAME, Timer, setup_logging
+from watcher import POLL_INTERVAL, PlanWatcher
 
 logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANS_FOLDER = os.path.join(BASE_DIR, "Plaene", "MAZ_TAZ Dienstplan")
+DAEMON_INTERVAL = 300
 
 
 def parse_args():
@@ -45,65 +60,254 @@ def parse_args():
                         help="(single) NAS-Kalender")
     parser.add_argument("-d", "--dienste", action="store_true",
                         help="(single) Nur Dienste eintragen")
+    parser.add_argument("-a", "--absences", action="store_true",
+                        help="(single) Abwesenheiten zu mehrtaegigen Terminen zusammenfassen")
     parser.add_argument("--notify", action="store_true",
                         help="(single) E-Mail-Benachrichtigung senden")
+    parser.add_argument("--since", type=_iso_date, default=None, metavar="JJJJ-MM-TT",
+                        help="Erste zu verarbeitende Woche (Standard: gestern; "
+                             "fruehere Wochen nur fuer Korrekturen)")
+    parser.add_argument("--until", type=_iso_date, default=None, metavar="JJJJ-MM-TT",
+                        help="Letzte zu verarbeitende Woche (Standard: horizon_weeks "
+                             "Wochen voraus)")
+    parser.add_argument("--vpa", action="store_true",
+                        help="Anschliessend den Gruppenkalender VPA aktualisieren")
+    parser.add_argument("--days", type=_positive_int, default=DEFAULT_DAYS, metavar="N",
+                        help=f"(vpa) Horizont des Gruppenkalenders in Tagen ab heute, "
+                             f"beschnitten auf --since/--until (Standard: {DEFAULT_DAYS})")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Dauerhaft laufen und die Download-Quelle regelmaessig pruefen")
+    parser.add_argument("--interval", type=int, default=DAEMON_INTERVAL, metavar="SEK",
+                        help=f"(daemon) Abstand der Zyklen (Standard: {DAEMON_INTERVAL} s)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Ohne Download dauerhaft laufen und nur geaenderte Plaene, "
+                             "Laufzettel und Kollegen verarbeiten")
+    parser.add_argument("--api", action="store_true",
+                        help="(daemon/watch) Lokale HTTP-Schnittstelle fuer gezielte Laeufe starten")
+    parser.add_argument("--api-port", type=int, default=API_PORT, metavar="PORT",
+                        help=f"(daemon/watch) Port der HTTP-Schnittstelle (Standard: {API_PORT})")
+    parser.add_argument("--shard", type=_shard, default=None, metavar="i/N",
+                        help="Nur den i-ten von N Teilen der Kollegen verarbeiten "
+                             "(eigene Zustandsdateien, VPA nur in Teil 1)")
+    parser.add_argument("--merge-summaries", nargs="?", const=BASE_DIR, default=None,
+                        metavar="ORDNER",
+                        help="Laufzusammenfassungen aller Shards zusammenfassen und beenden")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="Ausfuehrliche Konsolenausgabe (DEBUG)")
     return parser.parse_args()
 
 
-def run_delete_mode(app_config):
-    """Loescht alte Eintraege fuer alle Kollegen (ausser Whitelist)."""
-    whitelist = set(app_config.get_delete_whitelist())
-    colleagues = [c for c in app_config.colleagues if c.name not in whitelist]
-    logger.info("Loesche alte Eintraege fuer %d Kollegen...", len(colleagues))
+def _iso_date(value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ungueltiges Datum: {value!r} (erwartet JJJJ-MM-TT)")
 
-    cpu_count = os.cpu_count() or 1
-    workers = max(1, math.floor(cpu_count * 0.5))
 
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {
-            executor.submit(delete_old_entries, app_config, c.name): c.name
-            for c in colleagues
-        }
-        for future in as_completed(futures):
-            name = futures[future]
-            try:
-                future.result()
-            except Exception as e:
-                logger.error("Fehler beim Loeschen fuer %s: %s", name, e)
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("muss mindestens 1 sein")
+    return number
+
 
+def _shard(value: str) -> Shard:
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_horizon(app_config, args) -> Horizon:
+    """Verarbeitungsfenster aus --since/--until, sonst der Standard-Horizont."""
+    default = Horizon.default(app_config.horizon_weeks)
+    horizon = Horizon(args.since or default.since, args.until or default.until)
+    if horizon.since > horizon.until:
+        logger.error("--since liegt nach --until. Abbruch.")
+        sys.exit(2)
+    if args.since or args.until:
+        logger.info("Verarbeite %s bis %s.", horizon.since.strftime("%d.%m.%Y"),
+                    horizon.until.strftime("%d.%m.%Y"))
+    return horizon
+
+
+def dependencies_stale(app_config, horizon, shard=None) -> bool:
+    """True, wenn Laufzettel, Feiertage oder Optionen geschriebene Tage veraltet haben.
+
+    Dieselbe Pruefung wie im Lauf selbst (deps_state.json); sie entscheidet,
+    ob sich ein Lauf lohnt, obwohl der Download keine Aenderungen meldet.
+    """
+    deps = DependencyTracker(state_path(BASE_DIR, DEPS_STATE_FILENAME, shard))
+    laufzettel_mgr = LaufzettelManager(BASE_DIR)
+    holidays = GermanHolidays()
+    colleagues = shard.select(app_config.colleagues) if shard else app_config.colleagues
+    return any(
+        deps.stale_dates(c, laufzettel_mgr, holidays, horizon.since, horizon.until)
+        for c in colleagues
+    )
 
-def run_update_mode(app_config, force=False):
-    """Aktualisiert Kalender fuer alle Kollegen parallel."""
-    # Gemeinsame Ressourcen einmal laden
-    with Timer("Laufzettel + Feiertage laden"):
-        holidays = GermanHolidays()
-        laufzettel_mgr = LaufzettelManager(BASE_DIR)
 
-    plans_folder = os.path.join(BASE_DIR, "Plaene", "MAZ_TAZ Dienstplan")
-    colleagues = app_config.colleagues
+def run_delete_mode(app_config, shard=None):
+    """Loescht alte Eintraege fuer alle Kollegen (ausser Whitelist).
 
-    logger.info("Verarbeite %d Kollegen...", len(colleagues))
+    Der Fortschritt wird in delete_progress.json gesichert; ein erneuter
+    Aufruf setzt nach einem Abbruch beim naechsten offenen Monat fort.
+    Mit ``shard`` nur die Kollegen dieses Shards (eigene Fortschrittsdatei).
+    """
+    whitelist = set(app_config.get_delete_whitelist())
+    colleagues = [c for c in app_config.colleagues if c.name not in whitelist]
+    if shard:
+        colleagues = shard.select(colleagues)
+    logger.info("Loesche alte Eintraege fuer %d Kollegen...", len(colleagues))
 
     cpu_count = os.cpu_count() or 1
     workers = max(1, math.floor(cpu_count * 0.5))
-    logger.info("CPUs: %d, Threads: %d", cpu_count, workers)
-
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {
-            executor.submit(
-                process_colleague,
-                app_config, c, laufzettel_mgr, holidays, plans_folder,
-            ): c.name
-            for c in colleagues
-        }
-        for future in as_completed(futures):
-            name = futures[future]
+
+    checkpoint = DeleteCheckpoint(state_path(BASE_DIR, PROGRESS_FILENAME, shard),
+                                  datetime.datetime.now().year - 2)
+    pool = DAVConnectionPool(app_config)
+    deleted = failed = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    delete_old_entries, app_config, c.name, pool=pool, checkpoint=checkpoint,
+                ): c.name
+                for c in colleagues
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    logger.error("Fehler beim Loeschen fuer %s: %s", name, e)
+                    continue
+                deleted += stats.deleted
+                failed += stats.failed
+    finally:
+        pool.close()
+
+    logger.info("Loeschen abgeschlossen: %d geloescht, %d fehlgeschlagen.", deleted, failed)
+
+
+def run_update_mode(app_config, force=False, only_files=None, vpa=False, horizon=None,
+                    shard=None, vpa_days=DEFAULT_DAYS):
+    """Aktualisiert Kalender fuer alle Kollegen parallel (ein Lauf).
+
+    Args:
+        only_files: Optional nur diese Excel-Dateien verarbeiten (z.B. die
+            beim Download geaenderten). None = alle Dateien im Ordner.
+        vpa: Anschliessend den Gruppenkalender VPA aus denselben, bereits
+            eingelesenen Dateien aktualisieren.
+        horizon: Verarbeitungsfenster (Standard: gestern bis horizon_weeks voraus)
+        shard: Optional nur die Kollegen dieses Shards
+        vpa_days: Horizont des Gruppenkalenders in Tagen (--days)
+    """
+    service = SyncService(BASE_DIR, app_config, shard=shard, vpa_days=vpa_days)
+    try:
+        service.sync(only_files=only_files, vpa=vpa, rewrite_vpa=force, horizon=horizon)
+    finally:
+        service.close()
+
+
+def run_daemon_mode(app_config, args):
+    """Laeuft dauerhaft: pollt die Download-Quelle und synchronisiert inkrementell.
+
+    Konfiguration, Laufzettel, Feiertage, eingelesene Plaene und Verbindungen
+    bleiben zwischen den Zyklen erhalten. SIGTERM/SIGINT beenden den Dienst
+    nach dem laufenden Zyklus.
+    """
+    stop = _stop_on_signal()
+    service = SyncService(BASE_DIR, app_config, shard=args.shard, vpa_days=args.days)
+    api = TriggerAPI(service, port=args.api_port) if args.api else None
+    if api:
+        api.start()
+    logger.info("Daemon gestartet (Intervall %d s).", args.interval)
+    cycle = 0
+    try:
+        while not stop.is_set():
+            cycle += 1
+            started = time.monotonic()
             try:
-                future.result()
+                report = service.poll(vpa=args.vpa)
             except Exception as e:
-                logger.error("Fehler bei %s: %s", name, e, exc_info=True)
+                report = None
+                logger.error("Fehler in Zyklus %d: %s", cycle, e, exc_info=True)
+            logger.info(
+                "Zyklus %d: %.1f s (%s).", cycle, time.monotonic() - started,
+                report.summary if report else "keine Aenderungen",
+            )
+            stop.wait(args.interval)
+    finally:
+        if api:
+            api.stop()
+        service.close()
+        logger.info("Daemon beendet.")
+
+
+def run_watch_mode(app_config, args):
+    """Laeuft dauerhaft ohne Download und reagiert auf Dateiaenderungen.
+
+    Geaenderte Wochen, die Wochen geaenderter Laufzettel und neue oder
+    geaenderte Kollegen werden gezielt verarbeitet (siehe watcher.py).
+    """
+    stop = _stop_on_signal()
+    service = SyncService(BASE_DIR, app_config, shard=args.shard, vpa_days=args.days)
+    watcher = PlanWatcher(service, vpa=args.vpa)
+    api = TriggerAPI(service, port=args.api_port) if args.api else None
+    if api:
+        api.start()
+    try:
+        while not stop.is_set():
+            try:
+                for report in watcher.run_once():
+                    logger.info("Laufbericht: %s", report.summary)
+            except Exception as e:
+                logger.error("Fehler bei der Dateiueberwachung: %s", e, exc_info=True)
+                stop.wait(POLL_INTERVAL)
+    finally:
+        if api:
+            api.stop()
+        watcher.close()
+        service.close()
+        logger.info("Ueberwachung beendet.")
+
+
+def _stop_on_signal() -> threading.Event:
+    """Event, das bei SIGTERM/SIGINT gesetzt wird (Ende nach dem laufenden Zyklus)."""
+    stop = threading.Event()
+
+    def request_stop(signum, _frame):
+        logger.info("Signal %d empfangen – beende nach dem laufenden Zyklus.", signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    return stop
+
+
+def run_merge_summaries(folder):
+    """Fasst die Laufzusammenfassungen aller Shards zusammen (z.B. von NAS und VM)."""
+    summaries = load_summaries(folder)
+    if not summaries:
+        logger.error("Keine Shard-Zusammenfassungen in %s gefunden.", folder)
+        sys.exit(1)
+    for summary in summaries:
+        logger.info("Shard %s (%s, %.1f s): %s", summary["shard"], summary.get("started"),
+                    summary.get("duration_seconds", 0.0),
+                    RunReport.from_counts(summary.get("counts", {})).summary)
+    logger.info("Gesamt: %s", RunReport.from_counts(merge_summaries(summaries)).summary)
+
+
+def log_shard(app_config, args):
+    """Meldet den Anteil dieses Shards; VPA laeuft nur in Shard 1."""
+    shard = args.shard
+    logger.info("Shard %s: %d von %d Kollegen.", shard.label,
+                len(shard.select(app_config.colleagues)), len(app_config.colleagues))
+    if args.vpa and not shard.primary:
+        logger.info("Gruppenkalender VPA wird von Shard 1 aktualisiert.")
+        args.vpa = False
 
 
 def run_single_mode(app_config, args):
@@ -116,45 +320,88 @@ def run_single_mode(app_config, args):
         rewrite=args.rewrite,
         use_nas=args.nas,
         only_shifts=args.dienste,
+        merge_absences=args.absences,
     )
 
     holidays = GermanHolidays()
     laufzettel_mgr = LaufzettelManager(BASE_DIR)
-    plans_folder = os.path.join(BASE_DIR, "Plaene", "MAZ_TAZ Dienstplan")
 
-    process_colleague(app_config, colleague, laufzettel_mgr, holidays, plans_folder)
+    process_colleague(
+        app_config, colleague, laufzettel_mgr, holidays, PLANS_FOLDER,
+        horizon=build_horizon(app_config, args),
+    )
 
 
 def main():
     args = parse_args()
     console_level = logging.DEBUG if args.verbose else logging.INFO
-    setup_logging(BASE_DIR, console_level=console_level)
+    setup_logging(BASE_DIR, console_level=console_level,
+                  log_filename=state_path("", LOG_FILENAME, args.shard))
+
+    if args.merge_summaries:
+        run_merge_summaries(args.merge_summaries)
+        return
 
     with Timer("Gesamtdauer", log_threshold_seconds=0):
         app_config = AppConfig(BASE_DIR)
+        if args.shard and not args.single:
+            log_shard(app_config, args)
 
         if args.delete:
-            run_delete_mode(app_config)
+            run_delete_mode(app_config, args.shard)
             return
 
+        # Reste eines abgebrochenen Entpackens (auch fuer Modi ohne Download)
+        recover_plans_dir(BASE_DIR)
+
         if args.single:
             run_single_mode(app_config, args)
             return
 
+        if args.daemon:
+            run_daemon_mode(app_config, args)
+            return
+
+        if args.watch:
+            run_watch_mode(app_config, args)
+            return
+
+        horizon = build_horizon(app_config, args)
+
         if not args.no_download:
             with Timer("Download"):
                 fast = not args.force
-                result = download_plans(app_config, BASE_DIR, fast=fast)
+                report = download_plans(app_config, BASE_DIR, fast=fast,
+                                        consumer=download_consumer(args.shard))
 
-            if result == DownloadResult.CONNECTION_ERROR:
+            if report.result == DownloadResult.CONNECTION_ERROR:
                 logger.error("Server nicht erreichbar. Abbruch.")
                 sys.exit(2)
 
-            if result == DownloadResult.NO_CHANGES and not args.force:
+            if report.result == DownloadResult.NO_CHANGES and not args.force:
                 logger.debug("Keine Aenderungen festgestellt.")
+                if (RunJournal(state_path(BASE_DIR, JOURNAL_FILENAME, args.shard)).pending
+                        or dependencies_stale(app_config, horizon, args.shard)):
+                    # Abgebrochener Lauf oder geaenderte Laufzettel/Feiertage/Optionen:
+                    # nur offene bzw. veraltete Wochen verarbeiten
+                    run_update_mode(app_config, only_files=[],
+                                    vpa=args.vpa and vpa_due_today(BASE_DIR),
+                                    horizon=horizon, shard=args.shard, vpa_days=args.days)
+                    return
+                if args.vpa and vpa_due_today(BASE_DIR):
+                    # Neuer Tag ohne neue Plaene: nur der Gruppenkalender rollt weiter
+                    run_update_mode(app_config, only_files=[], vpa=True, horizon=horizon,
+                                    shard=args.shard, vpa_days=args.days)
+                return
+
+            if report.result == DownloadResult.NEW_DATA and not args.force:
+                # Nur die tatsaechlich geaenderten Wochen verarbeiten
+                run_update_mode(app_config, only_files=report.changed_files, vpa=args.vpa,
+                                horizon=horizon, shard=args.shard, vpa_days=args.days)
                 return
 
-        run_update_mode(app_config, force=args.force)
+        run_update_mode(app_config, force=args.force, vpa=args.vpa, horizon=horizon,
+                        shard=args.shard, vpa_days=args.days)
 
 
 if __name__ == "__main__":
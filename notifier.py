@@ -1,60 +1,110 @@
-"""E-Mail-Benachrichtigungen für neue Dienstplan-Einträge."""
+"""E-Mail-Benachrichtigungen für neue Dienstplan-Einträge.
+
+Im Normalbetrieb legen die Kollegen-Threads fertige Mails nur in eine
+``MailQueue``; ein Hintergrund-Thread verschickt sie über eine einzige,
+wiederverwendete SMTP-Verbindung. Nicht zustellbare Mails landen im
+Postausgang (mail_outbox.json) und werden beim nächsten Lauf erneut versucht.
+"""
 
 import datetime
 import logging
+import os
+import queue
+import random
 import smtplib
+import threading
+import time
+from dataclasses import asdict, dataclass
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import List, Optional
 
 from config import AppConfig
+from event_builder import ChangeRecord
+from utils import load_json_state, save_json_state
 
 logger = logging.getLogger(__name__)
 
 # Wochentags-Abkürzungen
 _WOCHENTAGE = ["Mo.", "Di.", "Mi.", "Do.", "Fr.", "Sa.", "So."]
 
+OUTBOX_FILENAME = "mail_outbox.json"
+_MAX_ATTEMPTS = 3
+_BACKOFF_BASE_SECONDS = 2.0
+_SMTP_TIMEOUT = 30
+
+
+@dataclass
+class OutgoingMail:
+    """Eine fertig aufgebaute Benachrichtigung."""
+    user_name: str
+    to_email: str
+    subject: str
+    html_body: str
+    entry_count: int = 0
+
 
 def send_notification(
     app_config: AppConfig,
     user_name: str,
-    entries: List[str],
+    changes: List[ChangeRecord],
     night_shift_summary: Optional[str] = None,
+    mail_queue: Optional["MailQueue"] = None,
 ):
     """Sendet eine E-Mail-Benachrichtigung über neue Termine.
 
     Args:
         app_config: Zentrale Konfiguration
         user_name: Name des Kollegen
-        entries: Liste von formatierten Termin-Strings ("DD.MM.YYYY, HH:MM bis HH:MM: Titel")
+        changes: Neu eingetragene Termine (vergangene werden nicht gemeldet)
         night_shift_summary: Optionaler HTML-Text zur Nachtschicht-Statistik
+        mail_queue: Optional Warteschlange; dann wird die Mail nur eingereiht
+            und im Hintergrund verschickt, sonst sofort (eigene Verbindung).
+    """
+    mail = build_notification(app_config, user_name, changes, night_shift_summary)
+    if mail is None:
+        return
+    if mail_queue is not None:
+        mail_queue.put(mail)
+        return
+
+    sender = SMTPSender(app_config)
+    try:
+        sender.send(mail)
+        logger.info("Mail an %s gesendet (%d Termine).", user_name, mail.entry_count)
+    except Exception as e:
+        logger.error("Fehler beim Senden der E-Mail an %s: %s", mail.to_email, e)
+    finally:
+        sender.close()
+
+
+def build_notification(
+    app_config: AppConfig,
+    user_name: str,
+    changes: List[ChangeRecord],
+    night_shift_summary: Optional[str] = None,
+) -> Optional[OutgoingMail]:
+    """Baut die Benachrichtigung auf (ohne Netzwerk).
+
+    Returns:
+        OutgoingMail oder None, wenn nichts zu senden ist.
     """
     email_entry = app_config.get_email_entry(user_name)
     if not email_entry:
         logger.warning("Keine E-Mail-Konfiguration für '%s' – Benachrichtigung übersprungen.", user_name)
-        return
+        return None
 
-    # Nur zukünftige Termine in die Mail aufnehmen
+    # Nur zukünftige Termine in die Mail aufnehmen, Wochentag voranstellen
     today = datetime.date.today()
-    future_entries = []
-    for entry in entries:
-        try:
-            date_str = entry.split(",")[0].split(" ")[0] if ", " in entry else entry.split(":")[0].strip()
-            # Versuche das Datum zu parsen
-            parts = date_str.strip().split(".")
-            if len(parts) == 3:
-                entry_date = datetime.date(int(parts[2]), int(parts[1]), int(parts[0]))
-                if entry_date < today:
-                    continue
-        except (ValueError, IndexError):
-            pass  # Im Zweifel aufnehmen
-
-        # Wochentag voranstellen
-        future_entries.append(_add_weekday(entry))
+    future_entries = [
+        f"{_WOCHENTAGE[change.date.weekday()]} {change.log_text}"
+        for change in changes
+        if (change.last_day or change.date) >= today
+    ]
 
     if not future_entries:
         logger.debug("Keine zukünftigen Termine für %s – keine Mail.", user_name)
-        return
+        return None
 
     # Mail-Body zusammenbauen
     body = "Es wurden folgende Termine eingetragen:<br><br>"
@@ -70,13 +120,13 @@ def send_notification(
         f"Alle Angaben und Inhalte sind ohne Gewähr."
     )
 
-    _send_smtp(
-        app_config=app_config,
+    return OutgoingMail(
+        user_name=user_name,
         to_email=email_entry.email,
         subject=f"Dienstplan Update {user_name}",
         html_body=body,
+        entry_count=len(future_entries),
     )
-    logger.info("Mail an %s gesendet (%d Termine).", user_name, len(future_entries))
 
 
 def build_night_shift_summary(night_count_current: int, night_count_year: int, year: int) -> Optional[str]:
@@ -114,37 +164,171 @@ def build_night_shift_summary(night_count_current: int, night_count_year: int, y
 
 
 # ---------------------------------------------------------------------------
-# Interne Hilfsfunktionen
+# Versand
 # ---------------------------------------------------------------------------
 
-def _add_weekday(entry: str) -> str:
-    """Stellt den deutschen Wochentag vor einen Termin-String."""
-    try:
-        date_str = entry.split(",")[0].split(" ")[0] if ", " in entry else entry.split(":")[0].strip()
-        parts = date_str.strip().split(".")
-        if len(parts) == 3:
-            dt = datetime.date(int(parts[2]), int(parts[1]), int(parts[0]))
-            return f"{_WOCHENTAGE[dt.weekday()]} {entry}"
-    except (ValueError, IndexError):
-        pass
-    return entry
-
-
-def _send_smtp(app_config: AppConfig, to_email: str, subject: str, html_body: str):
-    """Sendet eine HTML-E-Mail über SMTP."""
-    from_email = app_config.smtp_email
-    password = app_config.smtp_password
-
-    msg = MIMEMultipart()
-    msg["From"] = f"Dein Dienstplan <{from_email}>"
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(html_body, "html"))
+class SMTPSender:
+    """Hält eine authentifizierte SMTP-Verbindung für mehrere Mails offen.
 
-    try:
-        with smtplib.SMTP("smtp.ionos.de", 587, timeout=30) as server:
-            server.starttls()
-            server.login(from_email, password)
-            server.sendmail(from_email, to_email, msg.as_string())
-    except Exception as e:
-        logger.error("Fehler beim Senden der E-Mail an %s: %s", to_email, e)
+    Die Verbindung wird beim ersten ``send`` aufgebaut (ggf. STARTTLS und
+    Login) und bei Fehlern verworfen, sodass der nächste Versuch neu verbindet.
+    """
+
+    def __init__(self, app_config: AppConfig):
+        self._app_config = app_config
+        self._server: Optional[smtplib.SMTP] = None
+
+    def send(self, mail: OutgoingMail):
+        """Verschickt eine Mail; Fehler werden nach Schließen der Verbindung weitergereicht."""
+        from_email = self._app_config.smtp_email
+
+        msg = MIMEMultipart()
+        msg["From"] = f"Dein Dienstplan <{from_email}>"
+        msg["To"] = mail.to_email
+        msg["Subject"] = mail.subject
+        msg.attach(MIMEText(mail.html_body, "html"))
+
+        try:
+            if self._server is None:
+                self._server = self._connect()
+            self._server.sendmail(from_email, mail.to_email, msg.as_string())
+        except Exception:
+            self._discard()
+            raise
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+    def _connect(self) -> smtplib.SMTP:
+        cfg = self._app_config
+        server = smtplib.SMTP(cfg.smtp_host, cfg.smtp_port, timeout=_SMTP_TIMEOUT)
+        try:
+            if cfg.smtp_starttls:
+                server.starttls()
+            server.login(cfg.smtp_email, cfg.smtp_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _discard(self):
+        if self._server is not None:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+
+class MailQueue:
+    """Warteschlange mit Hintergrund-Versand über eine gemeinsame SMTP-Verbindung.
+
+    Beim Start werden Mails aus dem Postausgang eines früheren Laufs erneut
+    eingereiht. Jede Mail wird bis zu ``_MAX_ATTEMPTS``-mal versucht (mit
+    Backoff und neuer Verbindung). Der Postausgang enthält jederzeit alle
+    eingereihten und fehlgeschlagenen Mails (gesichert bei jedem Einreihen,
+    Zustellen und Fehlschlag), sodass auch ein Absturz keine Mail verliert.
+
+    Verwendung:
+        with MailQueue(config) as mails:
+            mails.put(mail)           # aus beliebigen Threads
+        # beim Verlassen: Warteschlange leeren, Verbindung schließen
+    """
+
+    _STOP = object()
+
+    def __init__(self, app_config: AppConfig, outbox_path: Optional[str] = None):
+        self._app_config = app_config
+        self._outbox_path = outbox_path or os.path.join(app_config.base_dir, OUTBOX_FILENAME)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: List[OutgoingMail] = []   # eingereiht, noch nicht zugestellt
+        self._failed: List[OutgoingMail] = []
+        self._thread: Optional[threading.Thread] = None
+        self.sent = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def start(self):
+        """Startet den Sende-Thread und reiht den alten Postausgang ein."""
+        for data in load_json_state(self._outbox_path).get("mails", []):
+            try:
+                mail = OutgoingMail(**data)
+            except TypeError:
+                logger.warning("Ungültiger Eintrag im Postausgang verworfen.")
+                continue
+            self._pending.append(mail)
+            self._queue.put(mail)
+        self._thread = threading.Thread(target=self._run, name="MailQueue", daemon=True)
+        self._thread.start()
+
+    def put(self, mail: OutgoingMail):
+        with self._lock:
+            self._pending.append(mail)
+            self._save_locked()
+        self._queue.put(mail)
+
+    def close(self, timeout: Optional[float] = None):
+        """Wartet, bis alle Mails verschickt sind, und sichert den Postausgang."""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+        # Bei Timeout bleiben noch Wartende im Postausgang
+        with self._lock:
+            self._save_locked()
+            undelivered = len(self._pending) + len(self._failed)
+        if undelivered:
+            logger.warning("%d Mails nicht zugestellt, im Postausgang gesichert.", undelivered)
+
+    def _run(self):
+        sender = SMTPSender(self._app_config)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                delivered = self._deliver(sender, item)
+                with self._lock:
+                    self._pending.remove(item)
+                    if delivered:
+                        self.sent += 1
+                    else:
+                        self._failed.append(item)
+                    self._save_locked()
+        finally:
+            sender.close()
+
+    def _save_locked(self):
+        mails = self._pending + self._failed
+        save_json_state(self._outbox_path, {"mails": [asdict(m) for m in mails]})
+
+    def _deliver(self, sender: SMTPSender, mail: OutgoingMail) -> bool:
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            try:
+                sender.send(mail)
+                logger.info("Mail an %s gesendet (%d Termine).", mail.user_name, mail.entry_count)
+                return True
+            except Exception as e:
+                logger.warning(
+                    "Mail an %s fehlgeschlagen (Versuch %d/%d): %s",
+                    mail.to_email, attempt, _MAX_ATTEMPTS, e,
+                )
+                if attempt < _MAX_ATTEMPTS:
+                    delay = _BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)
+                    time.sleep(delay + random.uniform(0, delay / 2))
+        logger.error("Mail an %s endgültig fehlgeschlagen.", mail.to_email)
+        return False
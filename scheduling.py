@@ -0,0 +1,109 @@
+"""Reihenfolge der Kollegen im Thread-Pool.
+
+Der Pool arbeitet die Aufträge in Einreichungsreihenfolge ab. Zwei Ziele:
+
+- Dringendes zuerst: im letzten Lauf wegen Zeitlimit liegen gebliebene
+  Kollegen, dann Kollegen mit geänderten Tagen, jeweils der mit dem
+  nächstliegenden geänderten Tag zuerst (``ColleaguePlan.priority``).
+- Kurze Gesamtdauer: die übrigen Kollegen nach erwarteter Laufzeit
+  absteigend (längste zuerst), damit am Ende kein langsamer Kollege
+  (großer Kalender, ``-r``, NAS) allein läuft, während die anderen Threads
+  schon fertig sind. Die Laufzeiten kommen aus früheren Läufen
+  (durations.json); ohne Verlauf bleibt die Reihenfolge aus colleagues.json.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from shift_processor import ColleaguePlan, ColleagueResult
+from utils import load_json_state, save_json_state
+
+logger = logging.getLogger(__name__)
+
+DURATIONS_FILENAME = "durations.json"
+_SMOOTHING = 0.3   # Gewicht des neuesten Laufs im gleitenden Mittelwert
+
+
+class DurationHistory:
+    """Laufzeiten pro Kollege aus früheren Läufen.
+
+    Gespeichert wird ein gleitender Mittelwert der Sekunden pro eingelesener
+    Woche, damit Läufe mit wenigen geänderten Wochen und volle Läufe
+    vergleichbar bleiben. Nicht thread-safe; ``record`` wird vom
+    sammelnden Thread aufgerufen.
+
+    Verwendung:
+        history = DurationHistory.for_base_dir(BASE_DIR)
+        expected = history.predict("Meier, M.", weeks=3)
+        history.record("Meier, M.", seconds=12.5, weeks=3)
+        history.save()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rates: Dict[str, float] = {
+            name: float(rate) for name, rate in load_json_state(path).items()
+        }
+
+    @classmethod
+    def for_base_dir(cls, base_dir: str) -> "DurationHistory":
+        return cls(os.path.join(base_dir, DURATIONS_FILENAME))
+
+    def predict(self, name: str, weeks: int) -> Optional[float]:
+        """Erwartete Sekunden für ``weeks`` Wochen (None ohne Verlauf)."""
+        rate = self._rates.get(name)
+        return None if rate is None else rate * max(weeks, 1)
+
+    def record(self, name: str, seconds: float, weeks: int):
+        rate = seconds / max(weeks, 1)
+        previous = self._rates.get(name)
+        self._rates[name] = rate if previous is None else previous + _SMOOTHING * (rate - previous)
+
+    def save(self):
+        save_json_state(self.path, {name: round(rate, 3) for name, rate in self._rates.items()})
+
+
+def schedule(
+    plans: List[ColleaguePlan], history: DurationHistory,
+) -> Tuple[List[ColleaguePlan], Dict[str, Optional[float]]]:
+    """Sortiert die Pläne für die Einreichung in den Thread-Pool.
+
+    Kollegen ohne Verlauf werden mit dem Mittel der bekannten Laufzeiten
+    eingeplant; bei Gleichstand bleibt die Reihenfolge aus colleagues.json.
+
+    Returns:
+        (sortierte Pläne, erwartete Sekunden pro Kollege)
+    """
+    expected = {p.colleague.name: history.predict(p.colleague.name, len(p.files)) for p in plans}
+    known = [seconds for seconds in expected.values() if seconds is not None]
+    fallback = sum(known) / len(known) if known else 0.0
+
+    def key(plan: ColleaguePlan):
+        urgency, nearest = plan.priority
+        if urgency <= 0:
+            return urgency, nearest, 0.0
+        seconds = expected[plan.colleague.name]
+        return 1, nearest, -(fallback if seconds is None else seconds)
+
+    ordered = sorted(plans, key=key)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Reihenfolge: %s", ", ".join(
+            f"{p.colleague.name} ({_format_seconds(expected[p.colleague.name])})" for p in ordered
+        ))
+    return ordered, expected
+
+
+def log_durations(results: List[ColleagueResult], expected: Dict[str, Optional[float]]):
+    """Debug-Ausgabe: erwartete und tatsächliche Laufzeit pro Kollege."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    for result in sorted(results, key=lambda r: r.seconds, reverse=True):
+        logger.debug(
+            "Laufzeit %s: erwartet %s, tatsächlich %.1f s.",
+            result.name, _format_seconds(expected.get(result.name)), result.seconds,
+        )
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    return "?" if seconds is None else f"~{seconds:.1f} s"
@@ -0,0 +1,494 @@
+"""Synchronisationsdienst mit warm gehaltenen Ressourcen.
+
+``SyncService`` bündelt alles, was ein Lauf braucht: Konfiguration,
+Feiertage, Laufzettel, eingelesene Dienstpläne (``Roster``), den
+CalDAV-Verbindungspool, die Aufbewahrungsregel, die Mail-Warteschlange,
+die Abhängigkeitsverfolgung und das Laufjournal.
+Ein einmaliger Aufruf von main.py nutzt ihn für genau einen Lauf; im
+Daemon-Modus bleibt er über viele Zyklen bestehen und lädt Konfiguration
+und Laufzettel nur neu, wenn sich die Dateien geändert haben.
+"""
+
+import datetime
+import glob
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from typing import List, Optional, Tuple
+
+from calendar_client import DAVConnectionPool
+from cleaner import RETENTION_STATE_FILENAME, RetentionPruner
+from config import AppConfig, ColleagueConfig
+from dependencies import DEPS_STATE_FILENAME, DependencyTracker
+from downloader import DownloadResult, create_session, download_plans
+from excel_parser import Horizon, Roster, get_sorted_excel_files, week_overlaps
+from group_calendar import (
+    DEFAULT_DAYS,
+    RUN_DEADLINE,
+    find_group_calendar,
+    holiday_skip_reason,
+    load_schichten,
+    relevant_dates,
+    shifts_from_sheet,
+    update_group_calendar,
+)
+from holidays_de import GermanHolidays
+from journal import JOURNAL_FILENAME, RunJournal, input_fingerprint
+from laufzettel import LaufzettelManager
+from notifier import OUTBOX_FILENAME, MailQueue
+from scheduling import DURATIONS_FILENAME, DurationHistory, log_durations, schedule
+from sharding import Shard, download_consumer, state_path, write_summary
+from shift_processor import (
+    ColleaguePlan,
+    ColleagueResult,
+    RunReport,
+    plan_colleague,
+    process_colleague,
+)
+from utils import (
+    Deadline,
+    DeadlineExceeded,
+    Timer,
+    load_json_state,
+    save_json_state,
+)
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILES = ("config.json", "colleagues.json", "email_config.json")
+VPA_STATE_FILENAME = "vpa_state.json"
+
+
+class SyncService:
+    """Hält die geteilten Ressourcen zwischen Läufen warm.
+
+    Es läuft immer nur eine Synchronisation gleichzeitig (``sync`` ist
+    gegen parallele Aufrufe aus Daemon, Watcher oder API gesperrt). Mit
+    ``shard`` werden nur die Kollegen dieses Shards verarbeitet und eigene
+    Zustandsdateien geführt (siehe sharding.py). ``vpa_days`` ist der
+    Horizont des Gruppenkalenders VPA (wie ``GruppeVPA.py --days``).
+
+    Verwendung:
+        service = SyncService(BASE_DIR)
+        service.sync(only_files=geaenderte_dateien, vpa=True)
+        service.close()
+    """
+
+    def __init__(self, base_dir: str, app_config: Optional[AppConfig] = None,
+                 shard: Optional[Shard] = None, vpa_days: int = DEFAULT_DAYS):
+        self.base_dir = base_dir
+        self.plans_folder = os.path.join(base_dir, "Plaene", "MAZ_TAZ Dienstplan")
+        self.app_config = app_config or AppConfig(base_dir)
+        self.shard = shard
+        self.vpa_days = vpa_days
+        self.roster = Roster()
+        self.dependencies = DependencyTracker(self._state_path(DEPS_STATE_FILENAME))
+        self.durations = DurationHistory(self._state_path(DURATIONS_FILENAME))
+        self.journal = RunJournal(self._state_path(JOURNAL_FILENAME), self.dependencies)
+        self.session = None
+        self.last_report: Optional[RunReport] = None
+        self.last_run_at: Optional[datetime.datetime] = None
+        self.last_duration = 0.0
+        self._lock = threading.Lock()
+        self._config_stamp = _files_stamp(self._config_paths())
+        self._laufzettel_stamp = None
+        self._holiday_year = None
+
+        with Timer("Laufzettel + Feiertage laden"):
+            self.refresh()
+        self._open_connections()
+
+    # --- Ressourcen ---
+
+    def refresh(self) -> bool:
+        """Lädt Konfiguration, Laufzettel und Feiertage neu, wenn nötig.
+
+        Returns:
+            True, wenn sich etwas geändert hat.
+        """
+        with self._lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> bool:
+        changed = False
+
+        config_stamp = _files_stamp(self._config_paths())
+        if config_stamp != self._config_stamp:
+            logger.info("Konfiguration geändert – lade neu.")
+            self.app_config = AppConfig(self.base_dir)
+            self._config_stamp = config_stamp
+            self._close_connections()
+            self._open_connections()
+            changed = True
+
+        laufzettel_stamp = _files_stamp(self._laufzettel_paths())
+        if laufzettel_stamp != self._laufzettel_stamp:
+            if self._laufzettel_stamp is not None:
+                logger.info("Laufzettel geändert – lade neu.")
+            self.laufzettel_mgr = LaufzettelManager(self.base_dir)
+            self._laufzettel_stamp = laufzettel_stamp
+            changed = True
+
+        # Die Feiertagstabelle deckt Vorjahr bis Folgejahr ab
+        year = datetime.date.today().year
+        if year != self._holiday_year:
+            self.holidays = GermanHolidays()
+            self._holiday_year = year
+            changed = True
+
+        return changed
+
+    def close(self):
+        """Verschickt ausstehende Mails und schließt alle Verbindungen."""
+        self._close_connections()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def _open_connections(self):
+        self.pool = DAVConnectionPool(self.app_config)
+        self.pruner = RetentionPruner.from_config(
+            self.app_config, self._state_path(RETENTION_STATE_FILENAME))
+        # Mails werden im Hintergrund ueber eine SMTP-Verbindung verschickt
+        self.mail_queue = MailQueue(self.app_config, self._state_path(OUTBOX_FILENAME))
+        self.mail_queue.start()
+
+    def _close_connections(self):
+        self.pool.close()
+        with Timer("Mailversand", log_threshold_seconds=5):
+            self.mail_queue.close()
+
+    def _config_paths(self) -> List[str]:
+        return [os.path.join(self.base_dir, name) for name in CONFIG_FILES]
+
+    def _laufzettel_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.base_dir, "Laufzettel_*.html")))
+
+    def _state_path(self, filename: str) -> str:
+        return state_path(self.base_dir, filename, self.shard)
+
+    def _input_fingerprint(self, horizon: Horizon) -> str:
+        """Stand von Dienstplänen, Laufzetteln und Konfiguration für das Laufjournal."""
+        paths = get_sorted_excel_files(self.plans_folder, horizon)
+        paths += self._config_paths() + self._laufzettel_paths()
+        return input_fingerprint(_files_stamp(paths), horizon.since, horizon.until)
+
+    # --- Läufe ---
+
+    @property
+    def busy(self) -> bool:
+        """True, während eine Synchronisation läuft."""
+        return self._lock.locked()
+
+    def poll(self, vpa: bool = False) -> Optional[RunReport]:
+        """Ein Daemon-Zyklus: bedingter Download, danach inkrementelle Synchronisation.
+
+        Haben sich nur Laufzettel oder Konfiguration geändert, werden die
+        davon abhängigen Tage neu geschrieben.
+
+        Returns:
+            RunReport, wenn synchronisiert wurde, sonst None.
+        """
+        inputs_changed = self.refresh()
+        self.session = self.session or create_session()
+        with Timer("Download"):
+            report = download_plans(self.app_config, self.base_dir,
+                                    consumer=download_consumer(self.shard), session=self.session)
+
+        if report.result == DownloadResult.CONNECTION_ERROR:
+            logger.warning("Server nicht erreichbar – nächster Versuch im nächsten Zyklus.")
+            return None
+        # Geänderte und entfallene Wochen sowie Wochen vor dem Horizont freigeben
+        for path in report.changed_files + report.removed_files:
+            self.roster.invalidate(path)
+        self.roster.prune(Horizon.default(self.app_config.horizon_weeks))
+        if report.result == DownloadResult.NEW_DATA:
+            return self.sync(only_files=report.changed_files, vpa=vpa)
+        if inputs_changed or self.journal.pending:
+            return self.sync(only_files=[], vpa=vpa)
+        if vpa and self.vpa_due_today():
+            # Neuer Tag ohne neue Plaene: nur der Gruppenkalender rollt weiter
+            return self.sync(only_files=[], vpa=True)
+        return None
+
+    def sync(
+        self,
+        colleagues: Optional[List[ColleagueConfig]] = None,
+        only_files: Optional[List[str]] = None,
+        vpa: bool = False,
+        rewrite_vpa: bool = False,
+        horizon: Optional[Horizon] = None,
+    ) -> RunReport:
+        """Aktualisiert Kalender für alle (oder die übergebenen) Kollegen parallel.
+
+        Ein Lauf für alle Kollegen wird im Laufjournal vermerkt und setzt
+        einen unterbrochenen Lauf fort (siehe journal.py).
+
+        Args:
+            colleagues: Optional nur diese Kollegen (Standard: alle aus colleagues.json)
+            only_files: Optional nur diese Excel-Dateien verarbeiten (z.B. die
+                beim Download geänderten). None = alle, [] = keine. Wochen mit
+                veralteten Abhängigkeiten kommen immer hinzu.
+            vpa: Anschließend den Gruppenkalender VPA aus denselben, bereits
+                eingelesenen Dateien aktualisieren.
+            rewrite_vpa: Gruppenkalender-Termine im Horizont neu schreiben.
+            horizon: Verarbeitungsfenster (Standard: gestern bis
+                ``horizon_weeks`` Wochen voraus, bei jedem Lauf neu berechnet).
+        """
+        with self._lock:
+            started_at = datetime.datetime.now()
+            started = time.monotonic()
+            horizon = horizon or Horizon.default(self.app_config.horizon_weeks)
+            report = self._sync_locked(colleagues, only_files, vpa, rewrite_vpa, horizon)
+            self.last_duration = time.monotonic() - started
+            self.last_run_at = datetime.datetime.now()
+            self.last_report = report
+            write_summary(self.base_dir, self.shard, report.counts(), started_at,
+                          self.last_duration)
+            return report
+
+    def _sync_locked(self, colleagues, only_files, vpa, rewrite_vpa, horizon) -> RunReport:
+        # Gezielte Läufe (API, Watcher) laufen am Journal vorbei
+        journal = self.journal if colleagues is None else None
+        if colleagues is None:
+            colleagues = self.app_config.colleagues
+        if self.shard:
+            colleagues = self.shard.select(colleagues)
+        report = RunReport()
+        if self.pruner:
+            # Das Löschbudget gilt pro Lauf, nicht pro Prozess
+            self.pruner.start_run()
+
+        if journal:
+            only_files = journal.begin(self._input_fingerprint(horizon), only_files)
+            finished = [c for c in colleagues if journal.is_done(c.name)]
+            if finished:
+                logger.info("Überspringe %d bereits fertige Kollegen.", len(finished))
+                colleagues = [c for c in colleagues if not journal.is_done(c.name)]
+
+        cpu_count = os.cpu_count() or 1
+        workers = max(1, math.floor(cpu_count * 0.5))
+        logger.debug("CPUs: %d, Threads: %d", cpu_count, workers)
+
+        if colleagues:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Erst alle einlesen (ohne Kalenderzugriff), dann nach Priorität
+                # einreihen (FIFO): im letzten Lauf liegen gebliebene und Kollegen
+                # mit geänderten Tagen zuerst, darunter der nächstliegende Tag;
+                # die übrigen nach erwarteter Laufzeit, längste zuerst
+                # (scheduling.py).
+                plans = [
+                    p for p in self._plan(executor, colleagues, only_files, horizon, report,
+                                          journal)
+                    if p.files
+                ]
+                plans, expected = schedule(plans, self.durations)
+                changed = sum(1 for p in plans if p.priority[0] <= 0)
+                logger.info("Verarbeite %d Kollegen (%d mit Änderungen)...", len(plans), changed)
+
+                deadline = Deadline(self.app_config.run_deadline, label="Lauf")
+                futures = {
+                    executor.submit(
+                        process_colleague,
+                        self.app_config, p.colleague, self.laufzettel_mgr, self.holidays,
+                        self.plans_folder, only_files, self.roster, self.pool,
+                        self.pruner, self.mail_queue, self.dependencies, horizon, p, journal,
+                        deadline,
+                    ): p
+                    for p in plans
+                }
+                pending = set(futures)
+                try:
+                    for future in as_completed(futures, timeout=deadline.remaining()):
+                        pending.discard(future)
+                        self._collect(future, futures[future], report, journal)
+                except FuturesTimeout:
+                    # Nicht begonnene Kollegen abbrechen; laufende halten an ihrem
+                    # Zeitbudget an (höchstens die Restzeit des Laufs, also jetzt)
+                    cancelled = [f for f in pending if f.cancel()]
+                    logger.error(
+                        "Zeitlimit des Laufs erreicht – %d Kollegen nicht begonnen, "
+                        "%d werden angehalten.", len(cancelled), len(pending) - len(cancelled),
+                    )
+                    for future in as_completed(pending - set(cancelled)):
+                        self._collect(future, futures[future], report, journal)
+                    for future in cancelled:
+                        plan = futures[future]
+                        self._collect_result(ColleagueResult(
+                            plan.colleague.name, timed_out=True, deferred_files=list(plan.files),
+                        ), plan, report, journal)
+
+            if plans or report.failed:
+                self.dependencies.save()
+                self.durations.save()
+                log_durations(report.results, expected)
+                timed_out = [r.name for r in report.results if r.timed_out]
+                if timed_out:
+                    logger.warning("Zeitlimit bei %s – der Rest folgt vorrangig im nächsten Lauf.",
+                                   ", ".join(sorted(timed_out)))
+                logger.info("Laufbericht: %s", report.summary)
+
+        if self.pruner and self.pruner.deleted:
+            logger.info("Aufbewahrung: %d alte Termine gelöscht.", self.pruner.deleted)
+
+        if journal:
+            journal.finish()
+
+        if vpa:
+            self.run_vpa_stage(rewrite=rewrite_vpa, horizon=horizon)
+        return report
+
+    def _plan(self, executor, colleagues, only_files, horizon, report,
+              journal=None) -> List[ColleaguePlan]:
+        """Liest die Wochen aller Kollegen parallel ein (Reihenfolge bleibt erhalten).
+
+        Im letzten Lauf liegen gebliebene Wochen (``journal``) kommen für den
+        jeweiligen Kollegen hinzu.
+        """
+        futures = []
+        for c in colleagues:
+            deferred = journal.deferred_files(c.name) if journal else []
+            files = only_files
+            if deferred and only_files is not None:
+                files = only_files + [f for f in deferred if f not in only_files]
+            futures.append((c.name, bool(deferred), executor.submit(
+                plan_colleague,
+                self.app_config, c, self.laufzettel_mgr, self.holidays,
+                self.plans_folder, files, self.roster, self.dependencies, horizon,
+            )))
+        plans = []
+        for name, deferred, future in futures:
+            try:
+                plan = future.result()
+            except Exception as e:
+                report.failed += 1
+                logger.error("Fehler beim Einlesen für %s: %s", name, e, exc_info=True)
+                continue
+            plan.deferred = deferred
+            plans.append(plan)
+        return plans
+
+    def _collect(self, future, plan: ColleaguePlan, report: RunReport, journal):
+        try:
+            result = future.result()
+        except Exception as e:
+            report.failed += 1
+            logger.error("Fehler bei %s: %s", plan.colleague.name, e, exc_info=True)
+            return
+        self._collect_result(result, plan, report, journal)
+
+    def _collect_result(self, result: ColleagueResult, plan: ColleaguePlan,
+                        report: RunReport, journal):
+        """Übernimmt das Ergebnis eines Kollegen in Bericht, Laufzeiten und Journal."""
+        report.add(result)
+        if result.timed_out:
+            if journal:
+                journal.defer(result.name, result.deferred_files)
+        elif result.connected:
+            self.durations.record(result.name, result.seconds, len(plan.files))
+            if journal:
+                journal.complete(result.name)
+
+    # --- Gruppenkalender ---
+
+    def run_vpa_stage(self, rewrite: bool = False, horizon: Optional[Horizon] = None):
+        """Aktualisiert den Gruppenkalender VPA mit den Ressourcen der Hauptverarbeitung.
+
+        Nutzt die bereits eingelesenen Dateien aus dem Roster (nur die Wochen
+        des Horizonts), den Laufzettel, die Feiertage und eine Verbindung aus
+        dem Pool. Fehler werden protokolliert, brechen aber den Lauf nicht ab.
+
+        Args:
+            horizon: Verarbeitungsfenster des Laufs (``--since``/``--until``);
+                die ``vpa_days`` Tage ab heute werden darauf beschnitten.
+        """
+        heute = datetime.date.today()
+        start, days = _vpa_window(heute, self.vpa_days, horizon)
+        if days <= 0:
+            logger.info("Gruppenkalender: Verarbeitungsfenster liegt außerhalb des "
+                        "VPA-Horizonts, keine Aktualisierung.")
+            return
+        holiday_name = holiday_skip_reason(self.holidays, days, start)
+        # Wie GruppeVPA.py: bis 2 Uhr trotzdem aktualisieren (Vortag abschließen)
+        if holiday_name and start == heute and time.localtime().tm_hour > 2:
+            logger.info("Gruppenkalender: %s ist %s, keine Aktualisierung.",
+                        heute.strftime("%d.%m.%Y"), holiday_name)
+            self._save_vpa_state(heute)
+            return
+
+        deadline = Deadline(RUN_DEADLINE, label="VPA")
+        target_dates = relevant_dates(days, start)
+        schichten = load_schichten(self.base_dir)
+
+        try:
+            with Timer("Gruppenkalender VPA", log_threshold_seconds=5):
+                shifts = []
+                for file_path in get_sorted_excel_files(self.plans_folder):
+                    if week_overlaps(file_path, min(target_dates), max(target_dates)):
+                        deadline.check("Excel-Auswertung")
+                        shifts.extend(shifts_from_sheet(
+                            self.roster.sheet(file_path), target_dates, schichten,
+                            self.laufzettel_mgr, self.holidays,
+                        ))
+
+                with self.pool.lease("ard") as conn:
+                    calendar = find_group_calendar(conn.principal)
+                    if not calendar:
+                        return
+                    update_group_calendar(calendar, shifts, days, rewrite, deadline, start=start)
+        except DeadlineExceeded as e:
+            logger.error("Gruppenkalender: Zeitlimit überschritten beim Schritt '%s'.", e.step)
+            return
+        except Exception as e:
+            logger.error("Fehler beim Gruppenkalender VPA: %s", e)
+            return
+
+        if start == heute:
+            self._save_vpa_state(heute)
+
+    def vpa_due_today(self) -> bool:
+        return vpa_due_today(self.base_dir)
+
+    def _save_vpa_state(self, day: datetime.date):
+        save_json_state(os.path.join(self.base_dir, VPA_STATE_FILENAME),
+                        {"last_run": day.isoformat()})
+
+
+def _vpa_window(
+    today: datetime.date, days: int, horizon: Optional[Horizon],
+) -> Tuple[datetime.date, int]:
+    """Beginn und Länge des VPA-Fensters: ``days`` Tage ab heute, beschnitten auf ``horizon``.
+
+    Beginnt der Horizont erst nach heute (``--since`` in der Zukunft), beginnt
+    auch das Fenster dort. Länge <= 0 heißt: keine Überschneidung.
+    """
+    if horizon is None:
+        return today, days
+    start = max(today, horizon.since)
+    end = min(start + datetime.timedelta(days=days - 1), horizon.until)
+    return start, (end - start).days + 1
+
+
+def vpa_due_today(base_dir: str) -> bool:
+    """True, wenn der Gruppenkalender heute noch nicht aktualisiert wurde.
+
+    Der Horizont (heute+morgen) verschiebt sich täglich, auch ohne neue
+    Dienstpläne; dann muss die Stufe einmal pro Tag trotzdem laufen.
+    """
+    last_run = load_json_state(os.path.join(base_dir, VPA_STATE_FILENAME)).get("last_run")
+    return last_run != datetime.date.today().isoformat()
+
+
+def _files_stamp(paths: List[str]) -> tuple:
+    """Größe und Änderungszeit mehrerer Dateien (fehlende als None)."""
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
@@ -0,0 +1,137 @@
+"""Aufteilung der Kollegen auf mehrere Prozesse oder Rechner (``--shard i/N``).
+
+Jeder Kollege gehört anhand eines stabilen Hashes seines Namens (SHA-1,
+unabhängig von Rechner und Python-Version) zu genau einem von N Shards.
+Damit sich die Shards nicht in die Quere kommen:
+
+- Jeder Shard führt eigene Zustandsdateien (``deps_state.shard1of2.json``
+  usw.) und meldet sich beim Download als eigener Verbraucher an. Der
+  Download selbst ist über ``Plaene.lock`` serialisiert.
+- Den Gruppenkalender VPA aktualisiert nur Shard 1.
+- Jeder Shard schreibt nach jedem Lauf eine eigene Zusammenfassung
+  (``run_summary.shard1of2.json``); ``main.py --merge-summaries`` fasst sie
+  zusammen.
+
+Ändert sich N, verteilen sich die Kollegen neu; die Zustandsdateien der
+neuen Shards beginnen dann leer.
+"""
+
+import datetime
+import glob
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from config import ColleagueConfig
+from utils import load_json_state, save_json_state
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILENAME = "run_summary.json"
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Ein Teil von ``count`` Teilen (``index`` beginnt bei 1).
+
+    Verwendung:
+        shard = Shard.parse("1/2")
+        colleagues = shard.select(app_config.colleagues)
+        path = state_path(BASE_DIR, "deps_state.json", shard)
+    """
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> "Shard":
+        """Liest ``"i/N"``; ValueError bei ungültiger Angabe."""
+        try:
+            index, count = (int(part) for part in text.split("/"))
+        except ValueError:
+            raise ValueError(f"Ungültiger Shard: {text!r} (erwartet i/N, z.B. 1/2)")
+        if not 1 <= index <= count:
+            raise ValueError(f"Ungültiger Shard: {text!r} (1 <= i <= N)")
+        return cls(index, count)
+
+    @property
+    def label(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @property
+    def suffix(self) -> str:
+        """Namenszusatz für Zustandsdateien und Download-Verbraucher."""
+        return f"shard{self.index}of{self.count}"
+
+    @property
+    def primary(self) -> bool:
+        """Der erste Shard übernimmt Aufgaben, die nur einmal laufen dürfen (VPA)."""
+        return self.index == 1
+
+    def owns(self, name: str) -> bool:
+        digest = hashlib.sha1(name.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.count == self.index - 1
+
+    def select(self, colleagues: List[ColleagueConfig]) -> List[ColleagueConfig]:
+        return [c for c in colleagues if self.owns(c.name)]
+
+
+def state_path(base_dir: str, filename: str, shard: Optional[Shard] = None) -> str:
+    """Pfad einer Zustandsdatei, mit Shard-Zusatz vor der Endung."""
+    if shard is None:
+        return os.path.join(base_dir, filename)
+    stem, ext = os.path.splitext(filename)
+    return os.path.join(base_dir, f"{stem}.{shard.suffix}{ext}")
+
+
+def download_consumer(shard: Optional[Shard], consumer: str = "main") -> str:
+    """Verbrauchername beim Download: jeder Shard bekommt seine eigenen Änderungen."""
+    return f"{consumer}-{shard.suffix}" if shard else consumer
+
+
+def write_summary(
+    base_dir: str,
+    shard: Optional[Shard],
+    counts: Dict[str, int],
+    started: datetime.datetime,
+    duration: float,
+):
+    """Schreibt die Zusammenfassung des letzten Laufs dieses Shards."""
+    save_json_state(state_path(base_dir, SUMMARY_FILENAME, shard), {
+        "shard": shard.label if shard else None,
+        "started": started.isoformat(timespec="seconds"),
+        "duration_seconds": round(duration, 2),
+        "counts": counts,
+    })
+
+
+def load_summaries(folder: str) -> List[dict]:
+    """Liest alle Shard-Zusammenfassungen eines Ordners (nach Shard sortiert)."""
+    stem, ext = os.path.splitext(SUMMARY_FILENAME)
+    summaries = [
+        load_json_state(path)
+        for path in glob.glob(os.path.join(folder, f"{stem}.shard*{ext}"))
+    ]
+    summaries = [s for s in summaries if s.get("shard")]
+    return sorted(summaries, key=lambda s: Shard.parse(s["shard"]).index)
+
+
+def merge_summaries(summaries: List[dict]) -> Dict[str, int]:
+    """Summiert die Zähler; warnt bei fehlenden oder widersprüchlichen Shards."""
+    shards = [Shard.parse(s["shard"]) for s in summaries]
+    counts = {shard.count for shard in shards}
+    if len(counts) > 1:
+        logger.warning("Zusammenfassungen mit unterschiedlicher Shard-Anzahl: %s",
+                       ", ".join(sorted(shard.label for shard in shards)))
+    elif counts:
+        missing = set(range(1, counts.pop() + 1)) - {shard.index for shard in shards}
+        if missing:
+            logger.warning("Zusammenfassung fehlt für Shard %s.",
+                           ", ".join(str(i) for i in sorted(missing)))
+
+    merged: Dict[str, int] = {}
+    for summary in summaries:
+        for name, value in summary.get("counts", {}).items():
+            merged[name] = merged.get(name, 0) + int(value)
+    return merged
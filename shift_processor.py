@@ -6,24 +6,42 @@ keine Seiteneffekte außer CalDAV-Operationen.
 
 import datetime
 import logging
+import os
 import re
-from typing import List, Optional, Tuple
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 import pytz
 
-from calendar_client import CalendarClient, get_event_details
+from calendar_client import (
+    CalendarClient,
+    DAVConnectionPool,
+    get_all_day_range,
+    get_event_details,
+)
+from cleaner import RetentionPruner
 from config import AppConfig, ColleagueConfig
+from dependencies import DependencyTracker, files_for_dates
 from event_builder import (
     ABSENCE_TYPES,
+    ChangeKind,
+    ChangeRecord,
     build_event_description,
     build_ical_event,
-    format_event_log,
 )
-from excel_parser import ShiftEntry, get_sorted_excel_files, parse_excel_file
+from excel_parser import (
+    Horizon,
+    Roster,
+    ShiftEntry,
+    get_sorted_excel_files,
+    parse_excel_file,
+)
 from holidays_de import GermanHolidays
+from journal import RunJournal
 from laufzettel import LaufzettelManager, ShiftInfo
-from notifier import build_night_shift_summary, send_notification
-from utils import Timer
+from notifier import MailQueue, build_night_shift_summary, send_notification
+from utils import Deadline, Timer, extract_date_from_filename
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +49,176 @@ TZ_BERLIN = pytz.timezone("Europe/Berlin")
 LOCATION_ADDRESS = r"Hugh-Greene-Weg 1\, 22529 Hamburg"
 
 
+@dataclass
+class ColleagueResult:
+    """Ergebnis der Verarbeitung eines Kollegen."""
+    name: str
+    connected: bool = True
+    changes: List[ChangeRecord] = field(default_factory=list)
+    deleted: int = 0
+    seconds: float = 0.0       # Laufzeit inkl. Verbindungsaufbau
+    timed_out: bool = False    # Zeitbudget aufgebraucht, Rest im nächsten Lauf
+    deferred_files: List[str] = field(default_factory=list)   # liegen gebliebene Wochen
+
+
+_REPORT_COUNTS = ("colleagues", "unreachable", "failed", "timed_out", "shifts", "all_day",
+                  "night_shifts", "deleted")
+
+
+@dataclass
+class RunReport:
+    """Zusammenfassung eines Laufs über alle Kollegen."""
+    colleagues: int = 0
+    unreachable: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    shifts: int = 0
+    all_day: int = 0
+    night_shifts: int = 0
+    deleted: int = 0
+    results: List[ColleagueResult] = field(default_factory=list)
+
+    def counts(self) -> Dict[str, int]:
+        """Die Zähler ohne Einzelergebnisse (z.B. für Shard-Zusammenfassungen)."""
+        return {name: getattr(self, name) for name in _REPORT_COUNTS}
+
+    @classmethod
+    def from_counts(cls, counts: Dict[str, int]) -> "RunReport":
+        return cls(**{name: int(counts.get(name, 0)) for name in _REPORT_COUNTS})
+
+    def add(self, result: ColleagueResult):
+        self.results.append(result)
+        self.colleagues += 1
+        if not result.connected:
+            self.unreachable += 1
+        if result.timed_out:
+            self.timed_out += 1
+        self.deleted += result.deleted
+        for change in result.changes:
+            if change.kind == ChangeKind.SHIFT:
+                self.shifts += 1
+                if change.is_night_shift:
+                    self.night_shifts += 1
+            else:
+                self.all_day += 1
+
+    @property
+    def summary(self) -> str:
+        return (
+            f"{self.colleagues + self.failed} Kollegen ({self.unreachable} nicht erreichbar, "
+            f"{self.failed} mit Fehler, {self.timed_out} mit Zeitlimit): {self.shifts} Dienste "
+            f"(davon {self.night_shifts} Nacht), {self.all_day} ganztägig eingetragen, "
+            f"{self.deleted} Termine gelöscht."
+        )
+
+
+@dataclass
+class ColleaguePlan:
+    """Die für einen Kollegen einzulesenden Wochen, ermittelt ohne Kalenderzugriff.
+
+    Bestimmt die Reihenfolge der Verarbeitung: im letzten Lauf aus
+    Zeitgründen liegen gebliebene Kollegen zuerst, dann Kollegen mit
+    geänderten Tagen vor solchen ohne, jeweils der mit dem nächstliegenden
+    geänderten Tag zuerst.
+    """
+    colleague: ColleagueConfig
+    files: List[str] = field(default_factory=list)
+    weeks: List[Tuple[List[ShiftEntry], bool]] = field(default_factory=list)  # (Einträge, Nutzer gefunden)
+    rewrite_dates: Set[datetime.date] = field(default_factory=set)   # veraltete Abhängigkeiten
+    changed_dates: Set[datetime.date] = field(default_factory=set)   # geänderte Zellen
+    deferred: bool = False     # im letzten Lauf wegen Zeitlimit verschoben
+
+    @property
+    def priority(self) -> Tuple[int, Tuple[int, int]]:
+        """Sortierschlüssel (kleiner = früher)."""
+        dates = self.changed_dates | self.rewrite_dates
+        nearest = min((date_priority(day) for day in dates), default=(0, 0))
+        if self.deferred:
+            return -1, nearest
+        if not dates:
+            return 1, (0, 0)
+        return 0, nearest
+
+
+def date_priority(day: datetime.date, today: Optional[datetime.date] = None) -> Tuple[int, int]:
+    """Sortierschlüssel für Tage: ab heute aufsteigend, danach die vergangenen rückwärts."""
+    today = today or datetime.date.today()
+    if day >= today:
+        return 0, (day - today).days
+    return 1, (today - day).days
+
+
+def plan_colleague(
+    app_config: AppConfig,
+    colleague: ColleagueConfig,
+    laufzettel_mgr: LaufzettelManager,
+    holidays: GermanHolidays,
+    plans_folder: str,
+    only_files: Optional[List[str]] = None,
+    roster: Optional[Roster] = None,
+    dependencies: Optional[DependencyTracker] = None,
+    horizon: Optional[Horizon] = None,
+) -> ColleaguePlan:
+    """Wählt die Wochen eines Kollegen aus und liest seine Einträge ein.
+
+    Braucht keine Kalenderverbindung; so kann vor dem ersten CalDAV-Zugriff
+    entschieden werden, welche Kollegen zuerst an der Reihe sind.
+    Argumente wie bei ``process_colleague``.
+    """
+    name = colleague.name
+    plan = ColleaguePlan(colleague)
+
+    # Tage, deren Laufzettel, Feiertagsstatus oder Optionen sich seit dem
+    # letzten Schreiben geändert haben, werden gezielt neu geschrieben
+    if dependencies:
+        plan.rewrite_dates = dependencies.stale_dates(
+            colleague, laufzettel_mgr, holidays,
+            since=horizon.since if horizon else None,
+            until=horizon.until if horizon else None,
+        )
+        if plan.rewrite_dates:
+            logger.info(
+                "%s: %d Tage mit geänderten Abhängigkeiten werden neu geschrieben.",
+                name, len(plan.rewrite_dates),
+            )
+
+    xlsx_files = get_sorted_excel_files(plans_folder, horizon)
+    if only_files is not None:
+        wanted = {os.path.normpath(f) for f in only_files}
+        wanted.update(os.path.normpath(f) for f in files_for_dates(xlsx_files, plan.rewrite_dates))
+        xlsx_files = [f for f in xlsx_files if os.path.normpath(f) in wanted]
+
+    cells: Dict[datetime.date, str] = {}
+    for file_path in xlsx_files:
+        entries, user_found = parse_excel_file(file_path, name, roster=roster)
+        if not user_found and colleague.only_shifts:
+            continue  # Im only_shifts-Modus nichts löschen
+        plan.files.append(file_path)
+        plan.weeks.append((entries, user_found))
+        cells.update((e.date.date(), e.raw_text) for e in entries)
+
+    if dependencies:
+        plan.changed_dates = dependencies.changed_dates(name, cells)
+    return plan
+
+
 def process_colleague(
     app_config: AppConfig,
     colleague: ColleagueConfig,
     laufzettel_mgr: LaufzettelManager,
     holidays: GermanHolidays,
     plans_folder: str,
-):
+    only_files: Optional[List[str]] = None,
+    roster: Optional[Roster] = None,
+    pool: Optional[DAVConnectionPool] = None,
+    pruner: Optional[RetentionPruner] = None,
+    mail_queue: Optional[MailQueue] = None,
+    dependencies: Optional[DependencyTracker] = None,
+    horizon: Optional[Horizon] = None,
+    plan: Optional[ColleaguePlan] = None,
+    journal: Optional[RunJournal] = None,
+    deadline: Optional[Deadline] = None,
+) -> ColleagueResult:
     """Verarbeitet alle Dienstpläne für einen einzelnen Kollegen.
 
     Dies ist die Hauptfunktion, die pro Kollege aufgerufen wird (ggf. parallel).
@@ -49,77 +230,238 @@ def process_colleague(
         laufzettel_mgr: Geteilter Laufzettel-Manager (thread-safe für Lesezugriffe)
         holidays: Geteilte Feiertags-Instanz (thread-safe, read-only)
         plans_folder: Ordner mit den Excel-Dateien
+        only_files: Optional nur diese Dateien verarbeiten (z.B. geänderte Wochen)
+        roster: Optional geteilter Cache der eingelesenen Excel-Dateien
+        pool: Optional geteilter CalDAV-Verbindungspool
+        pruner: Optional Aufbewahrungsregel; löscht nach der Verarbeitung
+            alte Termine über dieselbe Verbindung
+        mail_queue: Optional Mail-Warteschlange; Benachrichtigungen werden
+            dann im Hintergrund verschickt statt im Kollegen-Thread
+        dependencies: Optional Abhängigkeitsverfolgung; Tage mit geändertem
+            Laufzettel, Feiertagsstatus oder geänderten Optionen werden
+            (auch außerhalb von ``only_files``) neu geschrieben
+        horizon: Optional Verarbeitungsfenster; nur Wochen darin werden
+            eingelesen und nur dieser Zeitraum aus dem Kalender geladen
+            (Standard: alle Dateien, aktuelles Jahr bis +90 Tage)
+        plan: Optional bereits mit ``plan_colleague`` ermittelte Wochen
+        journal: Optional Laufjournal; bereits geschriebene Tage eines
+            unterbrochenen Laufs werden übersprungen, neue vermerkt
+        deadline: Optional Deadline des gesamten Laufs. Ist sie oder das
+            Zeitbudget des Kollegen (``colleague_budget``) abgelaufen, werden
+            die restlichen Tage nicht mehr geschrieben, sondern als
+            ``deferred_files`` gemeldet.
+
+    Returns:
+        ColleagueResult mit den neu eingetragenen Terminen.
     """
     name = colleague.name
+    result = ColleagueResult(name)
+    started = time.monotonic()
+
+    if plan is None:
+        plan = plan_colleague(
+            app_config, colleague, laufzettel_mgr, holidays, plans_folder,
+            only_files, roster, dependencies, horizon,
+        )
+    if not plan.files:
+        logger.debug("%s: Keine Excel-Dateien gefunden.", name)
+        return result
+
+    budget = _colleague_budget(app_config, name, deadline)
+    if budget.expired:
+        result.timed_out = True
+        result.deferred_files = list(plan.files)
+        return result
 
     # 1. CalDAV-Verbindung aufbauen
     with Timer(f"CalDAV {name}", log_threshold_seconds=5):
-        client = CalendarClient(app_config, colleague)
+        client = CalendarClient(app_config, colleague, pool)
         if not client.connect():
             logger.error("Kalender für %s nicht erreichbar – überspringe.", name)
-            return
+            result.connected = False
+            return result
 
-    # 2. Cache laden (aktuelles Jahr bis +90 Tage)
-    current_year = datetime.date.today().year
-    cache_start = datetime.datetime(current_year, 1, 1, 0, 0)
-    cache_end = datetime.datetime.now() + datetime.timedelta(days=90)
-    client.load_cache(cache_start, cache_end)
+    try:
+        result.changes, deferred = _process_with_client(
+            app_config, client, plan, laufzettel_mgr, holidays,
+            mail_queue, dependencies, horizon, journal, budget,
+        )
+        if deferred:
+            result.timed_out = True
+            result.deferred_files = files_for_dates(plan.files, deferred)
+            logger.warning(
+                "%s: Zeitbudget aufgebraucht – %d Tage in %d Wochen folgen im nächsten Lauf.",
+                name, len(deferred), len(result.deferred_files),
+            )
+        elif pruner:
+            pruner.prune(client, name)
+        result.deleted = client.deleted_count
+    finally:
+        client.close()
+    result.seconds = time.monotonic() - started
+    return result
 
-    # 3. Excel-Dateien verarbeiten
-    xlsx_files = get_sorted_excel_files(plans_folder)
-    if not xlsx_files:
-        logger.debug("%s: Keine Excel-Dateien gefunden.", name)
-        return
 
-    new_entries: List[str] = []   # Für E-Mail-Benachrichtigung
-    night_shift_count = 0
-    night_shift_counting_started = False
+def _process_with_client(
+    app_config: AppConfig,
+    client: CalendarClient,
+    plan: ColleaguePlan,
+    laufzettel_mgr: LaufzettelManager,
+    holidays: GermanHolidays,
+    mail_queue: Optional[MailQueue],
+    dependencies: Optional[DependencyTracker] = None,
+    horizon: Optional[Horizon] = None,
+    journal: Optional[RunJournal] = None,
+    budget: Optional[Deadline] = None,
+) -> Tuple[List[ChangeRecord], Set[datetime.date]]:
+    """Schritte 2–4 von ``process_colleague`` mit bereits verbundenem Client.
 
-    for file_path in xlsx_files:
-        entries, user_found = parse_excel_file(file_path, name)
+    Returns:
+        (neue Termine, wegen abgelaufenem ``budget`` nicht verarbeitete Tage)
+    """
+    colleague = plan.colleague
+    name = colleague.name
+
+    def applied(day: datetime.date):
+        if journal:
+            journal.record_day(name, day)
 
-        if not user_found and not colleague.only_shifts:
-            # Benutzer nicht im Plan → vorhandene Termine für diese Woche löschen
-            _delete_entries_for_dates(client, entries)
+    # 2. Cache laden (Verarbeitungsfenster bzw. aktuelles Jahr bis +90 Tage)
+    current_year = datetime.date.today().year
+    cache_start, cache_end = _cache_window(plan.files, horizon)
+    client.load_cache(cache_start, cache_end)
+    night_shifts = NightShiftCounter(client, cache_start.date())
+    night_numbers = _number_night_shifts(plan, night_shifts)
+
+    # 3. Tage verarbeiten, die nächstliegenden zuerst (die Nachtschicht-
+    # Nummern stehen bereits fest, die Reihenfolge ist daher frei)
+    new_entries: List[ChangeRecord] = []   # Für E-Mail-Benachrichtigung und Laufbericht
+
+    # Abwesenheiten zusammenfassen: erst alle Tage sammeln, dann in einem
+    # Abgleich als mehrtägige Termine schreiben
+    merge = colleague.merge_absences and not colleague.only_shifts
+    absence_window: Set[datetime.date] = set()
+    absence_targets: Dict[datetime.date, str] = {}
+    processed: Set[datetime.date] = set()
+    deferred: Set[datetime.date] = set()
+
+    # Im unterbrochenen Lauf bereits geschriebene Tage
+    skip = journal.applied_dates(name) if journal else set()
+    if skip:
+        logger.info("%s: %d Tage bereits im unterbrochenen Lauf geschrieben.", name, len(skip))
+
+    work = [(entry, user_found) for entries, user_found in plan.weeks for entry in entries]
+    work.sort(key=lambda item: date_priority(item[0].date.date()))
+
+    for entry, user_found in work:
+        day = entry.date.date()
+        processed.add(day)
+        if day in skip:
+            continue
+        if budget and budget.expired:
+            deferred.add(day)
             continue
 
         if not user_found:
-            continue  # Im only_shifts-Modus nichts löschen
+            # Benutzer nicht im Plan → vorhandene Termine an diesem Tag löschen
+            _delete_entries_for_dates(client, [entry], keep_all_day=merge)
+            absence_window.add(day)
+            if dependencies:
+                dependencies.record(colleague, day, entry.raw_text)
+            if not merge:
+                applied(day)
+            continue
 
-        for entry in entries:
-            if entry.is_timed:
-                result = _process_timed_entry(
-                    client=client,
-                    entry=entry,
-                    colleague=colleague,
-                    app_config=app_config,
-                    laufzettel_mgr=laufzettel_mgr,
-                    holidays=holidays,
-                    night_shift_count=night_shift_count,
-                    counting_started=night_shift_counting_started,
-                )
-                if result:
-                    log_text, night_shift_count, night_shift_counting_started = result
-                    if log_text:
-                        new_entries.append(log_text)
-            else:
-                log_text = _process_allday_entry(
-                    client=client,
-                    entry=entry,
-                    colleague=colleague,
-                    app_config=app_config,
-                )
-                if log_text:
-                    new_entries.append(log_text)
+        if merge:
+            absence_window.add(day)
+            if not entry.is_timed:
+                title = _allday_title(entry)
+                if not _should_skip_entry(title, colleague, app_config):
+                    absence_targets[day] = title
+                if dependencies:
+                    dependencies.record(colleague, day, entry.raw_text)
+                continue
+
+        if entry.is_timed:
+            ok, change = _process_timed_entry(
+                client=client,
+                entry=entry,
+                colleague=colleague,
+                app_config=app_config,
+                laufzettel_mgr=laufzettel_mgr,
+                holidays=holidays,
+                night_number=night_numbers.get(id(entry)),
+                rewrite=colleague.rewrite or day in plan.rewrite_dates,
+            )
+            if change:
+                new_entries.append(change)
+            if ok and dependencies:
+                dependencies.record(colleague, day, entry.raw_text, laufzettel_mgr, holidays)
+            if ok:
+                applied(day)
+        else:
+            change = _process_allday_entry(
+                client=client,
+                entry=entry,
+                colleague=colleague,
+                app_config=app_config,
+            )
+            if change:
+                new_entries.append(change)
+            if dependencies:
+                dependencies.record(colleague, day, entry.raw_text)
+            applied(day)
+
+    if merge and absence_window:
+        new_entries.extend(_sync_absence_ranges(
+            client, colleague, app_config, absence_window, absence_targets,
+        ))
+        for day in absence_window:
+            applied(day)
+
+    if dependencies:
+        # Veraltete Tage außerhalb der eingelesenen Wochen hängen von nichts mehr ab
+        dependencies.forget(name, plan.rewrite_dates - processed)
 
     # 4. Benachrichtigung senden
     if new_entries:
+        new_entries.sort(key=lambda change: change.date)
         logger.info("%s: %d neue Termine eingetragen.", name, len(new_entries))
         if colleague.send_notification:
-            night_summary = _get_night_shift_summary(client, current_year)
-            send_notification(app_config, name, new_entries, night_summary)
+            night_summary = _get_night_shift_summary(night_shifts, current_year)
+            send_notification(app_config, name, new_entries, night_summary, mail_queue)
     """else:
         logger.debug("%s: Keine neuen Termine.", name)"""
+    return new_entries, deferred
+
+
+def _number_night_shifts(plan: ColleaguePlan, night_shifts: "NightShiftCounter") -> Dict[int, int]:
+    """Nummeriert die Nachtschichten des Plans chronologisch (id(entry) → Nummer).
+
+    Nummer = Nachtschichten des Jahres vor dem Tag, die außerhalb der
+    eingelesenen Wochen im Kalender stehen, plus die geplanten davor.
+    Damit hängt sie nicht von der Reihenfolge ab, in der die Tage danach
+    geschrieben werden.
+    """
+    covered = {entry.date.date() for entries, _ in plan.weeks for entry in entries}
+    nights = sorted(
+        (entry for entries, user_found in plan.weeks if user_found
+         for entry in entries if _is_night_entry(entry)),
+        key=lambda entry: (entry.date, entry.start_time),
+    )
+    numbers: Dict[int, int] = {}
+    planned: Dict[int, int] = {}
+    for entry in nights:
+        day = entry.date.date()
+        before = planned.get(day.year, 0)
+        numbers[id(entry)] = night_shifts.before(day, exclude=covered) + before + 1
+        planned[day.year] = before + 1
+    return numbers
+
+
+def _is_night_entry(entry: ShiftEntry) -> bool:
+    """Zeitgebundener Dienst mit Beginn ab 20:00."""
+    return entry.is_timed and entry.start_time is not None and entry.start_time >= "20:00"
 
 
 # ---------------------------------------------------------------------------
@@ -133,14 +475,18 @@ def _process_timed_entry(
     app_config: AppConfig,
     laufzettel_mgr: LaufzettelManager,
     holidays: GermanHolidays,
-    night_shift_count: int,
-    counting_started: bool,
-) -> Optional[Tuple[Optional[str], int, bool]]:
+    night_number: Optional[int] = None,
+    rewrite: bool = False,
+) -> Tuple[bool, Optional[ChangeRecord]]:
     """Verarbeitet einen zeitgebundenen Dienst.
 
+    ``night_number`` ist bei Nachtschichten die laufende Nummer im Jahr
+    (siehe ``_number_night_shifts``). Mit ``rewrite`` wird ein vorhandener
+    Termin an diesem Tag auch bei gleichem Titel gelöscht und neu
+    geschrieben (z.B. nach Laufzettel-Änderung).
+
     Returns:
-        (log_text_or_None, updated_night_shift_count, counting_started)
-        oder None bei Fehler
+        (erfolgreich, change_record_or_None)
     """
     try:
         start_dt = datetime.datetime.strptime(
@@ -183,17 +529,13 @@ def _process_timed_entry(
                 else entry.shift_name
             )
 
-        # Nachtschicht-Zählung (Dienste ab 20:00)
-        if start_dt.time() >= datetime.time(20, 0):
-            if not counting_started or entry.date.month in (1, 2, 3, 4):
-                night_shift_count = _count_night_shifts_from_cache(client, entry.date)
-                counting_started = True
-            night_shift_count += 1
-            full_title += f" ({night_shift_count})"
+        # Nachtschicht-Nummer (Dienste ab 20:00)
+        if night_number is not None:
+            full_title += f" ({night_number})"
 
         # Duplikat-Check & Konflikt-Lösung
         if _should_skip_entry(full_title, colleague, app_config):
-            return None, night_shift_count, counting_started
+            return True, None
 
         existing = client.get_events_on_date(start_dt.date())
         event_exists = False
@@ -208,13 +550,17 @@ def _process_timed_entry(
                 client.delete_event(event)
                 continue
 
+            # Mehrtägige Abwesenheiten gleicht _sync_absence_ranges ab
+            if colleague.merge_absences and evt_start is None:
+                continue
+
             # Timezone-Normalisierung für Vergleich
             if evt_start and evt_start.tzinfo is None:
                 evt_start = TZ_BERLIN.localize(evt_start)
             if evt_end and evt_end.tzinfo is None:
                 evt_end = TZ_BERLIN.localize(evt_end)
 
-            if colleague.rewrite and evt_date == start_dt.date():
+            if rewrite and evt_date == start_dt.date():
                 client.delete_event(event)
                 continue
 
@@ -234,7 +580,7 @@ def _process_timed_entry(
                 client.delete_event(event)
 
         if event_exists:
-            return None, night_shift_count, counting_started
+            return True, None
 
         # Neues Event erstellen
         if not workplace:
@@ -251,15 +597,18 @@ def _process_timed_entry(
             location=location,
         )
         if client.add_event(ical_data):
-            log_text = format_event_log(start_dt, full_title, end_dt)
-            logger.info("[Dienst] %s: %s", colleague.name, log_text)
-            return log_text, night_shift_count, counting_started
+            change = ChangeRecord(
+                date=start_dt.date(), title=full_title, kind=ChangeKind.SHIFT,
+                start=start_dt, end=end_dt,
+            )
+            logger.info("[Dienst] %s: %s", colleague.name, change.log_text)
+            return True, change
 
-        return None, night_shift_count, counting_started
+        return False, None
 
     except Exception as e:
         logger.error("Fehler bei %s, %s: %s", colleague.name, entry.raw_text, e)
-        return None, night_shift_count, counting_started
+        return False, None
 
 
 # ---------------------------------------------------------------------------
@@ -271,8 +620,8 @@ def _process_allday_entry(
     entry: ShiftEntry,
     colleague: ColleagueConfig,
     app_config: AppConfig,
-) -> Optional[str]:
-    title = entry.raw_text.strip() or "Ganztägiger Termin"
+) -> Optional[ChangeRecord]:
+    title = _allday_title(entry)
     start_dt = entry.date
 
     if _should_skip_entry(title, colleague, app_config):
@@ -300,7 +649,7 @@ def _process_allday_entry(
 
             safe_title = title.replace("\n", " ").replace("\r", "").strip()
             safe_summary = summary.replace("\n", " ").replace("\r", "").strip()
-            if safe_summary == safe_title and evt_date_cmp == start_dt.date():
+            if safe_summary == safe_title and _covers(event, evt_date_cmp, start_dt.date()):
                 event_exists = True
                 break
 
@@ -316,9 +665,9 @@ def _process_allday_entry(
                 description=description
             )
             if client.add_event(ical_data):
-                log_text = format_event_log(start_dt, title)
-                logger.info("[Dienst] %s: %s", colleague.name, log_text)
-                return log_text
+                change = ChangeRecord(date=start_dt.date(), title=title, kind=ChangeKind.ALL_DAY)
+                logger.info("[Dienst] %s: %s", colleague.name, change.log_text)
+                return change
 
     except Exception as e:
         logger.error("Fehler bei ganztägigem Event '%s' am %s: %s", title, start_dt, e)
@@ -330,12 +679,32 @@ def _process_allday_entry(
 # Hilfsfunktionen
 # ---------------------------------------------------------------------------
 
-def _delete_entries_for_dates(client: CalendarClient, entries: List[ShiftEntry]):
-    """Löscht vorhandene Kalendereinträge für die Daten der übergebenen Einträge."""
+def _allday_title(entry: ShiftEntry) -> str:
+    return entry.raw_text.strip() or "Ganztägiger Termin"
+
+
+def _covers(event, evt_date: datetime.date, day: datetime.date) -> bool:
+    """Beginnt das Event an ``day`` bzw. deckt es als mehrtägiger Termin ``day`` ab?"""
+    if evt_date == day:
+        return True
+    day_range = get_all_day_range(event)
+    return day_range is not None and day_range[0] <= day <= day_range[1]
+
+
+def _delete_entries_for_dates(
+    client: CalendarClient, entries: List[ShiftEntry], keep_all_day: bool = False,
+):
+    """Löscht vorhandene Kalendereinträge für die Daten der übergebenen Einträge.
+
+    Mit ``keep_all_day`` bleiben ganztägige Termine stehen (die gleicht dann
+    ``_sync_absence_ranges`` ab, ohne Tage außerhalb der Woche zu verlieren).
+    """
     for entry in entries:
         existing = client.get_events_on_date(entry.date.date())
         for event in existing:
             try:
+                if keep_all_day and get_all_day_range(event) is not None:
+                    continue
                 summary, evt_date, _, _ = get_event_details(event)
                 logger.debug("Lösche '%s' vom %s (Nutzer nicht im Plan).", summary, evt_date)
                 client.delete_event(event)
@@ -343,6 +712,109 @@ def _delete_entries_for_dates(client: CalendarClient, entries: List[ShiftEntry])
                 logger.warning("Fehler beim Löschen: %s", e)
 
 
+def _sync_absence_ranges(
+    client: CalendarClient,
+    colleague: ColleagueConfig,
+    app_config: AppConfig,
+    window: Set[datetime.date],
+    targets: Dict[datetime.date, str],
+) -> List[ChangeRecord]:
+    """Gleicht ganztägige Termine als zusammenhängende Bereiche ab.
+
+    ``window`` sind alle verarbeiteten Tage, ``targets`` die Abwesenheiten
+    darin (Tag → Titel). Vorhandene ganztägige Termine, die das Fenster
+    berühren oder direkt angrenzen, behalten ihre Tage außerhalb des
+    Fensters; innerhalb gilt der Dienstplan. Aus dieser Soll-Belegung werden
+    Bereiche gleicher Titel gebildet: exakt vorhandene Bereiche bleiben
+    stehen, alle anderen berührten Termine werden gelöscht und die fehlenden
+    Bereiche neu angelegt. So werden Bereiche korrekt geteilt, verkürzt,
+    verlängert und verschmolzen.
+
+    Returns:
+        Änderungen (nur die tatsächlich neu belegten Tage je Bereich).
+    """
+    one_day = datetime.timedelta(days=1)
+    neighbours = {d + delta for d in window for delta in (-one_day, one_day)}
+
+    # Vorhandene ganztägige Termine einsammeln (mehrtägige stehen unter jedem Tag)
+    existing: List[Tuple[object, datetime.date, datetime.date, str]] = []
+    seen = set()
+    for day in sorted(window | neighbours):
+        for event in client.get_events_on_date(day):
+            if id(event) in seen:
+                continue
+            seen.add(id(event))
+            try:
+                day_range = get_all_day_range(event)
+                if day_range is None:
+                    continue
+                summary = get_event_details(event)[0]
+            except Exception:
+                continue
+            summary = summary.replace("\n", " ").replace("\r", "").strip()
+            existing.append((event, day_range[0], day_range[1], summary))
+
+    # Soll-Belegung: Dienstplan im Fenster, vorhandene Termine außerhalb
+    wanted: Dict[datetime.date, str] = dict(targets)
+    previous: Dict[datetime.date, str] = {}
+    obsolete = []
+    for event, first, last, summary in existing:
+        if _should_delete_event(summary, colleague, app_config):
+            obsolete.append(event)
+            continue
+        day = first
+        while day <= last:
+            previous.setdefault(day, summary)
+            if day not in window:
+                wanted.setdefault(day, summary)
+            day += one_day
+
+    # Bereiche aufeinanderfolgender Tage mit gleichem Titel
+    ranges: List[Tuple[datetime.date, datetime.date, str]] = []
+    for day in sorted(wanted):
+        title = wanted[day]
+        if ranges and ranges[-1][1] + one_day == day and ranges[-1][2] == title:
+            ranges[-1] = (ranges[-1][0], day, title)
+        else:
+            ranges.append((day, day, title))
+
+    kept = set()
+    dropped = {id(event) for event in obsolete}
+    for event, first, last, summary in existing:
+        if id(event) in dropped:
+            continue
+        key = (first, last, summary)
+        if not colleague.rewrite and key in ranges and key not in kept:
+            kept.add(key)
+        else:
+            obsolete.append(event)
+
+    for event in obsolete:
+        client.delete_event(event)
+
+    changes = []
+    for first, last, title in ranges:
+        if (first, last, title) in kept:
+            continue
+        ical_data = build_ical_event(
+            title=title, start=first, end=last, all_day=True,
+            description=build_event_description(title),
+        )
+        if not client.add_event(ical_data):
+            continue
+        new_days = [
+            first + datetime.timedelta(days=i) for i in range((last - first).days + 1)
+            if previous.get(first + datetime.timedelta(days=i)) != title
+        ]
+        if new_days:
+            change = ChangeRecord(
+                date=new_days[0], title=title, kind=ChangeKind.ALL_DAY, last_day=new_days[-1],
+            )
+            logger.info("[Dienst] %s: %s", colleague.name, change.log_text)
+            changes.append(change)
+    return changes
+
+
 def _match_laufzettel(
     shift_name: str,
     start_time: str,
@@ -403,36 +875,109 @@ def _should_delete_event(summary: str, colleague: ColleagueConfig, app_config: A
     return False
 
 
-def _count_night_shifts_from_cache(client: CalendarClient, before_date: datetime.datetime) -> int:
-    """Zählt Nachtschichten (Start >= 20:00) im aktuellen Jahr vor einem Datum."""
-    if isinstance(before_date, datetime.datetime):
-        limit = before_date.date()
-    else:
-        limit = before_date
+def _colleague_budget(
+    app_config: AppConfig, name: str, deadline: Optional[Deadline],
+) -> Deadline:
+    """Zeitbudget eines Kollegen, höchstens bis zur Deadline des Laufs."""
+    seconds = app_config.colleague_budget
+    remaining = deadline.remaining() if deadline else None
+    if remaining is not None:
+        # Deadline(0) wäre unbegrenzt; abgelaufen heißt hier "sofort fertig"
+        seconds = max(min(seconds or remaining, remaining), 1e-3)
+    return Deadline(seconds, label=name)
 
-    count = 0
-    for event in client.all_events:
+
+def _cache_window(
+    xlsx_files: List[str], horizon: Optional[Horizon],
+) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Zeitraum für den Kalender-Cache.
+
+    Mit Verarbeitungsfenster: das Fenster, erweitert auf ganze Wochen der
+    ausgewählten Dateien. Ohne: aktuelles Jahr bis +90 Tage.
+    """
+    if horizon is None:
+        start = datetime.datetime(datetime.date.today().year, 1, 1, 0, 0)
+        return start, datetime.datetime.now() + datetime.timedelta(days=90)
+
+    first, last = horizon.since, horizon.until
+    for file_path in xlsx_files:
+        week_start = extract_date_from_filename(os.path.basename(file_path))
+        if week_start:
+            first = min(first, week_start.date())
+            last = max(last, week_start.date() + datetime.timedelta(days=6))
+    return (
+        datetime.datetime.combine(first, datetime.time.min),
+        datetime.datetime.combine(last + datetime.timedelta(days=1), datetime.time.min),
+    )
+
+
+class NightShiftCounter:
+    """Zählt Nachtschichten (Beginn ab 20:00) eines Jahres vor einem Datum.
+
+    Der Cache deckt nur das Verarbeitungsfenster ab. Nachtschichten zwischen
+    dem 1. Januar und dem Cache-Beginn werden beim ersten Bedarf einmal per
+    Suche nachgeladen, damit die Nummerierung "(n)" stimmt.
+    """
+
+    def __init__(self, client: CalendarClient, cache_start: datetime.date):
+        self.client = client
+        self.cache_start = cache_start
+        self._baseline: Dict[int, int] = {}
+
+    def before(self, limit: datetime.date, exclude: Optional[Set[datetime.date]] = None) -> int:
+        """Nachtschichten im Jahr von ``limit`` vor diesem Tag.
+
+        Args:
+            exclude: Tage, deren Termine im Cache nicht zählen (weil sie
+                gerade neu geschrieben werden)
+        """
+        exclude = exclude or set()
+        cached = sum(
+            1 for start in _night_starts(self.client.all_events)
+            if start.year == limit.year and start.date() < limit and start.date() not in exclude
+        )
+        return self._baseline_for(limit.year) + cached
+
+    def in_year(self, year: int) -> int:
+        """Alle bekannten Nachtschichten des Jahres (bis zum Cache-Ende)."""
+        cached = sum(1 for start in _night_starts(self.client.all_events) if start.year == year)
+        return self._baseline_for(year) + cached
+
+    def _baseline_for(self, year: int) -> int:
+        year_start = datetime.date(year, 1, 1)
+        if self.cache_start <= year_start:
+            return 0
+        if year not in self._baseline:
+            end = min(self.cache_start, datetime.date(year + 1, 1, 1))
+            try:
+                events = self.client.search_events(
+                    datetime.datetime.combine(year_start, datetime.time.min),
+                    datetime.datetime.combine(end, datetime.time.min),
+                )
+            except Exception as e:
+                logger.warning("Nachtschichten vor dem %s nicht ladbar: %s",
+                               end.strftime("%d.%m.%Y"), e)
+                events = []
+            self._baseline[year] = sum(
+                1 for start in _night_starts(events) if start.date() < end
+            )
+        return self._baseline[year]
+
+
+def _night_starts(events) -> Iterator[datetime.datetime]:
+    """Beginn aller zeitgebundenen Termine ab 20:00."""
+    for event in events:
         try:
             start = event.vobject_instance.vevent.dtstart.value
-            if isinstance(start, datetime.datetime):
-                if start.date().year == limit.year and start.date() < limit:
-                    if start.time() >= datetime.time(20, 0):
-                        count += 1
         except Exception:
             continue
-    return count
+        if isinstance(start, datetime.datetime) and start.time() >= datetime.time(20, 0):
+            yield start
 
 
-def _get_night_shift_summary(client: CalendarClient, year: int) -> Optional[str]:
+def _get_night_shift_summary(night_shifts: NightShiftCounter, year: int) -> Optional[str]:
     """Erstellt die Nachtschicht-Statistik für E-Mails (nur ab November)."""
     today = datetime.date.today()
     if today.month < 11:
         return None
-
-    today_dt = datetime.datetime.combine(today, datetime.time.min)
-    year_end = datetime.datetime(year, 12, 31, 23, 59)
-
-    count_current = _count_night_shifts_from_cache(client, today_dt)
-    count_year = _count_night_shifts_from_cache(client, year_end)
-
-    return build_night_shift_summary(count_current, count_year, year)
+    return build_night_shift_summary(night_shifts.before(today), night_shifts.in_year(year), year)
@@ -0,0 +1,178 @@
+"""MailQueue gegen einen lokalen SMTP-Stellvertreter (Thread mit Socket-Server)."""
+
+import json
+import socketserver
+import threading
+
+import pytest
+
+import notifier
+from config import AppConfig
+from notifier import MailQueue, OutgoingMail
+from utils import load_json_state
+
+
+class _SMTPStub(socketserver.ThreadingTCPServer):
+    """Minimaler SMTP-Server: EHLO mit AUTH PLAIN, MAIL/RCPT/DATA, QUIT.
+
+    ``fail_next`` MAIL-Befehle werden mit 451 abgelehnt (vorübergehender Fehler).
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, fail_next: int = 0):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.fail_next = fail_next
+        self.messages = []   # (Empfänger, Nachricht)
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        recipients = []
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-stub")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "AUTH":
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                with server.lock:
+                    failing = server.fail_next > 0
+                    if failing:
+                        server.fail_next -= 1
+                self.reply("451 4.3.0 try again later" if failing else "250 OK")
+                recipients = []
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data.append(chunk)
+                with server.lock:
+                    for rcpt in recipients:
+                        server.messages.append((rcpt, b"".join(data).decode("utf-8", "replace")))
+                self.reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+@pytest.fixture
+def smtp_stub():
+    servers = []
+
+    def start(fail_next: int = 0) -> _SMTPStub:
+        server = _SMTPStub(fail_next)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(notifier, "_BACKOFF_BASE_SECONDS", 0.0)
+
+
+def _config(tmp_path, port: int, starttls="false") -> AppConfig:
+    (tmp_path / "config.json").write_text(json.dumps({
+        "notifymail": "dienstplan@example.org",
+        "mailpassword": "geheim",
+        "smtp_host": "127.0.0.1",
+        "smtp_port": port,
+        "smtp_starttls": starttls,
+    }), encoding="utf-8")
+    return AppConfig(str(tmp_path))
+
+
+def _mail(name: str = "Meier, M.") -> OutgoingMail:
+    return OutgoingMail(
+        user_name=name, to_email="meier@example.org",
+        subject=f"Dienstplan Update {name}", html_body="Frühdienst", entry_count=1,
+    )
+
+
+def _outbox(tmp_path) -> list:
+    return load_json_state(str(tmp_path / notifier.OUTBOX_FILENAME)).get("mails", [])
+
+
+def test_delivers_over_one_connection(tmp_path, smtp_stub):
+    server = smtp_stub()
+    with MailQueue(_config(tmp_path, server.port)) as mails:
+        mails.put(_mail("Meier, M."))
+        mails.put(_mail("Muster, E."))
+
+    assert mails.sent == 2
+    assert [rcpt for rcpt, _ in server.messages] == ["meier@example.org"] * 2
+    assert "Subject: Dienstplan Update Muster, E." in server.messages[1][1]
+    assert _outbox(tmp_path) == []
+
+
+def test_retries_transient_failures(tmp_path, smtp_stub):
+    server = smtp_stub(fail_next=notifier._MAX_ATTEMPTS - 1)
+    with MailQueue(_config(tmp_path, server.port)) as mails:
+        mails.put(_mail())
+
+    assert mails.sent == 1
+    assert len(server.messages) == 1
+    assert _outbox(tmp_path) == []
+
+
+def test_failed_mail_goes_to_outbox_and_is_resent(tmp_path, smtp_stub):
+    server = smtp_stub(fail_next=notifier._MAX_ATTEMPTS)
+    app_config = _config(tmp_path, server.port)
+    with MailQueue(app_config) as mails:
+        mails.put(_mail())
+
+    assert mails.sent == 0
+    assert [m["user_name"] for m in _outbox(tmp_path)] == ["Meier, M."]
+
+    # Nächster Lauf: der Postausgang wird erneut eingereiht und zugestellt
+    with MailQueue(app_config) as mails:
+        pass
+    assert mails.sent == 1
+    assert len(server.messages) == 1
+    assert _outbox(tmp_path) == []
+
+
+def test_outbox_is_written_before_close(tmp_path):
+    # Ohne Sende-Thread: die Mail muss sofort im Postausgang stehen
+    mails = MailQueue(_config(tmp_path, 1))
+    mails.put(_mail())
+    assert [m["user_name"] for m in _outbox(tmp_path)] == ["Meier, M."]
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (True, True), (False, False), ("true", True), ("false", False),
+    ("0", False), ("1", True), ("nein", False), (0, False),
+])
+def test_smtp_starttls_parsing(tmp_path, raw, expected):
+    assert _config(tmp_path, 25, starttls=raw).smtp_starttls is expected
@@ -0,0 +1,194 @@
+"""Lokale HTTP-Schnittstelle zum gezielten Auslösen von Synchronisationen.
+
+Läuft im Daemon-Prozess (``main.py --daemon --api``) und nutzt dessen warmen
+``SyncService``. Lauscht ausschließlich auf 127.0.0.1.
+
+Endpunkte:
+    GET  /health   Lebenszeichen, Laufzeit, ob gerade synchronisiert wird
+    GET  /stats    Kennzahlen des letzten Laufs
+    POST /sync     {"colleague": "Meier, M.", "from": "2025-06-02", "to": "2025-06-08"}
+                   Beide Angaben optional (ohne: gestern bis Standard-Horizont,
+                   auch vergangene Wochen möglich); liefert die eingetragenen
+                   Termine als JSON.
+
+Beispiel:
+    curl -X POST localhost:8765/sync -d '{"colleague": "Meier, M."}'
+"""
+
+import datetime
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from event_builder import ChangeRecord
+from excel_parser import Horizon, get_sorted_excel_files
+from service import SyncService
+from shift_processor import RunReport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+_LOCALHOST = "127.0.0.1"
+_MAX_RANGE_DAYS = 366
+
+
+class TriggerAPI:
+    """HTTP-Server in einem Hintergrund-Thread.
+
+    Verwendung:
+        api = TriggerAPI(service, port=8765)
+        api.start()
+        ...
+        api.stop()
+    """
+
+    def __init__(self, service: SyncService, port: int = DEFAULT_PORT):
+        self.service = service
+        self.port = port
+        self.started_at = time.monotonic()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        handler = type("BoundHandler", (_Handler,), {"api": self})
+        self._server = ThreadingHTTPServer((_LOCALHOST, self.port), handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="TriggerAPI", daemon=True,
+        )
+        self._thread.start()
+        logger.info("Trigger-API lauscht auf http://%s:%d", _LOCALHOST, self.port)
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+    # --- Endpunkte ---
+
+    def health(self) -> Tuple[int, dict]:
+        return 200, {
+            "status": "ok",
+            "uptime_seconds": round(time.monotonic() - self.started_at),
+            "busy": self.service.busy,
+        }
+
+    def stats(self) -> Tuple[int, dict]:
+        service = self.service
+        report = service.last_report
+        return 200, {
+            "last_run_at": service.last_run_at.isoformat(timespec="seconds")
+            if service.last_run_at else None,
+            "last_duration_seconds": round(service.last_duration, 2),
+            "last_report": _report_json(report, with_changes=False) if report else None,
+        }
+
+    def sync(self, body: dict) -> Tuple[int, dict]:
+        service = self.service
+        colleagues = None
+        name = body.get("colleague")
+        if name:
+            colleagues = [c for c in service.app_config.colleagues if c.name == name]
+            if not colleagues:
+                return 404, {"error": f"Unbekannter Kollege: {name}"}
+            if service.shard and not service.shard.owns(name):
+                return 404, {"error": f"{name} gehört nicht zu Shard {service.shard.label}."}
+
+        horizon = None
+        if body.get("from") or body.get("to"):
+            try:
+                first = datetime.date.fromisoformat(body.get("from") or body["to"])
+                last = datetime.date.fromisoformat(body.get("to") or body["from"])
+            except ValueError as e:
+                return 400, {"error": f"Ungültiges Datum: {e}"}
+            if last < first or (last - first).days > _MAX_RANGE_DAYS:
+                return 400, {"error": "Ungültiger Zeitraum."}
+            horizon = Horizon(first, last)
+            if not get_sorted_excel_files(service.plans_folder, horizon):
+                return 404, {"error": "Keine Dienstpläne für diesen Zeitraum."}
+
+        started = time.monotonic()
+        service.refresh()
+        if colleagues is None:
+            # Explizite Liste: API-Läufe laufen am Laufjournal vorbei
+            colleagues = service.app_config.colleagues
+            if service.shard:
+                colleagues = service.shard.select(colleagues)
+        report = service.sync(colleagues=colleagues, horizon=horizon)
+        result = _report_json(report, with_changes=True)
+        result["duration_seconds"] = round(time.monotonic() - started, 2)
+        return 200, result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    api: TriggerAPI
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._respond(*self.api.health())
+        elif self.path == "/stats":
+            self._respond(*self.api.stats())
+        else:
+            self._respond(404, {"error": "Unbekannter Pfad."})
+
+    def do_POST(self):
+        if self.path != "/sync":
+            self._respond(404, {"error": "Unbekannter Pfad."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("JSON-Objekt erwartet")
+        except ValueError as e:
+            self._respond(400, {"error": f"Ungültige Anfrage: {e}"})
+            return
+        try:
+            self._respond(*self.api.sync(body))
+        except Exception as e:
+            logger.error("Trigger-API: Fehler bei /sync: %s", e, exc_info=True)
+            self._respond(500, {"error": str(e)})
+
+    def _respond(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        logger.debug("Trigger-API: " + fmt, *args)
+
+
+def _report_json(report: RunReport, with_changes: bool) -> dict:
+    data = report.counts()
+    if with_changes:
+        data["results"] = [
+            {
+                "colleague": r.name,
+                "connected": r.connected,
+                "timed_out": r.timed_out,
+                "deleted": r.deleted,
+                "changes": [_change_json(c) for c in r.changes],
+            }
+            for r in report.results
+        ]
+    return data
+
+
+def _change_json(change: ChangeRecord) -> dict:
+    return {
+        "date": change.date.isoformat(),
+        "last_day": change.last_day.isoformat() if change.last_day else None,
+        "start": change.start.isoformat() if change.start else None,
+        "end": change.end.isoformat() if change.end else None,
+        "title": change.title,
+        "kind": change.kind.value,
+        "text": change.log_text,
+    }
@@ -1,5 +1,6 @@
-"""Hilfsfunktionen: Logging, Timer, Datums-Parsing."""
+"""Hilfsfunktionen: Logging, Timer, Deadlines, Dateisperre, Statusdateien, Datums-Parsing."""
 
+import json
 import logging
 import os
 import sys
@@ -9,21 +10,32 @@ import re
 from logging.handlers import RotatingFileHandler
 from typing import Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows: keine prozessübergreifende Sperre verfügbar
+    fcntl = None
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
 
+LOG_FILENAME = "Dienstplanscript.log"
+
+
 def setup_logging(base_dir: str, level: int = logging.DEBUG,
-                   console_level: int = logging.INFO) -> logging.Logger:
+                   console_level: int = logging.INFO,
+                   log_filename: str = LOG_FILENAME) -> logging.Logger:
     """Richtet das Logging ein (Datei + Konsole). Gibt den Root-Logger zurück.
     
-    Die Logdatei bekommt alles (DEBUG), die Konsole nur INFO+.
+    Die Logdatei bekommt alles (DEBUG), die Konsole nur INFO+. Parallel
+    laufende Prozesse (Shards) brauchen eigene Logdateien, sonst kommen
+    sie sich beim Rotieren in die Quere.
     """
     log_dir = "/share/LOGS"
     if not os.path.isdir(log_dir):
         log_dir = base_dir
 
-    log_path = os.path.join(log_dir, "Dienstplanscript.log")
+    log_path = os.path.join(log_dir, log_filename)
 
     formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s",
                                   datefmt="%Y-%m-%d %H:%M:%S")
@@ -88,6 +100,138 @@ class Timer:
                 self._logger.info("[TIME] %s: %.2f Sek.", self.label, self.elapsed)
 
 
+# ---------------------------------------------------------------------------
+# Deadlines
+# ---------------------------------------------------------------------------
+
+class DeadlineExceeded(TimeoutError):
+    """Wird ausgelöst, wenn ein Schritt nach Ablauf der Deadline starten soll."""
+
+    def __init__(self, step: str, label: str = "Lauf"):
+        super().__init__(f"{label}: Zeitlimit bei Schritt '{step}' überschritten.")
+        self.step = step
+        self.label = label
+
+
+class Deadline:
+    """Kooperative Deadline – thread-kompatibel, ohne Signale.
+
+    Statt einen Block per SIGALRM abzubrechen, fragen die Arbeitsschritte vor
+    jedem (Netzwerk-)Aufruf ``check()`` ab. Netzwerkaufrufe selbst brauchen
+    eigene Timeouts; ``timeout()`` kappt sie auf die Restzeit.
+
+    Verwendung:
+        deadline = Deadline(600, label="GruppeVPA")
+        deadline.check("Download")
+        requests.get(url, timeout=deadline.timeout(30))
+    """
+
+    def __init__(self, seconds: Optional[float], label: str = "Lauf"):
+        self.label = label
+        self._end = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> Optional[float]:
+        """Restzeit in Sekunden (None = unbegrenzt, nie negativ)."""
+        if self._end is None:
+            return None
+        return max(0.0, self._end - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self._end is not None and time.monotonic() >= self._end
+
+    def check(self, step: str):
+        """Löst DeadlineExceeded aus, wenn die Deadline abgelaufen ist."""
+        if self.expired:
+            raise DeadlineExceeded(step, self.label)
+
+    def timeout(self, default: float) -> float:
+        """Timeout für einen Einzelaufruf: default, höchstens die Restzeit (min. 1 s)."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return max(1.0, min(default, remaining))
+
+
+# ---------------------------------------------------------------------------
+# Prozessübergreifende Sperre
+# ---------------------------------------------------------------------------
+
+class FileLock:
+    """Exklusive Dateisperre (flock) zur Koordination paralleler Prozesse.
+
+    Verwendung:
+        with FileLock("/pfad/Plaene.lock", timeout=600):
+            download_und_entpacken()
+
+    Ohne fcntl (Windows) ist die Sperre wirkungslos.
+    """
+
+    def __init__(self, path: str, timeout: float = 600.0, poll_interval: float = 0.5):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+")
+        if fcntl is None:
+            return self
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self._file.close()
+                    self._file = None
+                    raise TimeoutError(f"Sperre {self.path} nicht erhalten.")
+                if not waited:
+                    logging.getLogger(__name__).info(
+                        "Warte auf Sperre %s (anderer Prozess aktiv)...", os.path.basename(self.path)
+                    )
+                    waited = True
+                time.sleep(self.poll_interval)
+        return self
+
+    def __exit__(self, *_):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+# ---------------------------------------------------------------------------
+# JSON-Statusdateien
+# ---------------------------------------------------------------------------
+
+def load_json_state(path: str) -> dict:
+    """Lädt eine JSON-Statusdatei (leeres Dict wenn nicht vorhanden oder defekt)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.getLogger(__name__).warning("Statusdatei %s nicht lesbar: %s", path, e)
+        return {}
+
+
+def save_json_state(path: str, data: dict):
+    """Speichert eine JSON-Statusdatei atomar (erst .tmp, dann Umbenennung)."""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.getLogger(__name__).warning("Statusdatei %s nicht schreibbar: %s", path, e)
+
+
 # ---------------------------------------------------------------------------
 # Datums-Parsing
 # ---------------------------------------------------------------------------
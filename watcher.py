@@ -0,0 +1,327 @@
+"""Dateiüberwachung: verarbeitet nur, was sich im Projektordner geändert hat.
+
+Für Abläufe ohne Download (``main.py --watch``), bei denen ein anderer Job
+die Excel-Dateien in ``Plaene/MAZ_TAZ Dienstplan`` ablegt oder Laufzettel
+aktualisiert. Überwacht werden:
+
+- die Excel-Dateien im Plaene-Ordner → nur die geänderten Wochen,
+- ``Laufzettel_*.html`` → nur die Wochen, für die dieser Laufzettel gilt
+  (ab seinem Datum bis zum nächsten Laufzettel),
+- ``colleagues.json`` → nur neue oder geänderte Kollegen, dafür alle Wochen.
+
+Mit ``inotify_simple`` (Linux, optional) wird sofort auf Änderungen
+reagiert, sonst wird der Ordner periodisch verglichen. In beiden Fällen
+entscheidet ein Vergleich von Größe und Änderungszeit, was sich geändert
+hat; inotify dient nur zum Aufwecken.
+"""
+
+import datetime
+import glob
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import ColleagueConfig
+from excel_parser import get_sorted_excel_files, week_overlaps
+from service import SyncService
+from shift_processor import RunReport
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # optional, sonst periodischer Vergleich
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5.0        # Sekunden zwischen zwei Vergleichen ohne inotify
+RESCAN_INTERVAL = 15.0     # mit inotify: Sicherheitsvergleich (z.B. Unterordner)
+SETTLE_SECONDS = 2.0       # so lange muss der Stand unverändert bleiben
+SETTLE_MAX_ROUNDS = 15
+COLLEAGUES_FILENAME = "colleagues.json"
+LAUFZETTEL_PATTERN = re.compile(r"Laufzettel_(\d{8})\.html$")
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+@dataclass
+class ChangeSet:
+    """Was sich zwischen zwei Ständen geändert hat."""
+    plan_files: List[str] = field(default_factory=list)                 # neue/geänderte Wochen
+    laufzettel_dates: List[datetime.date] = field(default_factory=list)  # neu/geändert/entfernt
+    colleagues: bool = False
+
+    @property
+    def empty(self) -> bool:
+        return not (self.plan_files or self.laufzettel_dates or self.colleagues)
+
+    @property
+    def summary(self) -> str:
+        parts = []
+        if self.plan_files:
+            parts.append(f"{len(self.plan_files)} Wochen")
+        if self.laufzettel_dates:
+            parts.append("Laufzettel " + ", ".join(
+                d.strftime("%d.%m.%Y") for d in self.laufzettel_dates))
+        if self.colleagues:
+            parts.append(COLLEAGUES_FILENAME)
+        return ", ".join(parts)
+
+
+class PlanWatcher:
+    """Erkennt Änderungen an Plänen, Laufzetteln und Kollegenliste und
+    stößt gezielte Läufe über den ``SyncService`` an.
+
+    Der Stand beim Start gilt als bereits verarbeitet.
+
+    Verwendung:
+        watcher = PlanWatcher(service, vpa=True)
+        while not stop.is_set():
+            watcher.run_once()
+        watcher.close()
+    """
+
+    def __init__(self, service: SyncService, vpa: bool = False,
+                 poll_interval: float = POLL_INTERVAL):
+        self.service = service
+        self.vpa = vpa
+        self._snapshot = self._take_snapshot()
+        self._colleagues = _colleague_map(service.app_config.colleagues)
+        if INotify is not None:
+            self._backend = _InotifyBackend(service.base_dir, service.plans_folder)
+            self._timeout = RESCAN_INTERVAL
+        else:
+            self._backend = None
+            self._timeout = poll_interval
+        logger.info(
+            "Überwache %d Dateien (%s).", len(self._snapshot),
+            "inotify" if self._backend else f"Vergleich alle {poll_interval:.0f} s",
+        )
+
+    def close(self):
+        if self._backend:
+            self._backend.close()
+
+    def run_once(self, timeout: Optional[float] = None) -> List[RunReport]:
+        """Wartet auf Änderungen (höchstens ``timeout`` Sekunden) und verarbeitet sie.
+
+        Returns:
+            Die Laufberichte der ausgelösten Synchronisationen (evtl. leer).
+        """
+        timeout = self._timeout if timeout is None else timeout
+        if self._backend:
+            self._backend.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+        changes = self.check()
+        if changes.empty:
+            if self.vpa and self.service.vpa_due_today():
+                # Neuer Tag ohne Änderungen: nur der Gruppenkalender rollt weiter
+                return [self.service.sync(only_files=[], vpa=True)]
+            return []
+        logger.info("Änderung erkannt: %s", changes.summary)
+        return self.apply(changes)
+
+    def check(self) -> ChangeSet:
+        """Vergleicht den aktuellen Stand mit dem zuletzt verarbeiteten.
+
+        Wartet, bis der Stand ``SETTLE_SECONDS`` lang unverändert bleibt,
+        damit halb geschriebene Dateien nicht eingelesen werden.
+        """
+        current = self._take_snapshot()
+        if current == self._snapshot:
+            return ChangeSet()
+        for _ in range(SETTLE_MAX_ROUNDS):
+            time.sleep(SETTLE_SECONDS)
+            settled = self._take_snapshot()
+            if settled == current:
+                break
+            current = settled
+
+        changes = diff_snapshots(self._snapshot, current)
+        self._snapshot = current
+        return changes
+
+    def apply(self, changes: ChangeSet) -> List[RunReport]:
+        """Führt die gezielten Läufe für einen ChangeSet aus."""
+        service = self.service
+        service.refresh()   # Laufzettel und Kollegenliste neu laden
+
+        colleagues = service.app_config.colleagues
+        current = _colleague_map(colleagues)
+        changed_names = set()
+        if changes.colleagues:
+            changed_names = {
+                name for name, colleague in current.items()
+                if self._colleagues.get(name) != colleague
+            }
+            if changed_names:
+                logger.info("Neue/geänderte Kollegen: %s", ", ".join(sorted(changed_names)))
+        self._colleagues = current
+
+        files = set(changes.plan_files)
+        if changes.laufzettel_dates:
+            files.update(self._files_for_laufzettel(changes.laufzettel_dates))
+
+        reports = []
+        if files:
+            others = [c for c in colleagues if c.name not in changed_names]
+            only_files = [f for f in get_sorted_excel_files(service.plans_folder) if f in files]
+            reports.append(service.sync(colleagues=others, only_files=only_files, vpa=self.vpa))
+        if changed_names:
+            reports.append(service.sync(
+                colleagues=[c for c in colleagues if c.name in changed_names],
+            ))
+        return reports
+
+    def _files_for_laufzettel(self, changed: List[datetime.date]) -> List[str]:
+        """Excel-Dateien der Wochen, für die die geänderten Laufzettel gelten."""
+        available = sorted(
+            date for date in (_laufzettel_date(p) for p in self._snapshot) if date
+        )
+        spans = [laufzettel_span(day, available) for day in changed]
+        return [
+            f for f in get_sorted_excel_files(self.service.plans_folder)
+            if any(week_overlaps(f, first, until and until - datetime.timedelta(days=1))
+                   for first, until in spans)
+        ]
+
+    def _take_snapshot(self) -> Snapshot:
+        base_dir = self.service.base_dir
+        paths = get_sorted_excel_files(self.service.plans_folder)
+        paths += glob.glob(os.path.join(base_dir, "Laufzettel_*.html"))
+        paths.append(os.path.join(base_dir, COLLEAGUES_FILENAME))
+        return take_snapshot(paths)
+
+
+def take_snapshot(paths: List[str]) -> Snapshot:
+    """Größe und Änderungszeit der vorhandenen Dateien."""
+    snapshot = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        snapshot[path] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> ChangeSet:
+    """Ordnet die Unterschiede zweier Stände Plänen, Laufzetteln und Kollegenliste zu.
+
+    Entfernte Wochen werden ignoriert (es gibt nichts neu einzutragen),
+    entfernte Laufzettel zählen dagegen: ihre Tage fallen auf einen
+    anderen Laufzettel zurück.
+    """
+    changes = ChangeSet()
+    for path in sorted(old.keys() | new.keys()):
+        if old.get(path) == new.get(path):
+            continue
+        if path.endswith(".xlsx"):
+            if path in new:
+                changes.plan_files.append(path)
+        elif os.path.basename(path) == COLLEAGUES_FILENAME:
+            changes.colleagues = True
+        else:
+            day = _laufzettel_date(path)
+            if day:
+                changes.laufzettel_dates.append(day)
+    return changes
+
+
+def laufzettel_span(
+    day: datetime.date, available: List[datetime.date],
+) -> Tuple[Optional[datetime.date], Optional[datetime.date]]:
+    """Zeitraum [first, until), für den ein Laufzettel mit Datum ``day`` gilt.
+
+    Er gilt bis zum nächsten Laufzettel; der älteste gilt zusätzlich für
+    alle Tage davor (Rückfall in ``LaufzettelManager``). None = unbegrenzt.
+
+    Args:
+        day: Datum des geänderten (oder entfernten) Laufzettels
+        available: Sortierte Daten der aktuell vorhandenen Laufzettel
+    """
+    first = day if any(d < day for d in available) else None
+    until = next((d for d in available if d > day), None)
+    return first, until
+
+
+def _laufzettel_date(path: str) -> Optional[datetime.date]:
+    match = LAUFZETTEL_PATTERN.search(os.path.basename(path))
+    if not match:
+        return None
+    try:
+        return datetime.datetime.strptime(match.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _colleague_map(colleagues: List[ColleagueConfig]) -> Dict[str, ColleagueConfig]:
+    return {c.name: c for c in colleagues}
+
+
+class _InotifyBackend:
+    """Weckt den Watcher bei Dateiereignissen im Projekt- und Plaene-Ordner.
+
+    Der Downloader hängt den Plaene-Link auf einen neuen Versionsordner um;
+    dann (oder wenn ein überwachter Ordner verschwindet) werden die
+    Überwachungen der Plaene-Ordner beim nächsten Warten neu gesetzt.
+    """
+
+    _MASK = (
+        flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM
+        | flags.DELETE | flags.DELETE_SELF | flags.MOVE_SELF
+    ) if INotify is not None else 0
+
+    def __init__(self, base_dir: str, plans_folder: str):
+        self._inotify = INotify()
+        self._base_dir = base_dir
+        self._plans_root = os.path.dirname(plans_folder)
+        self._dirs = [base_dir, self._plans_root, plans_folder]
+        self._watches: Dict[int, str] = {}
+
+    def wait(self, timeout: float) -> bool:
+        """Blockiert bis zu ``timeout`` Sekunden; True bei relevantem Ereignis."""
+        self._ensure_watches()
+        for event in self._inotify.read(timeout=int(timeout * 1000)):
+            path = self._watches.get(event.wd)
+            if event.mask & (flags.IGNORED | flags.DELETE_SELF | flags.MOVE_SELF):
+                self._drop(event.wd)
+                return True
+            if path == self._base_dir and event.name == os.path.basename(self._plans_root):
+                # Plaene-Link umgehängt: neue Version überwachen
+                for wd, watched in list(self._watches.items()):
+                    if watched != self._base_dir:
+                        self._drop(wd)
+                return True
+            if path != self._base_dir or _is_watched_name(event.name):
+                return True
+        return False
+
+    def close(self):
+        self._inotify.close()
+
+    def _ensure_watches(self):
+        watched = set(self._watches.values())
+        for path in self._dirs:
+            if path in watched or not os.path.isdir(path):
+                continue
+            try:
+                self._watches[self._inotify.add_watch(path, self._MASK)] = path
+            except OSError as e:
+                logger.debug("inotify: %s nicht überwachbar: %s", path, e)
+
+    def _drop(self, wd: int):
+        if self._watches.pop(wd, None) is None:
+            return
+        try:
+            self._inotify.rm_watch(wd)
+        except OSError:
+            pass  # bereits vom Kernel entfernt
+
+
+def _is_watched_name(name: str) -> bool:
+    return name == COLLEAGUES_FILENAME or bool(LAUFZETTEL_PATTERN.search(name))